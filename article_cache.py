@@ -0,0 +1,215 @@
+import os
+import json
+import time
+import sqlite3
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from metrics import record_cache
+from shared_state import state
+
+logger = logging.getLogger(__name__)
+
+# Cache settings; set ARTICLE_CACHE_PATH to keep entries across restarts
+ARTICLE_CACHE_TTL = float(os.getenv('ARTICLE_CACHE_TTL', 24 * 3600))
+ARTICLE_CACHE_MAX_BYTES = int(os.getenv('ARTICLE_CACHE_MAX_BYTES', 5 * 1024 * 1024))
+ARTICLE_CACHE_PATH = os.getenv('ARTICLE_CACHE_PATH')
+ARTICLE_CACHE_DISK_MAX_BYTES = int(os.getenv('ARTICLE_CACHE_DISK_MAX_BYTES', 100 * 1024 * 1024))
+
+def normalize_keyword(keyword):
+    """Collapse case and whitespace so equivalent searches share an entry."""
+    return ' '.join(keyword.lower().split())
+
+class CacheEntry:
+    """A cached value with the validators needed to revalidate it."""
+    __slots__ = ('value', 'etag', 'last_modified', 'stored_at', 'size')
+
+    def __init__(self, value, etag=None, last_modified=None, stored_at=None, size=None):
+        self.value = value
+        self.etag = etag
+        self.last_modified = last_modified
+        self.stored_at = time.time() if stored_at is None else stored_at
+        self.size = len(json.dumps(value)) if size is None else size
+
+    def is_fresh(self, ttl):
+        return time.time() - self.stored_at < ttl
+
+    def can_revalidate(self):
+        return bool(self.etag or self.last_modified)
+
+    def validator_headers(self):
+        """Conditional request headers for revalidating this entry."""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+class SQLiteStore:
+    """On-disk tier: one table of JSON values, evicted by least recent access."""
+
+    def __init__(self, path, max_bytes=ARTICLE_CACHE_DISK_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, etag TEXT, last_modified TEXT,"
+            " stored_at REAL NOT NULL, accessed_at REAL NOT NULL, size INTEGER NOT NULL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS cache_accessed_at ON cache (accessed_at)")
+        self.db.commit()
+
+    def get(self, key):
+        with self.lock:
+            row = self.db.execute(
+                "SELECT value, etag, last_modified, stored_at, size FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self.db.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            self.db.commit()
+        value, etag, last_modified, stored_at, size = row
+        return CacheEntry(json.loads(value), etag, last_modified, stored_at, size)
+
+    def set(self, key, entry):
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, json.dumps(entry.value), entry.etag, entry.last_modified,
+                 entry.stored_at, time.time(), entry.size),
+            )
+            self._evict()
+            self.db.commit()
+
+    def _evict(self):
+        total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return 0
+        evicted = 0
+        for key, size in self.db.execute("SELECT key, size FROM cache ORDER BY accessed_at").fetchall():
+            if total <= self.max_bytes:
+                break
+            self.db.execute("DELETE FROM cache WHERE key = ?", (key,))
+            total -= size
+            evicted += 1
+        return evicted
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+class ArticleCache:
+    """Two-tier cache: an in-memory LRU bounded by size, backed by an optional SQLite store.
+
+    With a shared state backend, entries are also published there so other
+    processes can use them; it is checked between memory and disk.
+    Entries past their TTL are still returned when they carry an ETag or
+    Last-Modified, so callers can revalidate them instead of refetching;
+    check entry.is_fresh().
+    """
+
+    def __init__(self, name, ttl=ARTICLE_CACHE_TTL, max_bytes=ARTICLE_CACHE_MAX_BYTES,
+                 path=ARTICLE_CACHE_PATH, disk_max_bytes=ARTICLE_CACHE_DISK_MAX_BYTES):
+        self.name = name
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.disk = SQLiteStore(path, disk_max_bytes) if path else None
+
+        # Counters exposed through stats()
+        self.memory_hits = 0
+        self.shared_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.evictions = 0
+
+    def _remember(self, key, entry):
+        if key in self.entries:
+            self.size -= self.entries.pop(key).size
+        self.entries[key] = entry
+        self.size += entry.size
+        while self.size > self.max_bytes and len(self.entries) > 1:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= evicted.size
+            self.evictions += 1
+
+    def _usable(self, entry):
+        return entry.is_fresh(self.ttl) or entry.can_revalidate()
+
+    async def get(self, key):
+        """Return the entry for key if it is fresh or can be revalidated, else None."""
+        entry = self.entries.get(key)
+        if entry is not None and self._usable(entry):
+            self.entries.move_to_end(key)
+            self.memory_hits += 1
+            record_cache(self.name, 'memory_hit')
+            return entry
+        if entry is None and state.shared:
+            data = await state.get_json(self._shared_key(key))
+            entry = CacheEntry(**data) if data is not None else None
+            if entry is not None and self._usable(entry):
+                self._remember(key, entry)
+                self.shared_hits += 1
+                record_cache(self.name, 'shared_hit')
+                return entry
+            entry = None
+        if entry is None and self.disk is not None:
+            entry = await asyncio.to_thread(self.disk.get, key)
+            if entry is not None and self._usable(entry):
+                self._remember(key, entry)
+                self.disk_hits += 1
+                record_cache(self.name, 'disk_hit')
+                return entry
+        self.misses += 1
+        record_cache(self.name, 'miss')
+        return None
+
+    def _shared_key(self, key):
+        return f"article:{self.name}:{key}"
+
+    async def _publish(self, key, entry):
+        if state.shared:
+            # Entries with validators stay useful past their TTL, so keep them around longer
+            ttl = self.ttl * 7 if entry.can_revalidate() else self.ttl
+            data = {name: getattr(entry, name) for name in CacheEntry.__slots__}
+            await state.set_json(self._shared_key(key), data, ttl=ttl)
+
+    async def set(self, key, value, etag=None, last_modified=None):
+        entry = CacheEntry(value, etag, last_modified)
+        self._remember(key, entry)
+        await self._publish(key, entry)
+        if self.disk is not None:
+            await asyncio.to_thread(self.disk.set, key, entry)
+
+    async def revalidated(self, key, entry):
+        """Mark a stale entry fresh again after the server answered 304 Not Modified."""
+        self.revalidations += 1
+        entry.stored_at = time.time()
+        self._remember(key, entry)
+        await self._publish(key, entry)
+        if self.disk is not None:
+            await asyncio.to_thread(self.disk.set, key, entry)
+
+    def close(self):
+        if self.disk is not None:
+            self.disk.close()
+
+    def stats(self):
+        lookups = self.memory_hits + self.shared_hits + self.disk_hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'bytes': self.size,
+            'memory_hits': self.memory_hits,
+            'shared_hits': self.shared_hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_rate': (self.memory_hits + self.shared_hits + self.disk_hits) / lookups if lookups else 0.0,
+            'revalidations': self.revalidations,
+            'evictions': self.evictions,
+        }
@@ -0,0 +1,73 @@
+import os
+import re
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Items asked for in one completion when pre-generating pool content; 1 keeps one request per item
+LLM_BATCH_SIZE = max(1, min(8, int(os.getenv('LLM_BATCH_SIZE', 1))))
+
+# Line the model puts before item n of a batch
+ITEM_MARKER = re.compile(r'^\s*=== ITEM (\d+) ===\s*$', re.MULTILINE)
+
+def batch_instructions(count):
+    """Tell the model how to lay out a batch so split_items can take it apart."""
+    return (
+        f"Return exactly {count} items. Start item n with a line containing only "
+        f"\"=== ITEM n ===\" (from 1 to {count}) and write nothing before the first marker."
+    )
+
+def split_items(text, count):
+    """Cut a batched completion into `count` items by their markers; missing or repeated numbers give None."""
+    items = [None] * count
+    markers = list(ITEM_MARKER.finditer(text))
+    for i, marker in enumerate(markers):
+        index = int(marker.group(1)) - 1
+        end = markers[i + 1].start() if i + 1 < len(markers) else len(text)
+        if 0 <= index < count and items[index] is None:
+            items[index] = text[marker.end():end].strip() or None
+    return items
+
+class BatchGenerator:
+    """Generate several items with one completion, regenerating the ones that come back broken.
+
+    request(count) returns the batched completion text, validate(item)
+    says whether one parsed item is usable, and regenerate(index) produces
+    a replacement for item `index` on its own, so a partly malformed batch
+    still yields every item. An item whose regeneration fails too is None.
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+        # Counters exposed through stats()
+        self.batches = 0
+        self.items = 0
+        self.invalid = 0
+        self.failed_items = 0
+
+    async def generate(self, count, request, validate, regenerate):
+        # A failed request is raised, not retried item by item, so an outage does not multiply calls
+        items = split_items(await request(count), count)
+        self.batches += 1
+
+        broken = [index for index, item in enumerate(items) if item is None or not validate(item)]
+        self.invalid += len(broken)
+        replacements = await asyncio.gather(*(regenerate(index) for index in broken), return_exceptions=True)
+        for index, replacement in zip(broken, replacements):
+            if isinstance(replacement, Exception):
+                self.failed_items += 1
+                logger.error(f"Regenerating {self.name} item {index + 1} failed: {str(replacement)}")
+                replacement = None
+            items[index] = replacement
+        self.items += count
+        return items
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'items': self.items,
+            'invalid': self.invalid,
+            'failed_items': self.failed_items,
+        }
@@ -0,0 +1,106 @@
+"""LLM calls and tokens per delivered message, one item per completion versus batches.
+
+Generates --messages business ideas and article summaries against the fake
+completion server, first one completion per item and then K items per
+completion for each --sizes value. A share of the batched items can come
+back malformed (--malformed-rate) to include the cost of regenerating them:
+
+    python benchmarks/batch_generation.py --sizes 2,4,8 --malformed-rate 0.05
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_openai import FakeOpenAI  # noqa: E402
+from fake_wikipedia import article_extract  # noqa: E402
+
+
+def make_articles(count, run):
+    # Fresh titles per run, so no summary comes from the cache
+    return [{'title': f"Run {run} Article {i}", 'url': '', 'content': article_extract(f"Run {run} Article {i}")}
+            for i in range(count)]
+
+
+async def measure(fake, produce):
+    before = fake.stats()
+    started = time.perf_counter()
+    delivered = await produce()
+    elapsed = time.perf_counter() - started
+    after = fake.stats()
+    return {
+        'delivered': delivered,
+        'calls': (after['calls'] - before['calls']) / delivered,
+        'prompt_tokens': (after['prompt_tokens'] - before['prompt_tokens']) / delivered,
+        'completion_tokens': (after['completion_tokens'] - before['completion_tokens']) / delivered,
+        'seconds': elapsed,
+    }
+
+
+async def run(args):
+    fake = FakeOpenAI(args.latency, malformed_rate=args.malformed_rate)
+    runner = await fake.start(args.port)
+    os.environ['OPENAI_API_KEY'] = 'fake'
+    os.environ['OPENAI_BASE_URL'] = f"http://127.0.0.1:{args.port}/v1"
+
+    import business_ideas_bot
+    import wiki_facts_bot
+    from llm_client import llm
+    await llm.start()
+
+    async def ideas(size):
+        delivered = 0
+        for _ in range(0, args.messages, size):
+            if size == 1:
+                await business_ideas_bot.generate_business_idea()
+                delivered += 1
+            else:
+                ideas = await business_ideas_bot.generate_business_ideas(size)
+                delivered += sum(idea is not None for idea in ideas)
+        return delivered
+
+    async def facts(size, run):
+        articles = make_articles(args.messages, run)
+        delivered = 0
+        for start in range(0, args.messages, size):
+            if size == 1:
+                await wiki_facts_bot.generate_summary_and_insights(articles[start])
+                delivered += 1
+            else:
+                summaries = await wiki_facts_bot.generate_summaries(articles[start:start + size])
+                delivered += sum(summary is not None for summary in summaries)
+        return delivered
+
+    sizes = [1] + [int(size) for size in args.sizes.split(',')]
+    print(f"{args.messages} messages per row, fake latency {args.latency}s, malformed rate {args.malformed_rate}")
+    print(f"{'kind':<8}{'K':>3}{'calls/msg':>11}{'prompt tok/msg':>16}{'completion tok/msg':>20}{'total tok/msg':>15}{'seconds':>9}")
+    for kind in ('ideas', 'facts'):
+        for run_index, size in enumerate(sizes):
+            if kind == 'ideas':
+                result = await measure(fake, lambda: ideas(size))
+            else:
+                result = await measure(fake, lambda: facts(size, run_index))
+            total = result['prompt_tokens'] + result['completion_tokens']
+            print(f"{kind:<8}{size:>3}{result['calls']:>11.2f}{result['prompt_tokens']:>16.1f}"
+                  f"{result['completion_tokens']:>20.1f}{total:>15.1f}{result['seconds']:>9.2f}")
+    print(f"regenerated items: ideas {business_ideas_bot.idea_batches.invalid}, "
+          f"facts {wiki_facts_bot.summary_batches.invalid}")
+
+    await llm.close()
+    await runner.cleanup()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=48)
+    parser.add_argument('--sizes', default='2,4,8')
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--malformed-rate', type=float, default=0.0)
+    parser.add_argument('--port', type=int, default=8498)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(run(args))
@@ -0,0 +1,83 @@
+"""Cold-start benchmark: time from a fresh interpreter to every bot accepting updates.
+
+Runs main.py's startup in a child process against a local Bot API stand-in
+whose calls take --api-latency seconds, like a round trip to Telegram from
+a freshly woken Render instance. Reports the time spent importing main and
+the time to initialize every bot and set its webhook, with the bots
+started concurrently (the default) or one at a time (--sequential):
+
+    python benchmarks/cold_start.py
+    python benchmarks/cold_start.py --sequential
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from webhook_load import start_fake_bot_api  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = '''
+import time, json, asyncio, sys
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+
+async def startup():
+    specs = main.load_specs()
+    begin = time.perf_counter()
+    if SEQUENTIAL:
+        for spec in specs:
+            await main.start_bot(spec, 'https://example.invalid')
+    else:
+        await main.start_bots(specs, 'https://example.invalid')
+    ready = time.perf_counter()
+    await main.stop_bots(remove_webhooks=False)
+    return begin, ready
+
+begin, ready = asyncio.run(startup())
+print(json.dumps({'import': imported - started, 'startup': ready - begin, 'bots': len(main.started_bots)}))
+'''
+
+
+def run_child(args, bot_api_port):
+    env = dict(
+        os.environ,
+        TELEGRAM_API_BASE_URL=f"http://127.0.0.1:{bot_api_port}",
+        WIKI_FACTS_TELE_TOKEN='1:wiki',
+        BUSINESS_IDEAS_TELE_TOKEN='2:ideas',
+        OPENAI_API_KEY='unused',
+        CONTENT_POOL_ENABLED='false',
+    )
+    code = CHILD.replace('SEQUENTIAL', str(args.sequential))
+    output = subprocess.run(
+        [sys.executable, '-c', code], cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+async def run(args):
+    bot_api = await start_fake_bot_api(args.port, latency=args.api_latency)
+    results = [await asyncio.to_thread(run_child, args, args.port) for _ in range(args.runs)]
+    await bot_api.cleanup()
+
+    mode = 'sequential' if args.sequential else 'concurrent'
+    best = lambda key: min(result[key] for result in results)
+    print(f"mode={mode} bots={results[0]['bots']} api_latency={args.api_latency}s runs={args.runs}")
+    print(f"  import main: {best('import') * 1000:.0f} ms (best)")
+    print(f"  start bots: {best('startup') * 1000:.0f} ms (best)")
+    print(f"  total: {min(r['import'] + r['startup'] for r in results) * 1000:.0f} ms (best)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sequential', action='store_true')
+    parser.add_argument('--api-latency', type=float, default=0.15)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--port', type=int, default=8095)
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,107 @@
+"""Compare lead-section extraction strategies over a corpus of saved article HTML.
+
+For every page, measures bytes read, parse time and peak memory for the
+original full BeautifulSoup parse and for the incremental parser that stops
+after the lead paragraphs. Save pages with e.g.
+`curl -L https://en.wikipedia.org/wiki/Python_(programming_language) > corpus/python.html`
+and run:
+
+    python benchmarks/extract_pipeline.py --corpus corpus/
+
+Without --corpus a synthetic corpus of article-sized pages is used. The
+extracts API path is not measured here since it needs the network; its
+response is typically a few KB of JSON.
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+import tracemalloc
+
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from wiki_extract import LeadParagraphParser  # noqa: E402
+
+CHUNK_SIZE = 16 * 1024
+
+
+def synthetic_corpus(pages=20, paragraphs=200):
+    for n in range(pages):
+        body = ''.join(
+            f"<p>Paragraph {i} of article {n} with a <a href=\"/wiki/Link\">link</a>"
+            f"<sup>[{i}]</sup>. " + "Lorem ipsum dolor sit amet, consectetur adipiscing. " * 15 + "</p>"
+            f"<table class=\"infobox\"><tr><td>cell {i}</td></tr></table>"
+            for i in range(paragraphs)
+        )
+        yield f"synthetic-{n}", (
+            f"<html><head><title>Article {n}</title></head><body>"
+            f"<h1 id=\"firstHeading\"><span>Article {n}</span></h1>"
+            f"<div class=\"mw-content-ltr mw-parser-output\">{body}</div></body></html>"
+        )
+
+
+def load_corpus(path):
+    for filename in sorted(glob.glob(os.path.join(path, '*.html'))):
+        with open(filename, encoding='utf-8') as f:
+            yield os.path.basename(filename), f.read()
+
+
+def full_parse(html):
+    soup = BeautifulSoup(html, 'html.parser')
+    paragraphs = soup.find('div', {'class': 'mw-parser-output'}).find_all('p')
+    return len(html.encode()), ' '.join([p.text for p in paragraphs if p.text.strip()][:3])
+
+
+def incremental_parse(html):
+    parser = LeadParagraphParser()
+    consumed = 0
+    for start in range(0, len(html), CHUNK_SIZE):
+        chunk = html[start:start + CHUNK_SIZE]
+        consumed += len(chunk.encode())
+        parser.feed(chunk)
+        if parser.done:
+            break
+    return consumed, parser.content()
+
+
+def measure(parse, html):
+    tracemalloc.start()
+    started = time.perf_counter()
+    bytes_read, content = parse(html)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return bytes_read, elapsed, peak, content
+
+
+def main(args):
+    pages = list(load_corpus(args.corpus) if args.corpus else synthetic_corpus())
+    if not pages:
+        sys.exit(f"No .html files in {args.corpus}")
+
+    totals = {'full': [0, 0.0, 0], 'incremental': [0, 0.0, 0]}
+    mismatches = 0
+    for name, html in pages:
+        full = measure(full_parse, html)
+        incremental = measure(incremental_parse, html)
+        if full[3] != incremental[3]:
+            mismatches += 1
+            print(f"  content differs for {name}")
+        for label, result in (('full', full), ('incremental', incremental)):
+            totals[label][0] += result[0]
+            totals[label][1] += result[1]
+            totals[label][2] = max(totals[label][2], result[2])
+
+    print(f"pages={len(pages)} content mismatches={mismatches}")
+    for label, (bytes_read, elapsed, peak) in totals.items():
+        print(f"  {label:<12} bytes read {bytes_read / len(pages) / 1024:8.1f} KB/page, "
+              f"parse {elapsed / len(pages) * 1000:7.2f} ms/page, peak memory {peak / 1024 / 1024:6.2f} MB")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--corpus', help='directory of saved article .html files')
+    main(parser.parse_args())
@@ -0,0 +1,135 @@
+"""How one spamming user affects everyone else's LLM-backed commands.
+
+One user fires a burst of /analyze from several group chats while normal
+users each send a few, spread over the run. Every update goes through the
+bot's UpdateQueue and its workers, as webhooks do. The handler holds its
+turn for a fixed time, standing in for the OpenAI call. Compare a FIFO
+queue and semaphore with round-robin lanes and the fair scheduler, without
+and with the rate limits:
+
+    python benchmarks/fairness_load.py --mode fifo
+    python benchmarks/fairness_load.py --mode fair
+    python benchmarks/fairness_load.py --mode limits
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+from telegram import Update
+from telegram.ext import Application, CommandHandler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fair_scheduler import FairScheduler, FAIR_CONCURRENCY  # noqa: E402
+from update_queue import UpdateQueue, UPDATE_QUEUE_WORKERS  # noqa: E402
+from rate_buckets import RateBuckets  # noqa: E402
+from fake_bot_api import FakeBotAPI  # noqa: E402
+from webhook_load import TOKEN, percentile  # noqa: E402
+
+SPAMMER = 1
+
+
+def make_command(update_id, user_id, chat_id):
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private' if chat_id == user_id else 'group'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'Load'},
+            'text': '/analyze a bakery',
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': 8}],
+        },
+    }
+
+
+async def run(args):
+    api = FakeBotAPI()
+    await api.start(args.port)
+    upstream_calls = {'spammer': 0, 'others': 0}
+
+    async def analyze(update, context):
+        upstream_calls['spammer' if update.effective_user.id == SPAMMER else 'others'] += 1
+        await asyncio.sleep(args.llm_latency)
+
+    if args.mode == 'fifo':
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def handler(update, context):
+            async with semaphore:
+                await analyze(update, context)
+        scheduler = None
+    else:
+        unlimited = 1e9
+        scheduler = FairScheduler(
+            concurrency=args.concurrency,
+            weights={},
+            user_buckets=None if args.mode == 'limits' else RateBuckets(unlimited, unlimited),
+            chat_buckets=None if args.mode == 'limits' else RateBuckets(unlimited, unlimited),
+        )
+        handler = scheduler.wrap(analyze)
+
+    latencies = []
+    queued_at = {}
+
+    async def timed(update, context):
+        await handler(update, context)
+        if update.effective_user.id != SPAMMER:
+            latencies.append(time.perf_counter() - queued_at[update.update_id])
+
+    application = Application.builder().token(TOKEN).base_url(f"http://127.0.0.1:{args.port}/bot").build()
+    application.add_handler(CommandHandler('analyze', timed))
+    await application.initialize()
+    queue = UpdateQueue(application, 'fairness', maxsize=args.queue_size, workers=args.workers,
+                        dedup_dir=None, fair=args.mode != 'fifo')
+    queue.start()
+
+    async def send(update_id, user_id, chat_id, delay):
+        await asyncio.sleep(delay)
+        queued_at[update_id] = time.perf_counter()
+        queue.put(Update.de_json(make_command(update_id, user_id, chat_id), application.bot))
+
+    random.seed(1)
+    sends = [
+        send(i, SPAMMER, -100 - i % args.spam_chats, 0)
+        for i in range(args.spam)
+    ]
+    for user in range(args.users):
+        for n in range(args.per_user):
+            sends.append(send(10000 + user * 100 + n, 1000 + user, 1000 + user, random.uniform(0, args.duration)))
+    started = time.perf_counter()
+    await asyncio.gather(*sends)
+    await queue.stop(timeout=600)
+    total = time.perf_counter() - started
+
+    print(f"mode={args.mode} workers={args.workers} concurrency={args.concurrency} spam={args.spam} "
+          f"users={args.users}x{args.per_user} llm_latency={args.llm_latency}s")
+    print(f"  other users' latency p50: {percentile(latencies, 50) * 1000:.0f} ms, "
+          f"p99: {percentile(latencies, 99) * 1000:.0f} ms")
+    print(f"  upstream calls: spammer {upstream_calls['spammer']}, others {upstream_calls['others']}; "
+          f"total time {total:.1f}s, dropped {queue.dropped}")
+    if scheduler is not None:
+        print(f"  scheduler: {scheduler.stats()}")
+        print(f"  limit notices sent: {api.stats()['calls'].get('sendMessage', 0)}")
+
+    await application.shutdown()
+    await api.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--mode', choices=['fifo', 'fair', 'limits'], default='fair')
+    parser.add_argument('--workers', type=int, default=UPDATE_QUEUE_WORKERS)
+    parser.add_argument('--queue-size', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=FAIR_CONCURRENCY)
+    parser.add_argument('--spam', type=int, default=200)
+    parser.add_argument('--spam-chats', type=int, default=20)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--per-user', type=int, default=2)
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--llm-latency', type=float, default=0.2)
+    parser.add_argument('--port', type=int, default=8390)
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,321 @@
+"""Local stand-in for the Telegram Bot API.
+
+Serves the methods the bots use (getMe, setWebhook, deleteWebhook,
+getWebhookInfo, getUpdates, sendMessage, editMessageText, sendChatAction)
+with optional latency, jitter and 5xx errors, so both ingress modes can
+run offline. With flood_limits it also answers like Telegram when a bot
+sends too much: 429 with retry_after past 30 messages a second per bot or
+about one a second per chat, and 400 for texts over 4096 characters or
+legacy Markdown that does not parse. Updates
+pushed with push() are delivered the way Telegram does it: POSTed to the
+webhook with bounded concurrency and retried until acknowledged, or handed
+out by getUpdates long-polls until confirmed by a later offset.
+
+Point the bots at it with TELEGRAM_API_BASE_URL=http://127.0.0.1:8097, or
+run it standalone:
+
+    python benchmarks/fake_bot_api.py --latency 0.05
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import re
+import time
+from collections import Counter, deque
+
+import aiohttp
+from aiohttp import web
+
+
+LINK = re.compile(r'\[[^\]]*\]\([^)]*\)')
+
+
+def markdown_error(text):
+    """Offset where Telegram's legacy Markdown parser would give up on text, or None if it parses."""
+    i = 0
+    while i < len(text):
+        char = text[i]
+        if char == '\\' and i + 1 < len(text) and text[i + 1] in '_*`[':
+            i += 2
+        elif text.startswith('```', i):
+            end = text.find('```', i + 3)
+            if end < 0:
+                return i
+            i = end + 3
+        elif char in '*_`':
+            end = text.find(char, i + 1)
+            if end < 0:
+                return i
+            i = end + 1
+        elif char == '[':
+            link = LINK.match(text, i)
+            if link is None:
+                return i
+            i = link.end()
+        else:
+            i += 1
+    return None
+
+
+class FloodError(Exception):
+    def __init__(self, retry_after):
+        self.retry_after = retry_after
+
+
+class FakeBotAPI:
+    # Telegram's documented limits: per bot per second, and per chat as a token bucket
+    BOT_MESSAGES_PER_SECOND = 30
+    CHAT_RATE, CHAT_BURST = 1.0, 3
+    GROUP_RATE, GROUP_BURST = 20 / 60, 3
+
+    def __init__(self, latency=0.0, webhook_connections=40, retry_delay=1.0, jitter=0.0, error_rate=0.0,
+                 flood_limits=False):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.errors = 0
+        self.webhook_connections = webhook_connections
+        self.retry_delay = retry_delay
+        self.webhooks = {}
+        self.pending = {}
+        self.arrived = {}
+        self.last_error = {}
+        self.delivery_tasks = {}
+        self.next_update_id = 1
+        self.next_message_id = 1
+        self.calls = Counter()
+        self.flood_limits = flood_limits
+        self.bot_sends = {}
+        self.chat_tokens = {}
+        self.flooded = 0
+        self.rejected = Counter()
+        self.runner = None
+        self.session = None
+
+    async def start(self, port):
+        app = web.Application()
+        app.router.add_post('/bot{token}/{method}', self.handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, '127.0.0.1', port).start()
+        self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0))
+        return self.runner
+
+    async def close(self):
+        for task in self.delivery_tasks.values():
+            task.cancel()
+        await asyncio.gather(*self.delivery_tasks.values(), return_exceptions=True)
+        await self.session.close()
+        await self.runner.cleanup()
+
+    def push(self, token, update):
+        """Queue an update for a bot, assigning its update_id; returns the id."""
+        update = dict(update, update_id=self.next_update_id)
+        self.next_update_id += 1
+        self.pending.setdefault(token, deque()).append(update)
+        self._arrived(token).set()
+        if token in self.webhooks:
+            self._ensure_delivery(token)
+        return update['update_id']
+
+    def _arrived(self, token):
+        return self.arrived.setdefault(token, asyncio.Event())
+
+    async def handle(self, request):
+        token, method = request.match_info['token'], request.match_info['method']
+        self.calls[method] += 1
+        if request.content_type == 'application/json':
+            params = await request.json()
+        else:
+            params = {}
+            for key, value in (await request.post()).items():
+                try:
+                    params[key] = json.loads(value)
+                except (TypeError, ValueError):
+                    params[key] = value
+        if method != 'getUpdates':
+            await asyncio.sleep(self.latency + random.uniform(0, self.jitter))
+            if random.random() < self.error_rate:
+                self.errors += 1
+                return web.json_response(
+                    {'ok': False, 'error_code': 500, 'description': 'Internal Server Error'}, status=500,
+                )
+        handler = getattr(self, f"api_{method}", None)
+        result = await handler(token, params) if handler else True
+        return web.json_response({'ok': True, 'result': result})
+
+    async def api_getMe(self, token, params):
+        return {'id': int(token.split(':')[0]), 'is_bot': True, 'first_name': 'Fake', 'username': 'fake_bot'}
+
+    async def api_setWebhook(self, token, params):
+        self.webhooks[token] = params['url']
+        self._ensure_delivery(token)
+        return True
+
+    async def api_deleteWebhook(self, token, params):
+        self.webhooks.pop(token, None)
+        task = self.delivery_tasks.pop(token, None)
+        if task is not None:
+            task.cancel()
+        return True
+
+    async def api_getWebhookInfo(self, token, params):
+        info = {
+            'url': self.webhooks.get(token, ''),
+            'has_custom_certificate': False,
+            'pending_update_count': len(self.pending.get(token, ())),
+        }
+        if token in self.last_error:
+            info['last_error_date'], info['last_error_message'] = self.last_error[token]
+        return info
+
+    async def api_getUpdates(self, token, params):
+        if token in self.webhooks:
+            raise web.HTTPConflict(text='Conflict: can\'t use getUpdates method while webhook is active')
+        pending = self.pending.setdefault(token, deque())
+        offset = params.get('offset')
+        if offset is not None:
+            while pending and pending[0]['update_id'] < int(offset):
+                pending.popleft()
+        if not pending:
+            arrived = self._arrived(token)
+            arrived.clear()
+            try:
+                await asyncio.wait_for(arrived.wait(), float(params.get('timeout') or 0))
+            except asyncio.TimeoutError:
+                pass
+        limit = int(params.get('limit') or 100)
+        return list(pending)[:limit]
+
+    def _check_flood(self, token, chat_id):
+        now = time.monotonic()
+        sends = self.bot_sends.setdefault(token, deque())
+        while sends and now - sends[0] >= 1:
+            sends.popleft()
+        if len(sends) >= self.BOT_MESSAGES_PER_SECOND:
+            raise FloodError(1)
+        rate, burst = (self.GROUP_RATE, self.GROUP_BURST) if chat_id < 0 else (self.CHAT_RATE, self.CHAT_BURST)
+        tokens, updated = self.chat_tokens.get((token, chat_id), (burst, now))
+        tokens = min(burst, tokens + (now - updated) * rate)
+        if tokens < 1:
+            self.chat_tokens[(token, chat_id)] = (tokens, now)
+            raise FloodError(math.ceil((1 - tokens) / rate))
+        self.chat_tokens[(token, chat_id)] = (tokens - 1, now)
+        sends.append(now)
+
+    def _check_text(self, params):
+        text = params.get('text', '')
+        if len(text) > 4096:
+            return 'Bad Request: message is too long'
+        if params.get('parse_mode') == 'Markdown':
+            offset = markdown_error(text)
+            if offset is not None:
+                return f"Bad Request: can't parse entities: Can't find end of the entity starting at byte offset {offset}"
+        return None
+
+    async def _send(self, token, params):
+        if self.flood_limits:
+            error = self._check_text(params)
+            if error:
+                self.rejected[error.split(':')[1].strip()] += 1
+                raise web.HTTPBadRequest(
+                    text=json.dumps({'ok': False, 'error_code': 400, 'description': error}),
+                    content_type='application/json',
+                )
+            try:
+                self._check_flood(token, int(params.get('chat_id', 0)))
+            except FloodError as e:
+                self.flooded += 1
+                raise web.HTTPTooManyRequests(
+                    text=json.dumps({
+                        'ok': False, 'error_code': 429,
+                        'description': f"Too Many Requests: retry after {e.retry_after}",
+                        'parameters': {'retry_after': e.retry_after},
+                    }),
+                    content_type='application/json',
+                )
+        return self._message(params)
+
+    async def api_sendMessage(self, token, params):
+        return await self._send(token, params)
+
+    async def api_editMessageText(self, token, params):
+        return await self._send(token, params)
+
+    def _message(self, params):
+        self.next_message_id += 1
+        return {
+            'message_id': params.get('message_id', self.next_message_id),
+            'date': int(time.time()),
+            'chat': {'id': int(params.get('chat_id', 0)), 'type': 'private'},
+            'text': params.get('text', ''),
+        }
+
+    def _ensure_delivery(self, token):
+        task = self.delivery_tasks.get(token)
+        if task is None or task.done():
+            self.delivery_tasks[token] = asyncio.create_task(self._deliver(token))
+
+    async def _deliver(self, token):
+        """POST pending updates to the webhook, like Telegram, retrying any that are not acknowledged."""
+        semaphore = asyncio.Semaphore(self.webhook_connections)
+        in_flight = set()
+
+        async def post(update):
+            try:
+                async with semaphore:
+                    async with self.session.post(self.webhooks[token], json=update) as response:
+                        await response.read()
+                        ok = response.status == 200
+                        error = f"Wrong response from the webhook: {response.status}"
+            except (aiohttp.ClientError, KeyError) as e:
+                ok, error = False, str(e)
+            if ok:
+                self.pending[token].remove(update)
+            else:
+                self.last_error[token] = (int(time.time()), error)
+                await asyncio.sleep(self.retry_delay)
+            in_flight.discard(update['update_id'])
+            self._arrived(token).set()
+
+        while token in self.webhooks:
+            for update in list(self.pending.get(token, ())):
+                if update['update_id'] not in in_flight:
+                    in_flight.add(update['update_id'])
+                    asyncio.create_task(post(update))
+            arrived = self._arrived(token)
+            arrived.clear()
+            await arrived.wait()
+
+    def stats(self):
+        return {
+            'calls': dict(self.calls),
+            'errors': self.errors,
+            'pending': {t: len(p) for t, p in self.pending.items()},
+            'flooded': self.flooded,
+            'rejected': dict(self.rejected),
+        }
+
+
+async def serve(args):
+    api = FakeBotAPI(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                     flood_limits=args.flood_limits)
+    await api.start(args.port)
+    print(f"Fake Bot API listening on http://127.0.0.1:{args.port}")
+    try:
+        while True:
+            await asyncio.sleep(3600)
+    finally:
+        await api.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--flood-limits', action='store_true')
+    parser.add_argument('--port', type=int, default=8097)
+    asyncio.run(serve(parser.parse_args()))
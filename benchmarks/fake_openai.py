@@ -0,0 +1,185 @@
+"""Local stand-in for the OpenAI chat completions API.
+
+Answers /v1/chat/completions after a configurable latency, streams tokens
+when asked to, and injects 429 responses with rate-limit headers at a
+configurable rate. Prompts asking for "exactly N items" get N items laid
+out the way batching.split_items expects, a share of which can be left
+malformed with --malformed-rate. Run it standalone
+and point the bots at it with OPENAI_BASE_URL=http://127.0.0.1:8098/v1:
+
+    python benchmarks/fake_openai.py --latency 0.5 --rate-limit-rate 0.1
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import re
+import time
+
+from aiohttp import web
+
+COMPLETION_TEXT = (
+    "SUMMARY:\nA fake summary produced by the local completion server.\n\n"
+    "Fun facts:\n1. It is fast.\n\n2. It is free.\n\n3. It is fake.\n\n"
+    "Question: Is this real?\nAnswer: No."
+)
+
+IDEA_TEXT = (
+    "BUSINESS NAME:\nFake Venture {n}\n\nDESCRIPTION:\nA fake idea from the local completion server.\n\n"
+    "TARGET MARKET:\nBenchmarks\n\nVALUE PROPOSITION:\nCosts nothing.\n\nINVESTMENT:\n$0\n\n"
+    "CHALLENGES:\nNot real.\n\nFIRST STEPS:\nRun the benchmark."
+)
+
+
+class FakeOpenAI:
+    """Counts calls and shapes responses like the real API."""
+
+    def __init__(self, latency=0.2, jitter=0.0, rate_limit_rate=0.0, error_rate=0.0, token_latency=0.0,
+                 malformed_rate=0.0):
+        self.latency = latency
+        self.token_latency = token_latency
+        self.jitter = jitter
+        self.rate_limit_rate = rate_limit_rate
+        self.error_rate = error_rate
+        self.malformed_rate = malformed_rate
+        self.idea_numbers = itertools.count(1)
+        self.calls = 0
+        self.rate_limited = 0
+        self.errors = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def _item(self, prompt):
+        if 'BUSINESS NAME' in prompt:
+            text = IDEA_TEXT.format(n=next(self.idea_numbers))
+        else:
+            text = COMPLETION_TEXT
+        if random.random() < self.malformed_rate:
+            # Cut off before the last section, as a model running out of tokens would
+            text = text[:len(text) // 2]
+        return text
+
+    def completion_text(self, body):
+        prompt = body['messages'][-1]['content']
+        batch = re.search(r'exactly (\d+) items', prompt)
+        if not batch:
+            return self._item(prompt)
+        return '\n\n'.join(f"=== ITEM {n} ===\n{self._item(prompt)}" for n in range(1, int(batch.group(1)) + 1))
+
+    async def chat_completions(self, request):
+        body = await request.json()
+        self.calls += 1
+        await asyncio.sleep(self.latency + random.uniform(0, self.jitter))
+
+        roll = random.random()
+        if roll < self.rate_limit_rate:
+            self.rate_limited += 1
+            return web.json_response(
+                {'error': {'message': 'Rate limit reached', 'type': 'requests', 'code': 'rate_limit_exceeded'}},
+                status=429,
+                headers={
+                    'retry-after': '0.2',
+                    'x-ratelimit-remaining-requests': '0',
+                    'x-ratelimit-reset-requests': '200ms',
+                },
+            )
+        if roll < self.rate_limit_rate + self.error_rate:
+            self.errors += 1
+            return web.json_response({'error': {'message': 'Server error', 'type': 'server_error'}}, status=500)
+
+        text = self.completion_text(body)
+        if body.get('stream'):
+            return await self.stream_completion(request, body, text)
+        prompt_tokens = sum(len(m['content'].split()) for m in body['messages'])
+        completion_tokens = len(text.split())
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        return web.json_response(
+            {
+                'id': f'chatcmpl-fake-{self.calls}',
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': body.get('model', 'gpt-3.5-turbo'),
+                'choices': [{
+                    'index': 0,
+                    'message': {'role': 'assistant', 'content': text},
+                    'finish_reason': 'stop',
+                }],
+                'usage': {
+                    'prompt_tokens': prompt_tokens,
+                    'completion_tokens': completion_tokens,
+                    'total_tokens': prompt_tokens + completion_tokens,
+                },
+            },
+            headers={
+                'x-ratelimit-remaining-requests': '1000',
+                'x-ratelimit-reset-requests': '60ms',
+            },
+        )
+
+    async def stream_completion(self, request, body, text):
+        """Send the completion as server-sent events, one word per chunk."""
+        response = web.StreamResponse(headers={
+            'Content-Type': 'text/event-stream',
+            'x-ratelimit-remaining-requests': '1000',
+            'x-ratelimit-reset-requests': '60ms',
+        })
+        await response.prepare(request)
+        words = text.split(' ')
+        for i, word in enumerate(words):
+            chunk = {
+                'id': f'chatcmpl-fake-{self.calls}',
+                'object': 'chat.completion.chunk',
+                'created': int(time.time()),
+                'model': body.get('model', 'gpt-3.5-turbo'),
+                'choices': [{
+                    'index': 0,
+                    'delta': {'content': word if i == 0 else ' ' + word},
+                    'finish_reason': None,
+                }],
+            }
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            if self.token_latency:
+                await asyncio.sleep(self.token_latency)
+        self.completion_tokens += len(words)
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    def stats(self):
+        return {
+            'calls': self.calls,
+            'rate_limited': self.rate_limited,
+            'errors': self.errors,
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+        }
+
+    async def start(self, port):
+        app = web.Application()
+        app.router.add_post('/v1/chat/completions', self.chat_completions)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, '127.0.0.1', port).start()
+        return runner
+
+
+async def serve(args):
+    fake = FakeOpenAI(args.latency, args.jitter, args.rate_limit_rate, args.error_rate, args.token_latency,
+                      args.malformed_rate)
+    await fake.start(args.port)
+    print(f"Fake OpenAI listening on http://127.0.0.1:{args.port}/v1")
+    await asyncio.Event().wait()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--latency', type=float, default=0.2)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--token-latency', type=float, default=0.0)
+    parser.add_argument('--malformed-rate', type=float, default=0.0)
+    parser.add_argument('--port', type=int, default=8098)
+    asyncio.run(serve(parser.parse_args()))
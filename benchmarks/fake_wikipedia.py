@@ -0,0 +1,112 @@
+"""Local stand-in for the parts of Wikipedia the wiki facts bot uses.
+
+Serves Special:RandomInCategory redirects, article pages, and the
+api.php search-generator and extracts queries, each after a configurable
+latency with optional jitter and 5xx errors. Run it standalone and point
+the bots at it with WIKIPEDIA_BASE_URL=http://127.0.0.1:8096:
+
+    python benchmarks/fake_wikipedia.py --latency 0.05 --error-rate 0.01
+"""
+import argparse
+import asyncio
+import random
+import urllib.parse
+from collections import Counter
+
+from aiohttp import web
+
+
+def article_html(title, paragraphs=40):
+    body = ''.join(f"<p>Paragraph {i} of {title}. " + "Lorem ipsum dolor sit amet. " * 20 + "</p>"
+                   for i in range(paragraphs))
+    return (f"<html><body><h1 id=\"firstHeading\">{title}</h1>"
+            f"<div class=\"mw-parser-output\">{body}</div></body></html>")
+
+
+def article_extract(title, paragraphs=3):
+    return '\n'.join(f"{title} paragraph {i}. " + "Lorem ipsum dolor sit amet. " * 8 for i in range(paragraphs))
+
+
+class FakeWikipedia:
+    def __init__(self, latency=0.05, jitter=0.0, error_rate=0.0, articles=1000):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.articles = articles
+        self.base_url = None
+        self.calls = Counter()
+        self.errors = 0
+
+    async def _delay(self, kind):
+        self.calls[kind] += 1
+        await asyncio.sleep(self.latency + random.uniform(0, self.jitter))
+        if random.random() < self.error_rate:
+            self.errors += 1
+            raise web.HTTPServiceUnavailable(text='Fake Wikipedia error')
+
+    def _page(self, title, index=None):
+        page = {
+            'title': title,
+            'fullurl': f"{self.base_url}/wiki/{urllib.parse.quote(title.replace(' ', '_'))}",
+            'extract': article_extract(title),
+        }
+        if index is not None:
+            page['index'] = index
+        return page
+
+    async def random_article(self, request):
+        await self._delay('random')
+        title = f"Article {random.randrange(self.articles)}"
+        raise web.HTTPFound(f"/wiki/{urllib.parse.quote(title.replace(' ', '_'))}")
+
+    async def article(self, request):
+        await self._delay('article_html')
+        title = request.match_info['title'].replace('_', ' ')
+        return web.Response(text=article_html(title), content_type='text/html')
+
+    async def api(self, request):
+        query = request.query
+        if query.get('generator') == 'search':
+            await self._delay('search')
+            keyword = query.get('gsrsearch', '')
+            limit = int(query.get('gsrlimit', 1))
+            pages = [self._page(f"{keyword.title()} {i}" if i else keyword.title(), index=i + 1) for i in range(limit)]
+        else:
+            await self._delay('extracts')
+            pages = [self._page(title) for title in query.get('titles', '').split('|') if title]
+        return web.json_response({'query': {'pages': pages}}, headers={'ETag': f"W/\"{len(pages)}\""})
+
+    async def head(self, request):
+        self.calls['head'] += 1
+        return web.Response()
+
+    async def start(self, port):
+        self.base_url = f"http://127.0.0.1:{port}"
+        app = web.Application()
+        app.router.add_route('HEAD', '/{tail:.*}', self.head)
+        app.router.add_get('/wiki/Special:RandomInCategory/{category}', self.random_article)
+        app.router.add_get('/wiki/{title}', self.article)
+        app.router.add_get('/w/api.php', self.api)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, '127.0.0.1', port).start()
+        return runner
+
+    def stats(self):
+        return {'calls': dict(self.calls), 'errors': self.errors}
+
+
+async def serve(args):
+    fake = FakeWikipedia(args.latency, args.jitter, args.error_rate)
+    await fake.start(args.port)
+    print(f"Fake Wikipedia listening on {fake.base_url}")
+    await asyncio.Event().wait()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--port', type=int, default=8096)
+    asyncio.run(serve(parser.parse_args()))
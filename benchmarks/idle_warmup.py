@@ -0,0 +1,86 @@
+"""First request after an idle spell, with and without periodic warm-up.
+
+Runs a local upstream that charges --handshake seconds for the first request
+on every new connection (standing in for TCP and TLS setup to Wikipedia or
+OpenAI) and closes connections idle for longer than --upstream-idle-close.
+A PooledClient makes a few steady requests, sits idle, then makes one more:
+
+    python benchmarks/idle_warmup.py --no-warmup
+    python benchmarks/idle_warmup.py
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from health import HealthMonitor  # noqa: E402
+from http_client import PooledClient  # noqa: E402
+
+
+async def start_upstream(port, handshake, idle_close):
+    seen = set()
+
+    async def handle(request):
+        connection = id(request.transport)
+        if connection not in seen:
+            seen.add(connection)
+            await asyncio.sleep(handshake)
+        return web.json_response({'ok': True})
+
+    app = web.Application()
+    app.router.add_route('*', '/{tail:.*}', handle)
+    runner = web.AppRunner(app, access_log=None, keepalive_timeout=idle_close)
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', port).start()
+    return runner
+
+
+async def timed(client, url):
+    started = time.perf_counter()
+    await client.get(url)
+    return (time.perf_counter() - started) * 1000
+
+
+async def run(args):
+    upstream = await start_upstream(args.port, args.handshake, args.upstream_idle_close)
+    url = f"http://127.0.0.1:{args.port}/w/api.php"
+    client = PooledClient('upstream')
+    await client.start()
+
+    monitor = HealthMonitor(interval=args.warm_interval)
+    if not args.no_warmup:
+        monitor.add('upstream', lambda: client.warm_up(url, connections=2), client.pool_stats)
+        await monitor.start()
+
+    cold = await timed(client, url)
+    steady = [await timed(client, url) for _ in range(20)]
+    await asyncio.sleep(args.idle)
+    after_idle = await timed(client, url)
+
+    print(f"warmup={'off' if args.no_warmup else f'every {args.warm_interval}s'} handshake={args.handshake}s "
+          f"upstream closes idle after {args.upstream_idle_close}s, idle {args.idle}s")
+    print(f"  first request: {cold:.1f} ms")
+    print(f"  steady median: {sorted(steady)[len(steady) // 2]:.1f} ms")
+    print(f"  after idle: {after_idle:.1f} ms")
+    if not args.no_warmup:
+        print(f"  pool: {client.pool_stats()}, warm rounds: {monitor.rounds}")
+
+    await monitor.stop()
+    await client.close()
+    await upstream.cleanup()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--no-warmup', action='store_true')
+    parser.add_argument('--handshake', type=float, default=0.15)
+    parser.add_argument('--upstream-idle-close', type=float, default=5)
+    parser.add_argument('--idle', type=float, default=12)
+    parser.add_argument('--warm-interval', type=float, default=3)
+    parser.add_argument('--port', type=int, default=8490)
+    asyncio.run(run(parser.parse_args()))
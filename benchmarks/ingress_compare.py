@@ -0,0 +1,109 @@
+"""Compare webhook and long-polling ingress end to end.
+
+Runs the fake Bot API from fake_bot_api.py, pushes updates into it and
+measures how long each takes to reach its handler, delivered either by
+webhook POSTs to the aiohttp server or by the getUpdates poller. The auto
+mode points the webhook at a port nothing listens on, so the supervisor
+has to notice the delivery errors and fall back to polling:
+
+    python benchmarks/ingress_compare.py --mode webhook
+    python benchmarks/ingress_compare.py --mode polling
+    python benchmarks/ingress_compare.py --mode auto --check-interval 1
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+from telegram import Update
+from telegram.ext import Application, TypeHandler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+from polling import IngressSupervisor, UpdatePoller  # noqa: E402
+from update_queue import UpdateQueue  # noqa: E402
+from fake_bot_api import FakeBotAPI  # noqa: E402
+from webhook_load import TOKEN, make_update, percentile, wait_until_up  # noqa: E402
+
+
+async def run(args):
+    api = FakeBotAPI(latency=args.api_latency, retry_delay=0.2)
+    await api.start(args.port + 1)
+
+    pushed_at = {}
+    latencies = []
+
+    async def handler(update, context):
+        latencies.append(time.perf_counter() - pushed_at[update.update_id])
+        await asyncio.sleep(args.handler_latency)
+
+    application = (
+        Application.builder()
+        .token(TOKEN)
+        .base_url(f"http://127.0.0.1:{args.port + 1}/bot")
+        .build()
+    )
+    application.add_handler(TypeHandler(Update, handler))
+    await application.initialize()
+    main.bot_applications[TOKEN] = application
+    queue = main.update_queues[TOKEN] = UpdateQueue(application, 'bench', maxsize=args.requests, workers=args.queue_workers)
+    queue.start()
+
+    runner = await main.run_web_server(args.port, '127.0.0.1')
+    await wait_until_up(f"http://127.0.0.1:{args.port}/")
+    webhook_url = f"http://127.0.0.1:{args.port}"
+    if args.mode == 'auto':
+        # Nothing listens here, so every delivery fails
+        webhook_url = f"http://127.0.0.1:{args.port + 2}"
+    if args.mode != 'polling':
+        await application.bot.set_webhook(url=f"{webhook_url}/{TOKEN}")
+    source = None
+    if args.mode != 'webhook':
+        poller = UpdatePoller(application, queue, 'bench')
+        if args.mode == 'polling':
+            source = poller
+            await poller.start()
+        else:
+            source = IngressSupervisor(application, poller, 'bench', f"{webhook_url}/{TOKEN}",
+                                       check_interval=args.check_interval)
+            source.start()
+
+    started = time.perf_counter()
+    for i in range(args.requests):
+        update = make_update(i + 1)
+        del update['update_id']
+        pushed_at[api.push(TOKEN, update)] = time.perf_counter()
+        if args.rate:
+            await asyncio.sleep(1 / args.rate)
+    while queue.processed + queue.failed < args.requests:
+        await asyncio.sleep(0.01)
+    total = time.perf_counter() - started
+
+    print(f"mode={args.mode} requests={args.requests} handler_latency={args.handler_latency}s "
+          f"api_latency={args.api_latency}s rate={args.rate or 'burst'}")
+    print(f"  processed: {args.requests / total:.1f} updates/s in {total:.2f}s")
+    print(f"  push-to-handler latency p50: {percentile(latencies, 50) * 1000:.1f} ms, "
+          f"p99: {percentile(latencies, 99) * 1000:.1f} ms")
+    print(f"  Bot API calls: {api.stats()['calls']}")
+    if source is not None:
+        print(f"  ingress: {source.stats()}")
+        await source.stop()
+    await queue.stop()
+    await runner.cleanup()
+    await application.shutdown()
+    await api.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--mode', choices=['webhook', 'polling', 'auto'], default='webhook')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--rate', type=float, default=0, help='updates pushed per second; 0 pushes them all at once')
+    parser.add_argument('--handler-latency', type=float, default=0.05)
+    parser.add_argument('--api-latency', type=float, default=0.0)
+    parser.add_argument('--queue-workers', type=int, default=50)
+    parser.add_argument('--check-interval', type=float, default=1.0)
+    parser.add_argument('--port', type=int, default=8290)
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,75 @@
+"""Drive the shared LLM client against the fake completion server.
+
+Fires concurrent completions from both bots while the fake server injects
+latency and 429s, and reports throughput, latency and retry counts:
+
+    python benchmarks/llm_load.py --calls 200 --latency 0.1 --rate-limit-rate 0.2
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_openai import FakeOpenAI  # noqa: E402
+
+
+async def run(args):
+    fake = FakeOpenAI(args.latency, args.jitter, args.rate_limit_rate, args.error_rate)
+    runner = await fake.start(args.port)
+    os.environ['OPENAI_API_KEY'] = 'fake'
+    os.environ['OPENAI_BASE_URL'] = f"http://127.0.0.1:{args.port}/v1"
+
+    from llm_client import LLMClient
+    client = LLMClient(
+        max_concurrency=args.concurrency,
+        max_concurrency_per_bot=args.concurrency_per_bot,
+        requests_per_minute=args.requests_per_minute,
+    )
+
+    latencies = []
+    failures = 0
+
+    async def call(i):
+        nonlocal failures
+        bot = 'wiki_facts' if i % 2 else 'business_ideas'
+        started = time.perf_counter()
+        try:
+            await client.chat(bot, [{'role': 'user', 'content': f'Prompt {i}'}])
+            latencies.append(time.perf_counter() - started)
+        except Exception:
+            failures += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(call(i) for i in range(args.calls)))
+    elapsed = time.perf_counter() - started
+    await client.close()
+    await runner.cleanup()
+
+    latencies.sort()
+    print(f"calls={args.calls} latency={args.latency}s rate_limit_rate={args.rate_limit_rate} "
+          f"error_rate={args.error_rate}")
+    print(f"  throughput: {len(latencies) / elapsed:.1f} completions/s, {failures} failed")
+    if latencies:
+        print(f"  latency p50: {latencies[len(latencies) // 2] * 1000:.0f} ms, "
+              f"p99: {latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000:.0f} ms")
+    print(f"  client: {client.stats()}")
+    print(f"  server: {fake.stats()}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--calls', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--concurrency-per-bot', type=int, default=4)
+    parser.add_argument('--requests-per-minute', type=float, default=6000)
+    parser.add_argument('--latency', type=float, default=0.1)
+    parser.add_argument('--jitter', type=float, default=0.05)
+    parser.add_argument('--rate-limit-rate', type=float, default=0.2)
+    parser.add_argument('--error-rate', type=float, default=0.05)
+    parser.add_argument('--port', type=int, default=8098)
+    logging.basicConfig(level=logging.ERROR)
+    asyncio.run(run(parser.parse_args()))
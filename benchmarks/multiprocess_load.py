@@ -0,0 +1,129 @@
+"""Throughput benchmark for the multi-process webhook tier.
+
+Starts a front process that routes by chat to N spawned worker processes,
+each running an application whose handler burns some CPU (standing in for
+HTML parsing and JSON handling) and then waits (standing in for Wikipedia
+and OpenAI). Updates are posted to the front, and the benchmark reports
+throughput, latency and whether any chat saw its updates out of order:
+
+    python benchmarks/multiprocess_load.py --processes 1
+    python benchmarks/multiprocess_load.py --processes 4
+"""
+import argparse
+import asyncio
+import functools
+import os
+import signal
+import sys
+import time
+
+from aiohttp import web
+from telegram import Update
+from telegram.ext import Application, TypeHandler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+from dispatcher import Dispatcher, spawn_workers, stop_workers  # noqa: E402
+from webhook_load import TOKEN, start_fake_bot_api, post_updates, percentile, wait_until_up  # noqa: E402
+
+
+def burn_cpu(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+async def serve_bench_worker(index, port, bot_api_port, cpu_time, handler_latency, queue_workers):
+    last_message = {}
+    counts = {'handled': 0, 'out_of_order': 0}
+
+    async def handler(update, context):
+        message = update.effective_message
+        if message.message_id < last_message.get(message.chat_id, -1):
+            counts['out_of_order'] += 1
+        last_message[message.chat_id] = message.message_id
+        burn_cpu(cpu_time)
+        await asyncio.sleep(handler_latency)
+        counts['handled'] += 1
+
+    application = (
+        Application.builder()
+        .token(TOKEN)
+        .base_url(f"http://127.0.0.1:{bot_api_port}/bot")
+        .build()
+    )
+    application.add_handler(TypeHandler(Update, handler))
+    await application.initialize()
+    main.bot_applications[TOKEN] = application
+    main.update_queues[TOKEN] = main.UpdateQueue(application, f"worker-{index}", maxsize=10000, workers=queue_workers)
+    main.update_queues[TOKEN].start()
+    runner = await main.run_web_server(port, '127.0.0.1')
+
+    stopping = asyncio.Event()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stopping.set)
+    await stopping.wait()
+
+    await main.update_queues[TOKEN].stop()
+    await runner.cleanup()
+    await application.shutdown()
+    print(f"  worker {index}: handled {counts['handled']}, out of order {counts['out_of_order']}", flush=True)
+
+
+def run_bench_worker(index, port, **kwargs):
+    asyncio.run(serve_bench_worker(index, port, **kwargs))
+
+
+async def run(args):
+    bot_api = await start_fake_bot_api(args.port + 1)
+    target = functools.partial(
+        run_bench_worker,
+        bot_api_port=args.port + 1,
+        cpu_time=args.cpu_ms / 1000,
+        handler_latency=args.handler_latency,
+        queue_workers=args.queue_workers,
+    )
+    processes, urls = spawn_workers(args.processes, target, base_port=args.port + 10)
+
+    dispatcher = Dispatcher(urls)
+    await dispatcher.start()
+    await dispatcher.wait_ready()
+    runner = web.AppRunner(main.create_front_app([TOKEN], dispatcher))
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', args.port).start()
+    base_url = f"http://127.0.0.1:{args.port}"
+    await wait_until_up(base_url + '/')
+
+    started = time.perf_counter()
+    latencies, rejected, elapsed = await post_updates(f"{base_url}/{TOKEN}", args.requests, args.concurrency)
+    # Throughput counts until every worker has drained its queue
+    while True:
+        stats = await dispatcher.worker_stats()
+        queues = [s[f"worker-{i}"] for i, s in enumerate(stats)]
+        if all(q['processed'] + q['failed'] == q['enqueued'] for q in queues):
+            break
+        await asyncio.sleep(0.05)
+    total = time.perf_counter() - started
+
+    print(f"processes={args.processes} requests={args.requests} concurrency={args.concurrency} "
+          f"cpu={args.cpu_ms}ms handler_latency={args.handler_latency}s")
+    print(f"  accepted: {len(latencies) / elapsed:.1f} updates/s ({rejected} rejected)")
+    print(f"  processed: {len(latencies) / total:.1f} updates/s")
+    print(f"  ack latency p50: {percentile(latencies, 50) * 1000:.1f} ms, p99: {percentile(latencies, 99) * 1000:.1f} ms")
+
+    await runner.cleanup()
+    await dispatcher.close()
+    await stop_workers(processes)
+    await bot_api.cleanup()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--cpu-ms', type=float, default=5)
+    parser.add_argument('--handler-latency', type=float, default=0.05)
+    parser.add_argument('--queue-workers', type=int, default=50)
+    parser.add_argument('--port', type=int, default=8190)
+    asyncio.run(run(parser.parse_args()))
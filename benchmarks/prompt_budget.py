@@ -0,0 +1,82 @@
+"""Prompt tokens per request with and without input budgets.
+
+Sends /fact summary and /analyze prompts for articles and ideas of growing
+length to the fake completion server, once with the budgets effectively
+off and once with the configured ones, and reports prompt tokens per
+request as counted locally and by the server, plus the time spent fitting:
+
+    python benchmarks/prompt_budget.py --summary-budget 400 --analysis-budget 400
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_openai import FakeOpenAI  # noqa: E402
+
+VOCABULARY = (
+    'river empire council harbour treaty railway cathedral province dynasty merchant festival '
+    'mountain parliament glacier composer battle island monastery fortress harvest observatory'
+).split()
+
+
+def make_text(sentences, seed):
+    rng = random.Random(seed)
+    return ' '.join(
+        f"The {rng.choice(VOCABULARY)} of {rng.choice(VOCABULARY).title()} "
+        f"{' '.join(rng.choices(VOCABULARY, k=rng.randint(6, 18)))} in {rng.randint(1200, 2020)}."
+        for _ in range(sentences)
+    )
+
+
+async def run(args):
+    fake = FakeOpenAI(args.latency)
+    runner = await fake.start(args.port)
+    os.environ['OPENAI_API_KEY'] = 'fake'
+    os.environ['OPENAI_BASE_URL'] = f"http://127.0.0.1:{args.port}/v1"
+
+    import business_ideas_bot
+    import wiki_facts_bot
+    from llm_client import llm
+    from token_budget import budget
+    await llm.start()
+
+    lengths = [int(length) for length in args.sentences.split(',')]
+    print(f"{'prompt':<9}{'sentences':>10}{'budget':>8}{'local tokens':>14}{'server tokens':>15}{'fit ms':>8}")
+    for kind in ('summary', 'analysis'):
+        for sentences in lengths:
+            text = make_text(sentences, sentences)
+            for limit in (10 ** 9, args.summary_budget if kind == 'summary' else args.analysis_budget):
+                wiki_facts_bot.SUMMARY_INPUT_BUDGET = limit
+                business_ideas_bot.ANALYSIS_INPUT_BUDGET = limit
+                started = time.perf_counter()
+                if kind == 'summary':
+                    messages = wiki_facts_bot.build_summary_messages({'title': 'Benchmark', 'content': text})
+                else:
+                    messages = business_ideas_bot.build_analysis_messages(text)
+                fit_ms = (time.perf_counter() - started) * 1000
+                before = fake.prompt_tokens
+                await llm.chat('benchmark', messages, max_tokens=500)
+                print(f"{kind:<9}{sentences:>10}{'off' if limit == 10 ** 9 else limit:>8}"
+                      f"{budget.count_messages(messages):>14}{fake.prompt_tokens - before:>15}{fit_ms:>8.2f}")
+    print(f"tokenizer: {budget.stats()['tokenizer']}")
+
+    await llm.close()
+    await runner.cleanup()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sentences', default='5,20,60,150')
+    parser.add_argument('--summary-budget', type=int, default=400)
+    parser.add_argument('--analysis-budget', type=int, default=400)
+    parser.add_argument('--latency', type=float, default=0.01)
+    parser.add_argument('--port', type=int, default=8499)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(run(args))
@@ -0,0 +1,117 @@
+"""Broadcast-like burst of Markdown replies, sent directly or through the send pipeline.
+
+Sends one LLM-style Markdown message to each of --chats chats at once
+through the fake Bot API with Telegram's flood limits and parse checks
+on. Some messages have stray Markdown markers (--broken-rate) and some
+are longer than 4096 characters (--long-rate). The direct mode does what
+the handlers used to do: send as Markdown, retry once as plain text on
+a 400, and give up on a 429:
+
+    python benchmarks/send_burst.py --mode direct
+    python benchmarks/send_burst.py --mode pipeline
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+import time
+
+from telegram import Bot
+from telegram.error import BadRequest, RetryAfter
+from telegram.request import HTTPXRequest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from send_pipeline import SendPipeline  # noqa: E402
+from fake_bot_api import FakeBotAPI  # noqa: E402
+
+TOKEN = '123456:burst'
+
+SUMMARY = (
+    "📚 *Article {n}*\n\nSUMMARY:\nThe `5*3 rule and the snake_case field, described in **bold** by the model.\n\n"
+    "Fun facts:\n1. It is fast.\n\n2. It is free.\n\n3. It is fake.\n\n"
+    "Question: Is this real?\nAnswer: No.\n\n🔗 [Read full article](https://en.wikipedia.org/wiki/Article_{n})"
+)
+
+
+def make_text(n, rng, broken_rate, long_rate):
+    text = SUMMARY.format(n=n)
+    if rng.random() >= broken_rate:
+        text = text.replace('snake_case', 'snake case').replace('`5*3', '5x3')
+    if rng.random() < long_rate:
+        text += "\n\n" + "More detail about the article. " * 200
+    return text
+
+
+async def send_direct(bot, chat_id, text, counts):
+    try:
+        try:
+            await bot.send_message(chat_id, text, parse_mode='Markdown')
+        except BadRequest:
+            counts['plain_retries'] += 1
+            await bot.send_message(chat_id, text)
+        counts['delivered'] += 1
+    except RetryAfter:
+        counts['flood_failures'] += 1
+    except BadRequest:
+        counts['bad_request_failures'] += 1
+
+
+async def send_pipeline(pipeline, bot, chat_id, text, counts):
+    try:
+        await pipeline.send(bot, chat_id, text, parse_mode='Markdown')
+        counts['delivered'] += 1
+    except RetryAfter:
+        counts['flood_failures'] += 1
+    except BadRequest:
+        counts['bad_request_failures'] += 1
+
+
+async def run(args):
+    api = FakeBotAPI(latency=args.api_latency, flood_limits=True)
+    await api.start(args.port)
+    bot = Bot(TOKEN, base_url=f"http://127.0.0.1:{args.port}/bot",
+              request=HTTPXRequest(connection_pool_size=args.connections))
+    await bot.initialize()
+    pipeline = SendPipeline()
+
+    rng = random.Random(args.seed)
+    texts = [make_text(n, rng, args.broken_rate, args.long_rate) for n in range(args.chats)]
+    counts = {'delivered': 0, 'plain_retries': 0, 'flood_failures': 0, 'bad_request_failures': 0}
+
+    started = time.perf_counter()
+    if args.mode == 'direct':
+        await asyncio.gather(*(send_direct(bot, 1000 + n, text, counts) for n, text in enumerate(texts)))
+    else:
+        await asyncio.gather(*(send_pipeline(pipeline, bot, 1000 + n, text, counts) for n, text in enumerate(texts)))
+    elapsed = time.perf_counter() - started
+
+    print(f"mode={args.mode} chats={args.chats} broken={args.broken_rate} long={args.long_rate}")
+    print(f"  delivered: {counts['delivered']}/{args.chats} in {elapsed:.2f}s "
+          f"({counts['delivered'] / elapsed:.1f} replies/s)")
+    print(f"  sendMessage calls: {api.calls['sendMessage']} ({api.calls['sendMessage'] / elapsed:.1f}/s), "
+          f"429s: {api.flooded}, 400s: {dict(api.rejected)}")
+    print(f"  failed on 429: {counts['flood_failures']}, failed on 400: {counts['bad_request_failures']}, "
+          f"plain-text retries: {counts['plain_retries']}")
+    if args.mode == 'pipeline':
+        print(f"  pipeline: {pipeline.stats()}")
+
+    await bot.shutdown()
+    await api.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--mode', choices=['direct', 'pipeline'], default='pipeline')
+    parser.add_argument('--chats', type=int, default=300)
+    parser.add_argument('--broken-rate', type=float, default=0.3)
+    parser.add_argument('--long-rate', type=float, default=0.05)
+    parser.add_argument('--api-latency', type=float, default=0.02)
+    parser.add_argument('--connections', type=int, default=64)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--port', type=int, default=8497)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(run(args))
@@ -0,0 +1,123 @@
+"""Daily-fact fan-out time per 10k subscribers against the fake Bot API.
+
+First fills a subscription store with --store-chats chats spread over the
+day and times subscribing, finding a due slot and the memory held. Then
+subscribes --subscribers chats to one slot and delivers it through the
+send pipeline to the fake Bot API with its flood limits on, so every send
+is checked against the per-bot and per-chat limits. Both the fake and the
+pipeline use --sends-per-second as the bot's limit; Telegram allows about
+30 a second, or up to 1000 with paid broadcasts:
+
+    python benchmarks/subscription_fanout.py --subscribers 2000 --sends-per-second 28
+    python benchmarks/subscription_fanout.py --subscribers 10000 --sends-per-second 1000
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+from telegram import Bot
+from telegram.request import HTTPXRequest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from send_pipeline import SendPipeline, TELEGRAM_SENDS_PER_SECOND  # noqa: E402
+from subscriptions import DailyDelivery, SubscriptionStore, MINUTES_PER_DAY  # noqa: E402
+from fake_bot_api import FakeBotAPI  # noqa: E402
+
+TOKEN = '123456:fanout'
+
+FACT = (
+    "⏰ Daily fact\n\n📚 *Article*\n\nSUMMARY:\nA summary of the article, written once for the whole slot.\n\n"
+    "Fun facts:\n1. It is fast.\n\n2. It is free.\n\n3. It is fake.\n\n"
+    "Question: Is this real?\nAnswer: No.\n\n🔗 [Read full article](https://en.wikipedia.org/wiki/Article)\n\n"
+    "Your daily fact for 09:00 UTC. Use /unsubscribe to stop them."
+)
+
+
+def time_store(chats, seed):
+    rng = random.Random(seed)
+    store = SubscriptionStore()
+    tracemalloc.start()
+    started = time.perf_counter()
+    for chat_id in range(chats):
+        store.subscribe(1000 + chat_id, rng.randrange(MINUTES_PER_DAY))
+    subscribe_seconds = time.perf_counter() - started
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    started = time.perf_counter()
+    due = sum(len(store.due(slot)) for slot in range(MINUTES_PER_DAY))
+    scan_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    for chat_id in range(0, chats, 2):
+        store.subscribe(1000 + chat_id, rng.randrange(MINUTES_PER_DAY))
+    move_seconds = time.perf_counter() - started
+
+    print(f"store: {chats} chats in {len(store.slots)} slots, {memory / chats:.0f} bytes per chat")
+    print(f"  subscribe: {subscribe_seconds / chats * 1e6:.2f}us, move to another slot: "
+          f"{move_seconds / (chats // 2) * 1e6:.2f}us, due lookups for a whole day: {scan_seconds * 1000:.2f}ms "
+          f"({due} chats)")
+
+
+async def run(args):
+    time_store(args.store_chats, args.seed)
+
+    FakeBotAPI.BOT_MESSAGES_PER_SECOND = args.sends_per_second + 2
+    api = FakeBotAPI(latency=args.api_latency, flood_limits=True)
+    await api.start(args.port)
+    bot = Bot(TOKEN, base_url=f"http://127.0.0.1:{args.port}/bot",
+              request=HTTPXRequest(connection_pool_size=args.connections))
+    await bot.initialize()
+
+    produced = 0
+
+    async def produce(slot):
+        nonlocal produced
+        produced += 1
+        await asyncio.sleep(args.produce_latency)
+        return FACT
+
+    delivery = DailyDelivery('benchmark', produce, concurrency=args.concurrency,
+                             pipeline=SendPipeline(sends_per_second=args.sends_per_second))
+    delivery.bot = bot
+    slot = 9 * 60
+    for chat_id in range(args.subscribers):
+        delivery.store.subscribe(1000 + chat_id, slot)
+
+    started = time.perf_counter()
+    await delivery.deliver(slot)
+    elapsed = time.perf_counter() - started
+    per_10k = elapsed / args.subscribers * 10000
+
+    print(f"fan-out: {args.subscribers} subscribers at {args.sends_per_second:g} sends/s, "
+          f"concurrency {args.concurrency}")
+    print(f"  delivered: {delivery.delivered}/{args.subscribers} in {elapsed:.2f}s "
+          f"({delivery.delivered / elapsed:.1f}/s), {per_10k:.1f}s per 10k subscribers")
+    print(f"  messages produced: {produced}, sendMessage calls: {api.calls['sendMessage']}, "
+          f"429s: {api.flooded}, 400s: {dict(api.rejected)}, failed: {delivery.failed}")
+    print(f"  {delivery.delivered / elapsed / args.sends_per_second:.0%} of the bot's limit, "
+          f"pipeline: {delivery.pipeline.stats()}")
+
+    await bot.shutdown()
+    await api.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--subscribers', type=int, default=2000)
+    parser.add_argument('--store-chats', type=int, default=100000)
+    parser.add_argument('--sends-per-second', type=float, default=TELEGRAM_SENDS_PER_SECOND)
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--produce-latency', type=float, default=1.0)
+    parser.add_argument('--api-latency', type=float, default=0.02)
+    parser.add_argument('--connections', type=int, default=128)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--port', type=int, default=8496)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(run(args))
@@ -0,0 +1,321 @@
+"""End-to-end benchmark of the real bots against local fake upstreams.
+
+Starts fake Telegram Bot API, Wikipedia and OpenAI servers (each with its
+own latency, jitter and error rate), runs both bot modules behind
+main.webhook exactly as in production, and posts a weighted mix of
+/fact, /search, /idea, /analyze, /start and /help updates from many users
+at a fixed rate. Reports webhook acknowledgement and end-to-end latency
+percentiles, throughput, upstream call counts and memory, and saves
+everything as JSON. With --baseline it compares against an earlier run and
+exits non-zero on a regression beyond --tolerance:
+
+    python benchmarks/suite.py --requests 1000 --rate 50
+    python benchmarks/suite.py --output before.json
+    python benchmarks/suite.py --baseline before.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+import aiohttp
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_bot_api import FakeBotAPI  # noqa: E402
+from fake_openai import FakeOpenAI  # noqa: E402
+from fake_wikipedia import FakeWikipedia  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TOKENS = {'wiki_facts': '1001:wiki', 'business_ideas': '1002:ideas'}
+
+# command -> (bot, weight, argument choices)
+DEFAULT_MIX = {
+    'fact': ('wiki_facts', 30, None),
+    'search': ('wiki_facts', 25, ['python', 'black holes', 'roman empire', 'coffee', 'jazz', 'volcano']),
+    'idea': ('business_ideas', 20, None),
+    'analyze': ('business_ideas', 15, ['a bakery for dogs', 'solar powered bikes', 'remote tutoring']),
+    'start': ('wiki_facts', 5, None),
+    'help': ('business_ideas', 5, None),
+}
+
+# Ratios above which a metric counts as a regression against the baseline
+HIGHER_IS_WORSE = ['ack_latency_ms.p99', 'e2e_latency_ms.p50', 'e2e_latency_ms.p99', 'memory.peak_rss_mb']
+LOWER_IS_WORSE = ['throughput_per_second']
+
+
+def percentile(values, pct):
+    # Not imported from webhook_load, which imports main before the fakes' URLs are in the environment
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def rss_mb():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def make_command_update(update_id, user_id, command, argument):
+    text = f"/{command}" + (f" {argument}" if argument else '')
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'Load'},
+            'text': text,
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': len(command) + 1}],
+        },
+    }
+
+
+def latency_summary(values):
+    if not values:
+        return {'count': 0}
+    return {
+        'count': len(values),
+        'p50': round(percentile(values, 50) * 1000, 2),
+        'p95': round(percentile(values, 95) * 1000, 2),
+        'p99': round(percentile(values, 99) * 1000, 2),
+        'max': round(max(values) * 1000, 2),
+    }
+
+
+def configure_environment(args):
+    """Point the bots at the fakes; must run before main is imported, since config is read at import."""
+    os.environ.update({
+        'TELEGRAM_API_BASE_URL': f"http://127.0.0.1:{args.port + 1}",
+        'WIKIPEDIA_BASE_URL': f"http://127.0.0.1:{args.port + 2}",
+        'OPENAI_BASE_URL': f"http://127.0.0.1:{args.port + 3}/v1",
+        'OPENAI_API_KEY': 'benchmark',
+        'WIKI_FACTS_TELE_TOKEN': TOKENS['wiki_facts'],
+        'BUSINESS_IDEAS_TELE_TOKEN': TOKENS['business_ideas'],
+        'CONTENT_POOL_ENABLED': 'false' if args.no_pools else 'true',
+    })
+    if not args.rate_limits:
+        os.environ.setdefault('RATE_LIMIT_USER_PER_MINUTE', '100000')
+        os.environ.setdefault('RATE_LIMIT_USER_BURST', '100000')
+        os.environ.setdefault('RATE_LIMIT_CHAT_PER_MINUTE', '100000')
+        os.environ.setdefault('RATE_LIMIT_CHAT_BURST', '100000')
+
+
+async def run(args):
+    configure_environment(args)
+    import main
+    if not args.verbose:
+        # Per-request INFO logs from the bots and httpx would drown the report
+        logging.getLogger().setLevel(logging.WARNING)
+
+    bot_api = FakeBotAPI(latency=args.telegram_latency, jitter=args.telegram_jitter, error_rate=args.telegram_errors)
+    wikipedia = FakeWikipedia(latency=args.wikipedia_latency, jitter=args.wikipedia_jitter,
+                              error_rate=args.wikipedia_errors)
+    openai = FakeOpenAI(latency=args.openai_latency, jitter=args.openai_jitter,
+                        error_rate=args.openai_errors, token_latency=args.openai_token_latency)
+    await bot_api.start(args.port + 1)
+    wikipedia_runner = await wikipedia.start(args.port + 2)
+    openai_runner = await openai.start(args.port + 3)
+
+    rss_before = rss_mb()
+    await main.start_bots(main.load_specs())
+    runner = await main.run_web_server(args.port, '127.0.0.1')
+
+    # Completion time of every update, taken where the queue finishes it
+    finished = {}
+    for queue in main.update_queues.values():
+        def timed(process):
+            async def _process(item, commands):
+                try:
+                    await process(item, commands)
+                finally:
+                    finished[item[1].update_id] = time.perf_counter()
+            return _process
+        queue._process = timed(queue._process)
+
+    if args.pool_warmup:
+        # Let the content pools fill first, as a warmed instance would be
+        await asyncio.sleep(args.pool_warmup)
+    calls_before = {
+        'telegram': dict(bot_api.calls), 'wikipedia': dict(wikipedia.calls), 'openai': openai.calls,
+    }
+
+    commands = list(DEFAULT_MIX)
+    weights = [DEFAULT_MIX[command][1] for command in commands]
+    random.seed(args.seed)
+    sent_at, command_of, acks, statuses = {}, {}, [], defaultdict(int)
+
+    async def post(session, update_id):
+        command = random.choices(commands, weights)[0]
+        bot, _, arguments = DEFAULT_MIX[command]
+        user_id = 10000 + random.randrange(args.users)
+        update = make_command_update(update_id, user_id, command, random.choice(arguments) if arguments else None)
+        started = time.perf_counter()
+        async with session.post(f"http://127.0.0.1:{args.port}/{TOKENS[bot]}", json=update) as response:
+            await response.read()
+        statuses[response.status] += 1
+        if response.status == 200:
+            acks.append(time.perf_counter() - started)
+            sent_at[update_id] = started
+            command_of[update_id] = command
+
+    started = time.perf_counter()
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=args.concurrency)) as session:
+        posts = []
+        for update_id in range(1, args.requests + 1):
+            posts.append(asyncio.create_task(post(session, update_id)))
+            await asyncio.sleep(1 / args.rate)
+        await asyncio.gather(*posts)
+    deadline = time.perf_counter() + args.drain_timeout
+    while any(update_id not in finished for update_id in sent_at) and time.perf_counter() < deadline:
+        await asyncio.sleep(0.05)
+    elapsed = time.perf_counter() - started
+
+    e2e = {update_id: finished[update_id] - sent for update_id, sent in sent_at.items() if update_id in finished}
+    by_command = defaultdict(list)
+    for update_id, latency in e2e.items():
+        by_command[command_of[update_id]].append(latency)
+
+    result = {
+        'name': args.name,
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'baseline', 'verbose')},
+        'sent': args.requests,
+        'statuses': {str(status): count for status, count in statuses.items()},
+        'completed': len(e2e),
+        'elapsed_seconds': round(elapsed, 3),
+        'throughput_per_second': round(len(e2e) / elapsed, 2),
+        'ack_latency_ms': latency_summary(acks),
+        'e2e_latency_ms': latency_summary(list(e2e.values())),
+        'e2e_latency_ms_by_command': {command: latency_summary(values) for command, values in sorted(by_command.items())},
+        'upstream_calls': {
+            'telegram': {
+                method: count - calls_before['telegram'].get(method, 0)
+                for method, count in bot_api.calls.items() if count > calls_before['telegram'].get(method, 0)
+            },
+            'wikipedia': {
+                kind: count - calls_before['wikipedia'].get(kind, 0)
+                for kind, count in wikipedia.calls.items() if count > calls_before['wikipedia'].get(kind, 0)
+            },
+            'openai': openai.calls - calls_before['openai'],
+        },
+        'upstream_errors': {'telegram': bot_api.errors, 'wikipedia': wikipedia.errors, 'openai': openai.errors},
+        'openai_tokens': {'prompt': openai.prompt_tokens, 'completion': openai.completion_tokens},
+        'memory': {
+            'rss_before_mb': round(rss_before, 1),
+            'rss_after_mb': round(rss_mb(), 1),
+            'peak_rss_mb': round(peak_rss_mb(), 1),
+        },
+        'bot_stats': {queue.name: queue.stats() for queue in main.update_queues.values()},
+    }
+
+    await runner.cleanup()
+    await main.stop_bots(remove_webhooks=False)
+    await bot_api.close()
+    await wikipedia_runner.cleanup()
+    await openai_runner.cleanup()
+    return result
+
+
+def lookup(result, path):
+    value = result
+    for key in path.split('.'):
+        value = value.get(key) if isinstance(value, dict) else None
+    return value
+
+
+def compare(result, baseline, tolerance):
+    """Print each tracked metric against the baseline; return the ones that regressed."""
+    regressions = []
+    print(f"compared with {baseline.get('name')} ({baseline.get('commit')}, {baseline.get('timestamp')}):")
+    for path in HIGHER_IS_WORSE + LOWER_IS_WORSE:
+        new, old = lookup(result, path), lookup(baseline, path)
+        if not new or not old:
+            continue
+        change = (new - old) / old
+        worse = change > tolerance if path in HIGHER_IS_WORSE else change < -tolerance
+        if worse:
+            regressions.append(path)
+        print(f"  {path}: {old} -> {new} ({change:+.1%}){'  REGRESSION' if worse else ''}")
+    return regressions
+
+
+def print_summary(result):
+    print(f"{result['name']}: sent {result['sent']}, statuses {result['statuses']}, completed {result['completed']} "
+          f"in {result['elapsed_seconds']}s ({result['throughput_per_second']} updates/s)")
+    for label in ('ack_latency_ms', 'e2e_latency_ms'):
+        summary = result[label]
+        print(f"  {label}: p50 {summary.get('p50')}  p95 {summary.get('p95')}  p99 {summary.get('p99')}")
+    for command, summary in result['e2e_latency_ms_by_command'].items():
+        print(f"    {command}: n={summary['count']} p50 {summary.get('p50')}  p99 {summary.get('p99')}")
+    print(f"  upstream calls: {result['upstream_calls']}")
+    print(f"  memory: {result['memory']}")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--name', default='suite')
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--rate', type=float, default=50, help='updates posted per second')
+    parser.add_argument('--concurrency', type=int, default=100, help='open connections to the webhook')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--drain-timeout', type=float, default=120)
+    parser.add_argument('--no-pools', action='store_true', help='turn the content pools off')
+    parser.add_argument('--pool-warmup', type=float, default=0, help='seconds to let the pools fill before the load')
+    parser.add_argument('--rate-limits', action='store_true', help='keep the per-user rate limits on')
+    for upstream, latency in (('telegram', 0.03), ('wikipedia', 0.05), ('openai', 0.5)):
+        parser.add_argument(f"--{upstream}-latency", type=float, default=latency)
+        parser.add_argument(f"--{upstream}-jitter", type=float, default=latency / 2)
+        parser.add_argument(f"--{upstream}-errors", type=float, default=0.0, help='fraction of calls failing')
+    parser.add_argument('--openai-token-latency', type=float, default=0.0)
+    parser.add_argument('--port', type=int, default=8590)
+    parser.add_argument('--output', help='JSON file for the results (default benchmarks/results/NAME-TIME.json)')
+    parser.add_argument('--baseline', help='earlier results to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='relative change counted as a regression; repeated runs vary by about 10%%')
+    parser.add_argument('--verbose', action='store_true', help='keep INFO logs')
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    print_summary(result)
+
+    output = args.output or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'results', f"{args.name}-{time.strftime('%Y%m%d-%H%M%S')}.json",
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(result, f, indent=2)
+    print(f"results saved to {output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            if compare(result, json.load(f), args.tolerance):
+                sys.exit(1)
+
+
+if __name__ == '__main__':
+    main_cli()
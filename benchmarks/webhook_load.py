@@ -0,0 +1,188 @@
+"""Load test for the webhook ingress.
+
+Posts concurrent fake updates to the webhook route and reports updates per
+second and latency percentiles. Handlers are replaced by a sleep that stands
+in for the Wikipedia/OpenAI wait, so no network access or real tokens are
+needed. Compare the asyncio server against the old Flask bridge with:
+
+    python benchmarks/webhook_load.py --mode aiohttp
+    python benchmarks/webhook_load.py --mode flask
+"""
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+
+import aiohttp
+from aiohttp import web
+from telegram import Update
+from telegram.ext import Application, TypeHandler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+from update_queue import UpdateQueue  # noqa: E402
+
+TOKEN = '123456:benchmark'
+
+
+async def start_fake_bot_api(port, latency=0.0):
+    """Answer getMe (and any other method with True) locally, so applications run without Telegram."""
+    async def call(request):
+        await asyncio.sleep(latency)
+        if request.match_info['method'] == 'getMe':
+            result = {'id': 123456, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'}
+        else:
+            result = True
+        return web.json_response({'ok': True, 'result': result})
+
+    fake_api = web.Application()
+    fake_api.router.add_post('/bot{token}/{method}', call)
+    runner = web.AppRunner(fake_api, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', port).start()
+    return runner
+
+
+async def build_application(handler_latency, bot_api_port):
+    """Build an application whose only handler waits like an upstream call would."""
+    async def slow_handler(update, context):
+        await asyncio.sleep(handler_latency)
+
+    application = (
+        Application.builder()
+        .token(TOKEN)
+        .base_url(f"http://127.0.0.1:{bot_api_port}/bot")
+        .build()
+    )
+    application.add_handler(TypeHandler(Update, slow_handler))
+    await application.initialize()
+    return application
+
+
+def make_update(update_id):
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': 1000 + update_id % 50, 'type': 'private'},
+            'from': {'id': 1000 + update_id % 50, 'is_bot': False, 'first_name': 'Load'},
+            'text': '/fact',
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': 5}],
+        },
+    }
+
+
+def start_flask_bridge(application, port):
+    """Serve the pre-asyncio webhook: one global loop driven by run_until_complete under a lock."""
+    from flask import Flask, request
+
+    app = Flask(__name__)
+    loop = asyncio.new_event_loop()
+    loop_lock = threading.Lock()
+
+    @app.route('/<token>', methods=['POST'])
+    def webhook(token):
+        update = Update.de_json(request.get_json(), application.bot)
+        with loop_lock:
+            loop.run_until_complete(application.process_update(update))
+        return "OK"
+
+    thread = threading.Thread(
+        target=app.run, kwargs={'host': '127.0.0.1', 'port': port, 'threaded': True}
+    )
+    thread.daemon = True
+    thread.start()
+
+
+async def wait_until_up(url):
+    async with aiohttp.ClientSession() as session:
+        for _ in range(100):
+            try:
+                async with session.get(url):
+                    return
+            except aiohttp.ClientError:
+                await asyncio.sleep(0.1)
+    raise RuntimeError(f"Server at {url} did not come up")
+
+
+async def post_updates(url, total, concurrency):
+    """Post `total` updates with at most `concurrency` in flight; return per-request latencies."""
+    latencies = []
+    next_id = iter(range(total))
+
+    rejected = 0
+
+    async def worker(session):
+        nonlocal rejected
+        for update_id in next_id:
+            started = time.perf_counter()
+            async with session.post(url, json=make_update(update_id)) as response:
+                await response.read()
+                if response.status in (429, 503):
+                    rejected += 1
+                    continue
+                if response.status != 200:
+                    raise RuntimeError(f"Unexpected status {response.status}")
+            latencies.append(time.perf_counter() - started)
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return latencies, rejected, elapsed
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def run(args):
+    bot_api = await start_fake_bot_api(args.port + 1)
+    application = await build_application(args.handler_latency, args.port + 1)
+    base_url = f"http://127.0.0.1:{args.port}"
+    runner = None
+
+    if args.mode == 'aiohttp':
+        main.bot_applications[TOKEN] = application
+        main.update_queues[TOKEN] = UpdateQueue(
+            application, 'benchmark', maxsize=args.queue_size, workers=args.workers
+        )
+        main.update_queues[TOKEN].start()
+        runner = await main.run_web_server(args.port)
+    else:
+        start_flask_bridge(application, args.port)
+    await wait_until_up(base_url + '/')
+
+    latencies, rejected, elapsed = await post_updates(f"{base_url}/{TOKEN}", args.requests, args.concurrency)
+
+    if runner is not None:
+        for update_queue in main.update_queues.values():
+            await update_queue.stop()
+        await runner.cleanup()
+    await application.shutdown()
+    await bot_api.cleanup()
+
+    print(f"mode={args.mode} requests={args.requests} concurrency={args.concurrency} "
+          f"handler_latency={args.handler_latency}s")
+    print(f"  throughput: {len(latencies) / elapsed:.1f} updates/s ({rejected} rejected)")
+    print(f"  latency p50: {percentile(latencies, 50) * 1000:.1f} ms")
+    print(f"  latency p99: {percentile(latencies, 99) * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--mode', choices=['aiohttp', 'flask'], default='aiohttp')
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--handler-latency', type=float, default=0.05)
+    parser.add_argument('--queue-size', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=50)
+    parser.add_argument('--port', type=int, default=8089)
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,125 @@
+"""Benchmark Wikipedia article fetches against a local stub server.
+
+Runs concurrent "handlers" that each fetch articles, once with a blocking
+requests.get per call (the original code path) and once through the shared
+pooled async client, and reports per-request latency and handler throughput:
+
+    python benchmarks/wikipedia_fetch.py --handlers 20 --fetches 10 --latency 0.02
+"""
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+import urllib.parse
+
+import requests
+from aiohttp import web
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def article_html(title, paragraphs=40):
+    body = ''.join(f"<p>Paragraph {i} of {title}. " + "Lorem ipsum dolor sit amet. " * 20 + "</p>"
+                   for i in range(paragraphs))
+    return (f"<html><body><h1 id=\"firstHeading\">{title}</h1>"
+            f"<div class=\"mw-parser-output\">{body}</div></body></html>")
+
+
+def start_stub_wikipedia(port, latency):
+    """Serve canned article pages after a fixed delay.
+
+    The stub runs on its own thread and loop so the blocking fetches under
+    test cannot stall it.
+    """
+    async def article(request):
+        await asyncio.sleep(latency)
+        return web.Response(text=article_html(request.match_info['title']), content_type='text/html')
+
+    async def extract(request):
+        await asyncio.sleep(latency)
+        title = request.query['titles']
+        return web.json_response({'query': {'pages': [{
+            'title': title,
+            'fullurl': f"http://127.0.0.1:{port}/wiki/{urllib.parse.quote(title)}",
+            'extract': '\n'.join(f"Paragraph {i} of {title}." for i in range(3)),
+        }]}})
+
+    stub = web.Application()
+    stub.router.add_get('/wiki/{title}', article)
+    stub.router.add_get('/w/api.php', extract)
+    started = threading.Event()
+
+    def serve():
+        loop = asyncio.new_event_loop()
+        runner = web.AppRunner(stub)
+        loop.run_until_complete(runner.setup())
+        loop.run_until_complete(web.TCPSite(runner, '127.0.0.1', port).start())
+        started.set()
+        loop.run_forever()
+
+    threading.Thread(target=serve, daemon=True).start()
+    started.wait()
+
+
+def blocking_get_article(base_url, title):
+    """The original fetch: a fresh connection and a blocking call on the event loop."""
+    response = requests.get(f"{base_url}/wiki/{urllib.parse.quote(title)}")
+    soup = BeautifulSoup(response.text, 'html.parser')
+    paragraphs = soup.find('div', {'class': 'mw-parser-output'}).find_all('p')
+    return ' '.join([p.text for p in paragraphs if p.text.strip()][:3])
+
+
+async def run_handlers(fetch, handlers, fetches):
+    latencies = []
+
+    async def handler(handler_id):
+        for i in range(fetches):
+            started = time.perf_counter()
+            await fetch(f"Article {handler_id}-{i}")
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(handler(h) for h in range(handlers)))
+    return latencies, time.perf_counter() - started
+
+
+def report(label, latencies, elapsed):
+    ordered = sorted(latencies)
+    p50 = ordered[len(ordered) // 2]
+    p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+    print(f"{label}: {len(latencies) / elapsed:.1f} fetches/s, "
+          f"p50 {p50 * 1000:.1f} ms, p99 {p99 * 1000:.1f} ms")
+
+
+async def run(args):
+    base_url = f"http://127.0.0.1:{args.port}"
+    os.environ['WIKIPEDIA_BASE_URL'] = base_url
+    import wiki_facts_bot
+
+    start_stub_wikipedia(args.port, args.latency)
+
+    async def blocking_fetch(title):
+        blocking_get_article(base_url, title)
+
+    async def pooled_fetch(title):
+        article, error = await wiki_facts_bot.get_wiki_article_by_title(title)
+        if error:
+            raise RuntimeError(error)
+
+    print(f"handlers={args.handlers} fetches={args.fetches} stub_latency={args.latency}s")
+    report('blocking requests.get', *await run_handlers(blocking_fetch, args.handlers, args.fetches))
+    await wiki_facts_bot.wikipedia_client.start()
+    report('pooled async client  ', *await run_handlers(pooled_fetch, args.handlers, args.fetches))
+    await wiki_facts_bot.wikipedia_client.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--handlers', type=int, default=20)
+    parser.add_argument('--fetches', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=0.02)
+    parser.add_argument('--port', type=int, default=8095)
+    asyncio.run(run(parser.parse_args()))
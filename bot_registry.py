@@ -0,0 +1,67 @@
+import os
+import json
+import asyncio
+import logging
+import importlib
+from telegram import Bot
+from telegram.ext import Application
+
+logger = logging.getLogger(__name__)
+
+# Bots to run: a JSON list of {"name", "token_env", "module"} entries
+BOTS_CONFIG = os.getenv('BOTS_CONFIG', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bots.json'))
+
+# Bot API endpoint, overridable to point at a local stand-in
+TELEGRAM_API_BASE_URL = os.getenv('TELEGRAM_API_BASE_URL')
+
+class BotSpec:
+    """One configured bot: its name, the env var holding its token and the module implementing it.
+
+    The module must define setup_handlers(application) and may define async
+    on_startup() and on_shutdown() hooks and a stats() function whose dict
+    is merged into /stats.
+    """
+
+    def __init__(self, name, token_env, module):
+        self.name = name
+        self.token_env = token_env
+        self.module_name = module
+        self.token = os.getenv(token_env)
+        self.module = None
+
+    async def load(self):
+        """Import the bot module on first use, in a thread so other bots keep initializing meanwhile."""
+        if self.module is None:
+            self.module = await asyncio.to_thread(importlib.import_module, self.module_name)
+        return self.module
+
+    def build_application(self):
+        builder = Application.builder().token(self.token)
+        if TELEGRAM_API_BASE_URL:
+            builder = builder.base_url(f"{TELEGRAM_API_BASE_URL}/bot")
+        return builder.build()
+
+    async def call_hook(self, hook):
+        """Await the module's hook if it defines one."""
+        func = getattr(self.module, hook, None)
+        if func is not None:
+            await func()
+
+    def stats(self):
+        func = getattr(self.module, 'stats', None)
+        return func() if func is not None else {}
+
+def make_bot(token):
+    """A bare Bot for webhook calls from a process that does not run the bot's handlers."""
+    if TELEGRAM_API_BASE_URL:
+        return Bot(token, base_url=f"{TELEGRAM_API_BASE_URL}/bot")
+    return Bot(token)
+
+def load_specs(path=BOTS_CONFIG):
+    """Read the bot registry, skipping bots whose token is not set."""
+    with open(path) as f:
+        specs = [BotSpec(**entry) for entry in json.load(f)]
+    for spec in specs:
+        if not spec.token:
+            logger.warning(f"{spec.token_env} not set, skipping {spec.name} bot")
+    return [spec for spec in specs if spec.token]
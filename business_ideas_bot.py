@@ -1,21 +1,20 @@
 import os
+import re
+import hashlib
 import logging
 from telegram import Update
 from telegram.ext import Application, CommandHandler, ContextTypes, MessageHandler, filters
 from dotenv import load_dotenv
-import openai
-from flask import Flask
-from threading import Thread
-
-# Initialize Flask app
-app = Flask(__name__)
-
-@app.route('/')
-def home():
-    return "Bots are running!"
-
-def run_flask():
-    app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 8080)))
+from llm_client import llm
+from streaming import StreamingReply
+from send_pipeline import sender
+from response_cache import ResponseCache, normalize_text
+from content_pool import ContentPool
+from batching import LLM_BATCH_SIZE, BatchGenerator, batch_instructions
+from fair_scheduler import fair
+from chat_state import chat_state
+from token_budget import budget, ANALYSIS_INPUT_BUDGET
+from health import health
 
 # Load environment variables
 load_dotenv()
@@ -27,12 +26,21 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Initialize OpenAI client
-openai.api_key = os.getenv('OPENAI_API_KEY')
-
 # Get bot token from environment variable
 BOT_TOKEN = os.getenv('BUSINESS_IDEAS_TELE_TOKEN')
 
+MODEL = "gpt-3.5-turbo"
+SYSTEM_PROMPT = "You are a business consultant with expertise in entrepreneurship and market analysis."
+
+# Bump when the analysis prompt changes so cached analyses are not reused
+ANALYSIS_PROMPT_VERSION = 1
+
+# Analyses of repeated /analyze inputs; near-identical wording shares an answer
+analysis_cache = ResponseCache(
+    'analyses',
+    near_duplicate_threshold=float(os.getenv('ANALYSIS_NEAR_DUPLICATE_THRESHOLD', 0.9))
+)
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Send a message when the command /start is issued."""
     welcome_message = (
@@ -41,10 +49,10 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "detailed analysis for each one.\n\n"
         "Available commands:\n"
         "💡 /idea - Get a new business idea\n"
-        "🔍 /analyze [idea] - Get detailed analysis of a business idea\n"
+        "🔍 /analyze [idea] - Get detailed analysis of a business idea, or of the last one I sent\n"
         "❓ /help - Show all available commands"
     )
-    await update.message.reply_text(welcome_message)
+    await sender.reply(update.message, welcome_message)
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Send a message when the command /help is issued."""
@@ -52,24 +60,13 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "Available commands:\n"
         "/start - Start the bot\n"
         "/idea - Get a new business idea\n"
-        "/analyze [idea] - Get detailed analysis of a business idea\n"
+        "/analyze [idea] - Get detailed analysis of a business idea, or of the last one I sent\n"
         "/help - Show this help message"
     )
-    await update.message.reply_text(help_text)
-
-def generate_business_idea():
-    """Generate a business idea using OpenAI API."""
-    prompt = """Generate a unique and innovative business idea. Include:
-1. Business Name
-2. One-line description
-3. Target market
-4. Key value proposition
-5. Initial investment range
-6. Potential challenges
-7. First steps to start
+    await sender.reply(update.message, help_text)
 
-Format the response as:
-BUSINESS NAME:
+# Layout of one idea; also how batched ideas are checked before use
+IDEA_FORMAT = """BUSINESS NAME:
 [name]
 
 DESCRIPTION:
@@ -90,22 +87,88 @@ CHALLENGES:
 FIRST STEPS:
 [first steps to start]
 """
+IDEA_SECTIONS = re.findall(r'^([A-Z ]+):$', IDEA_FORMAT, re.MULTILINE)
+
+IDEA_CONTENTS = """1. Business Name
+2. One-line description
+3. Target market
+4. Key value proposition
+5. Initial investment range
+6. Potential challenges
+7. First steps to start"""
+
+def build_business_idea_messages():
+    """Build the chat messages asking for a new business idea."""
+    prompt = f"""Generate a unique and innovative business idea. Include:
+{IDEA_CONTENTS}
+
+Format the response as:
+{IDEA_FORMAT}"""
+
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+
+def build_business_ideas_messages(count):
+    """Build the chat messages asking for several different business ideas in one completion."""
+    prompt = f"""Generate {count} unique and innovative business ideas, each in a different industry. For each, include:
+{IDEA_CONTENTS}
+
+{batch_instructions(count)} Format each item as:
+{IDEA_FORMAT}"""
+
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
 
-    response = openai.chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=[
-            {"role": "system", "content": "You are a business consultant with expertise in entrepreneurship and market analysis."},
-            {"role": "user", "content": prompt}
-        ],
+async def generate_business_idea():
+    """Generate a business idea using OpenAI API."""
+    return await llm.chat(
+        'business_ideas',
+        model=MODEL,
+        messages=build_business_idea_messages(),
         max_tokens=500,
         temperature=0.8
     )
-    
-    return response.choices[0].message.content
 
-def analyze_business_idea(idea):
-    """Analyze a business idea using OpenAI API."""
-    prompt = f"""Analyze this business idea: {idea}
+def valid_idea(idea):
+    """True when an idea has every section of IDEA_FORMAT, in order."""
+    positions = [idea.find(f"{section}:") for section in IDEA_SECTIONS]
+    return -1 not in positions and positions == sorted(positions)
+
+# One completion for several pool ideas when LLM_BATCH_SIZE is above 1
+idea_batches = BatchGenerator('ideas')
+
+async def generate_business_ideas(count):
+    """Generate `count` business ideas with one completion, regenerating any that come back malformed."""
+    return await idea_batches.generate(
+        count,
+        lambda count: llm.chat(
+            'business_ideas',
+            model=MODEL,
+            messages=build_business_ideas_messages(count),
+            max_tokens=450 * count,
+            temperature=0.8
+        ),
+        valid_idea,
+        lambda index: generate_business_idea()
+    )
+
+def stream_business_idea():
+    """Stream a business idea as it is generated."""
+    return llm.stream_chat(
+        'business_ideas',
+        model=MODEL,
+        messages=build_business_idea_messages(),
+        max_tokens=500,
+        temperature=0.8
+    )
+
+def build_analysis_messages(idea):
+    """Build the chat messages asking for an analysis of a business idea."""
+    prompt = f"""Analyze this business idea: {budget.fit(idea, ANALYSIS_INPUT_BUDGET)}
 
 Please provide:
 1. Market Analysis
@@ -139,78 +202,140 @@ ACTION PLAN:
 [plan]
 """
 
-    response = openai.chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=[
-            {"role": "system", "content": "You are a business consultant with expertise in entrepreneurship and market analysis."},
-            {"role": "user", "content": prompt}
-        ],
-        max_tokens=800,
-        temperature=0.7
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+
+def analysis_cache_key(idea):
+    return ResponseCache.make_key(MODEL, SYSTEM_PROMPT, ANALYSIS_PROMPT_VERSION, idea)
+
+async def analyze_business_idea(idea):
+    """Analyze a business idea using OpenAI API."""
+    return await analysis_cache.get_or_generate(
+        analysis_cache_key(idea),
+        lambda: llm.chat(
+            'business_ideas',
+            model=MODEL,
+            messages=build_analysis_messages(idea),
+            max_tokens=800,
+            temperature=0.7
+        ),
+        text=idea
     )
-    
-    return response.choices[0].message.content
+
+def stream_business_idea_analysis(idea):
+    """Stream an analysis of a business idea as it is generated."""
+    return analysis_cache.stream(
+        analysis_cache_key(idea),
+        lambda: llm.stream_chat(
+            'business_ideas',
+            model=MODEL,
+            messages=build_analysis_messages(idea),
+            max_tokens=800,
+            temperature=0.7
+        ),
+        text=idea
+    )
+
+def idea_message_parts():
+    """Header and footer placed around the idea in an /idea reply."""
+    header = "💡 *New Business Idea*\n\n"
+    footer = (
+        "\n\nUse /idea to get another business idea!\n"
+        "Use /analyze to get detailed analysis of this idea, or /analyze [idea] for any other."
+    )
+    return header, footer
+
+def idea_name(idea):
+    """The business name of a generated idea, or None if it has none."""
+    match = re.search(r'BUSINESS NAME:\s*(.+)', idea)
+    return match.group(1).strip() if match else None
+
+def idea_key(idea):
+    """Identify an idea by its business name, so the pool does not repeat it."""
+    name = idea_name(idea)
+    if name:
+        return normalize_text(name)
+    return hashlib.sha256(normalize_text(idea).encode()).hexdigest()
+
+async def produce_idea():
+    """Build a complete /idea message for the pool."""
+    idea = await generate_business_idea()
+    header, footer = idea_message_parts()
+    return idea_key(idea), header + idea + footer
+
+async def produce_ideas():
+    """Build LLM_BATCH_SIZE complete /idea messages for the pool from one completion."""
+    header, footer = idea_message_parts()
+    ideas = await generate_business_ideas(LLM_BATCH_SIZE)
+    return [(idea_key(idea), header + idea + footer) for idea in ideas if idea is not None]
+
+# Ready-made /idea replies so most requests skip the LLM call
+idea_pool = ContentPool('ideas', produce_ideas if LLM_BATCH_SIZE > 1 else produce_idea)
 
 async def idea(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Send a new business idea."""
+    reply = StreamingReply(update.message)
     try:
+        # Serve a pre-generated idea when one is ready
+        message = idea_pool.pop()
+        header, footer = idea_message_parts()
+        if message is not None:
+            await reply.send(message)
+            chat_state.update(update.effective_chat.id, last_idea=message[len(header):len(message) - len(footer)])
+            return
+
         # Send "typing" action
         await update.message.chat.send_action(action="typing")
+        await reply.start("💡 Coming up with a business idea...")
         
-        # Generate business idea
-        idea = generate_business_idea()
-        
-        # Format the message
-        message = (
-            f"💡 *New Business Idea*\n\n"
-            f"{idea}\n\n"
-            "Use /idea to get another business idea!\n"
-            "Use /analyze [idea] to get detailed analysis of any business idea."
-        )
-        
-        await update.message.reply_text(
-            message,
-            parse_mode='Markdown'
-        )
+        # Generate business idea, showing it as it is written
+        generated = await reply.stream(stream_business_idea(), header, footer)
+        chat_state.update(update.effective_chat.id, last_idea=generated)
         
     except Exception as e:
         logger.error(f"Error in idea command: {str(e)}")
-        await update.message.reply_text(
+        await reply.fail(
             "Sorry, I encountered an error while generating the business idea. "
             "Please try again with /idea"
         )
 
 async def analyze(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle the /analyze command with a business idea."""
-    if not context.args:
-        await update.message.reply_text(
-            "Please provide a business idea to analyze.\n"
-            "Example: /analyze A mobile app for pet sitting services"
-        )
-        return
-
-    idea = ' '.join(context.args)
+    if context.args:
+        idea = ' '.join(context.args)
+        title = idea
+    else:
+        # Without an argument, analyze the last idea sent to this chat
+        record = chat_state.get(update.effective_chat.id)
+        if record is None or record.last_idea is None:
+            await sender.reply(
+                update.message,
+                "Please provide a business idea to analyze.\n"
+                "Example: /analyze A mobile app for pet sitting services\n"
+                "Or get one with /idea and send /analyze on its own."
+            )
+            return
+        idea = record.last_idea
+        title = idea_name(idea) or "your last idea"
+
+    reply = StreamingReply(update.message)
     await update.message.chat.send_action(action="typing")
     
     try:
-        # Generate analysis
-        analysis = analyze_business_idea(idea)
-        
-        # Format the message
-        message = (
-            f"🔍 *Analysis for: {idea}*\n\n"
-            f"{analysis}\n\n"
-            "Use /analyze [idea] to analyze another business idea!"
-        )
-        
-        await update.message.reply_text(
-            message,
-            parse_mode='Markdown'
+        await reply.start("🔍 Analyzing your business idea...")
+
+        # Generate analysis, showing it as it is written
+        await reply.stream(
+            stream_business_idea_analysis(idea),
+            header=f"🔍 *Analysis for: {title}*\n\n",
+            footer="\n\nUse /analyze [idea] to analyze another business idea!"
         )
         
     except Exception as e:
         logger.error(f"Error in analyze command: {str(e)}")
-        await update.message.reply_text(
+        await reply.fail(
             "Sorry, I encountered an error while analyzing your business idea. "
             "Please try again with a different idea."
         )
@@ -219,5 +344,22 @@ def setup_handlers(application):
     """Set up the handlers for this bot"""
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("help", help_command))
-    application.add_handler(CommandHandler("idea", idea))
-    application.add_handler(CommandHandler("analyze", analyze)) 
\ No newline at end of file
+    application.add_handler(CommandHandler("idea", fair(idea)))
+    application.add_handler(CommandHandler("analyze", fair(analyze))) 
+
+async def on_startup():
+    """Start pre-generating business ideas and register the pool for warm-up."""
+    idea_pool.start()
+    health.add('idea_pool', idea_pool.warm, lambda: {'size': len(idea_pool.items)})
+
+async def on_shutdown():
+    """Stop pre-generating business ideas."""
+    await idea_pool.stop()
+
+def stats():
+    """Cache and pool counts for /stats."""
+    return {
+        'analysis_cache': analysis_cache.stats(),
+        'idea_pool': idea_pool.stats(),
+        'idea_batches': idea_batches.stats(),
+    }
@@ -0,0 +1,176 @@
+import os
+import sys
+import time
+import logging
+from collections import OrderedDict
+from jsonl_log import JsonLinesLog
+from dispatcher import WORKER_INDEX
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on the memory held by per-chat state; least recently used chats go first
+CHAT_STATE_MAX_BYTES = int(os.getenv('CHAT_STATE_MAX_BYTES', 8 * 1024 * 1024))
+# Chats idle for longer than this are forgotten
+CHAT_STATE_TTL = float(os.getenv('CHAT_STATE_TTL', 7 * 24 * 3600))
+# Append-only log that state is replayed from on restart; empty keeps state in memory only
+CHAT_STATE_PATH = os.getenv('CHAT_STATE_PATH', '')
+# Chats always go to the same worker, so each worker keeps its own log
+if CHAT_STATE_PATH and WORKER_INDEX is not None:
+    CHAT_STATE_PATH = f"{CHAT_STATE_PATH}.{WORKER_INDEX}"
+# Seconds between writes of buffered changes to the log
+CHAT_STATE_FLUSH_INTERVAL = float(os.getenv('CHAT_STATE_FLUSH_INTERVAL', 1.0))
+
+# Bytes a record costs beyond its own slots and strings: its OrderedDict entry, key and timestamp
+RECORD_OVERHEAD = 160
+
+class ChatState:
+    """Recent context of one chat."""
+    __slots__ = ('chat_id', 'last_idea', 'last_article', 'updated', 'size')
+
+    FIELDS = ('last_idea', 'last_article')
+
+    def __init__(self, chat_id):
+        self.chat_id = chat_id
+        self.last_idea = None
+        self.last_article = None
+        self.updated = 0.0
+        self.size = 0
+
+    def measure(self):
+        """Approximate bytes held by this record, its strings and its slot in the store."""
+        self.size = sys.getsizeof(self) + RECORD_OVERHEAD + sum(
+            sys.getsizeof(getattr(self, field)) for field in self.FIELDS if getattr(self, field) is not None
+        )
+        return self.size
+
+    def to_dict(self):
+        record = {'chat': self.chat_id, 'updated': self.updated}
+        for field in self.FIELDS:
+            if getattr(self, field) is not None:
+                record[field] = getattr(self, field)
+        return record
+
+class ChatStateStore:
+    """Per-chat context such as the last idea or article, bounded by total size.
+
+    Records live in an LRU ordered dict; once their estimated size passes
+    max_bytes the least recently used chats are evicted. With a log path,
+    every change is appended to a JSON-lines log in the background and
+    replayed by load(), so context survives restarts. The log is rewritten
+    with one line per chat when it grows well past the live state.
+    """
+
+    def __init__(self, max_bytes=CHAT_STATE_MAX_BYTES, ttl=CHAT_STATE_TTL, path=CHAT_STATE_PATH,
+                 flush_interval=CHAT_STATE_FLUSH_INTERVAL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.records = OrderedDict()
+        self.bytes = 0
+        self.log = JsonLinesLog(
+            'chat state', path,
+            lambda: [record.to_dict() for record in self.records.values()],
+            lambda: len(self.records),
+            flush_interval,
+        )
+
+        # Counters exposed through stats()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def path(self):
+        return self.log.path
+
+    @path.setter
+    def path(self, path):
+        self.log.path = path
+
+    def _remove(self, chat_id):
+        record = self.records.pop(chat_id)
+        self.bytes -= record.size
+
+    def _put(self, record):
+        if record.chat_id in self.records:
+            self.bytes -= self.records[record.chat_id].size
+        self.records[record.chat_id] = record
+        self.records.move_to_end(record.chat_id)
+        self.bytes += record.measure()
+        while self.bytes > self.max_bytes and len(self.records) > 1:
+            self._remove(next(iter(self.records)))
+            self.evictions += 1
+
+    def get(self, chat_id):
+        """Return the chat's record, or None when nothing recent is known about it."""
+        record = self.records.get(chat_id)
+        if record is not None and time.time() - record.updated > self.ttl:
+            self._remove(chat_id)
+            record = None
+        if record is None:
+            self.misses += 1
+            return None
+        self.records.move_to_end(chat_id)
+        self.hits += 1
+        return record
+
+    def update(self, chat_id, **fields):
+        """Set some of ChatState.FIELDS for a chat and queue the change for the log."""
+        record = self.records.get(chat_id) or ChatState(chat_id)
+        for field, value in fields.items():
+            if field not in ChatState.FIELDS:
+                raise ValueError(f"Unknown chat state field: {field}")
+            setattr(record, field, value)
+        record.updated = time.time()
+        self._put(record)
+        self.log.record(chat_id, record.to_dict())
+
+    async def load(self):
+        """Replay the log, keep the live records and rewrite it compacted; no-op without a path."""
+        if not self.path:
+            return
+        entries = await self.log.read()
+        if entries is None:
+            # Keep the unreadable log rather than compacting it to nothing
+            return
+        now = time.time()
+        for entry in entries:
+            if now - entry['updated'] > self.ttl:
+                continue
+            record = ChatState(entry['chat'])
+            for field in ChatState.FIELDS:
+                setattr(record, field, entry.get(field))
+            record.updated = entry['updated']
+            self._put(record)
+        try:
+            await self.log.compact()
+        except OSError as e:
+            logger.error(f"Error compacting chat state in {self.path}: {str(e)}")
+        logger.info(f"Loaded chat state for {len(self.records)} chats from {self.path}")
+
+    async def flush(self):
+        """Append buffered changes to the log, compacting it when it has grown too long."""
+        await self.log.flush()
+
+    async def start(self):
+        """Load saved state and start writing changes to the log."""
+        if self.path and self.log.task is None:
+            await self.load()
+            self.log.start()
+
+    async def stop(self):
+        await self.log.stop()
+
+    def stats(self):
+        return {
+            'chats': len(self.records),
+            'bytes': self.bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'writes': self.log.writes,
+            'write_errors': self.log.write_errors,
+        }
+
+# Shared instance used by every bot module
+chat_state = ChatStateStore()
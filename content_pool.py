@@ -0,0 +1,147 @@
+import os
+import asyncio
+import logging
+from collections import deque
+from llm_client import llm
+from metrics import record_cache
+from shared_state import state
+from recent_keys import RecentKeys
+
+logger = logging.getLogger(__name__)
+
+# Pool settings, overridable per deployment
+CONTENT_POOL_ENABLED = os.getenv('CONTENT_POOL_ENABLED', 'true').lower() == 'true'
+CONTENT_POOL_LOW_WATERMARK = int(os.getenv('CONTENT_POOL_LOW_WATERMARK', 2))
+CONTENT_POOL_HIGH_WATERMARK = int(os.getenv('CONTENT_POOL_HIGH_WATERMARK', 5))
+CONTENT_POOL_DEDUP_WINDOW = int(os.getenv('CONTENT_POOL_DEDUP_WINDOW', 500))
+# How long a pooled key is reserved across processes when state is shared
+CONTENT_POOL_DEDUP_TTL = float(os.getenv('CONTENT_POOL_DEDUP_TTL', 24 * 3600))
+
+# Seconds to wait between refill attempts while the LLM client is busy or failing
+REFILL_BACKOFF = 5
+REFILL_BACKOFF_MAX = 300
+
+class ContentPool:
+    """Bounded pool of ready-to-send messages, refilled in the background.
+
+    produce() is an async callable returning (dedup_key, message), or a list
+    of such pairs when it generates several items in one request. Handlers
+    pop() a message in O(1) and fall back to live generation when the pool is
+    empty. Refilling starts once the pool drops to the low watermark and stops
+    at the high watermark. It only produces while the LLM client has spare
+    capacity, so pre-generation never delays user requests, and it skips
+    anything whose key was pooled or served within the dedup window. With a
+    shared state backend, keys are also reserved across processes so pools
+    in different workers do not serve the same item.
+    """
+
+    def __init__(self, name, produce, low_watermark=CONTENT_POOL_LOW_WATERMARK,
+                 high_watermark=CONTENT_POOL_HIGH_WATERMARK,
+                 dedup_window=CONTENT_POOL_DEDUP_WINDOW, enabled=CONTENT_POOL_ENABLED):
+        self.name = name
+        self.produce = produce
+        self.low_watermark = low_watermark
+        self.high_watermark = max(high_watermark, low_watermark + 1)
+        self.enabled = enabled
+        self.items = deque()
+        self.recent_keys = RecentKeys(dedup_window)
+        self.refill_needed = asyncio.Event()
+        self.item_added = asyncio.Event()
+        self.task = None
+
+        # Counters exposed through stats()
+        self.hits = 0
+        self.misses = 0
+        self.produced = 0
+        self.duplicates = 0
+        self.errors = 0
+
+    def start(self):
+        """Start the background producer on the running event loop."""
+        if self.enabled and self.task is None:
+            self.refill_needed.set()
+            self.task = asyncio.create_task(self._refill_loop(), name=f"{self.name}-pool")
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    async def warm(self, min_items=1):
+        """Top the pool up and wait until it holds min_items; returns at once if the pool is off."""
+        if self.task is None:
+            return
+        if len(self.items) < self.high_watermark:
+            self.refill_needed.set()
+        while len(self.items) < min_items:
+            self.item_added.clear()
+            await self.item_added.wait()
+
+    def pop_with_key(self):
+        """Return a ready (dedup_key, message), or None when the caller should generate live."""
+        if self.items:
+            item = self.items.popleft()
+            self.hits += 1
+            record_cache(self.name, 'hit')
+        else:
+            item = None
+            self.misses += 1
+            record_cache(self.name, 'miss')
+        if len(self.items) <= self.low_watermark:
+            self.refill_needed.set()
+        return item
+
+    def pop(self):
+        """Return a ready message, or None when the caller should generate live."""
+        item = self.pop_with_key()
+        return item[1] if item is not None else None
+
+    async def _reserve_shared(self, key):
+        if not state.shared:
+            return True
+        return await state.set_if_absent(f"pool:{self.name}:{key}", '1', ttl=CONTENT_POOL_DEDUP_TTL)
+
+    async def _add(self, key, message):
+        if key in self.recent_keys or not await self._reserve_shared(key):
+            self.duplicates += 1
+            return
+        self.recent_keys.add(key)
+        self.items.append((key, message))
+        self.item_added.set()
+        self.produced += 1
+
+    async def _refill_loop(self):
+        backoff = REFILL_BACKOFF
+        while True:
+            await self.refill_needed.wait()
+            while len(self.items) < self.high_watermark:
+                if not llm.has_spare_capacity():
+                    await asyncio.sleep(REFILL_BACKOFF)
+                    continue
+                try:
+                    produced = await self.produce()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self.errors += 1
+                    logger.error(f"Error refilling {self.name} pool: {str(e)}")
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, REFILL_BACKOFF_MAX)
+                    continue
+                backoff = REFILL_BACKOFF
+                for key, message in produced if isinstance(produced, list) else [produced]:
+                    await self._add(key, message)
+            self.refill_needed.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self.items),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'produced': self.produced,
+            'duplicates': self.duplicates,
+            'errors': self.errors,
+        }
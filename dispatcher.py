@@ -0,0 +1,176 @@
+import os
+import zlib
+import asyncio
+import logging
+import multiprocessing
+from contextlib import asynccontextmanager
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+# Worker processes behind the webhook port; 1 runs everything in one process
+WORKER_PROCESSES = int(os.getenv('WORKER_PROCESSES', 1))
+# Local worker i listens on WORKER_BASE_PORT + i
+WORKER_BASE_PORT = int(os.getenv('WORKER_BASE_PORT', 9100))
+# Comma-separated base URLs of worker instances started elsewhere with BOT_ROLE=worker
+WORKER_URLS = [url.strip().rstrip('/') for url in os.getenv('WORKER_URLS', '').split(',') if url.strip()]
+# This worker's position and how many share the bots; set by the front for the workers it
+# spawns, and by hand for BOT_ROLE=worker instances
+WORKER_INDEX = int(os.environ['WORKER_INDEX']) if os.getenv('WORKER_INDEX') else None
+WORKER_COUNT = int(os.getenv('WORKER_COUNT', 1))
+
+# Open connections from the front to the workers
+FORWARD_CONNECTIONS = int(os.getenv('FORWARD_CONNECTIONS', 100))
+
+def chat_id_of(data):
+    """Find the chat an update belongs to in its raw JSON, falling back to the sender."""
+    for kind, payload in data.items():
+        if not isinstance(payload, dict):
+            continue
+        chat = payload.get('chat') or (payload.get('message') or {}).get('chat')
+        if chat:
+            return chat['id']
+        user = payload.get('from') or payload.get('user')
+        if user:
+            return user['id']
+    return None
+
+def route(chat_id, workers):
+    """Pick a worker for a chat; the same chat always lands on the same worker."""
+    return zlib.crc32(str(chat_id).encode()) % workers
+
+class ChatLocks:
+    """FIFO lock per chat, dropped once no update for that chat is waiting."""
+
+    def __init__(self):
+        self.locks = {}
+
+    @asynccontextmanager
+    async def hold(self, chat_id):
+        if chat_id is None:
+            yield
+            return
+        lock, users = self.locks.get(chat_id, (None, 0))
+        if lock is None:
+            lock = asyncio.Lock()
+        self.locks[chat_id] = (lock, users + 1)
+        try:
+            async with lock:
+                yield
+        finally:
+            lock, users = self.locks[chat_id]
+            if users == 1:
+                del self.locks[chat_id]
+            else:
+                self.locks[chat_id] = (lock, users - 1)
+
+class Dispatcher:
+    """Forward webhook updates to worker processes, routed by chat.
+
+    Forwards for one chat are sent one at a time, so each worker queues a
+    chat's updates in the order Telegram delivered them.
+    """
+
+    def __init__(self, urls):
+        self.urls = urls
+        self.session = None
+        self.chat_locks = ChatLocks()
+
+        # Counters exposed through stats()
+        self.forwarded = [0] * len(urls)
+        self.rejected = [0] * len(urls)
+        self.unreachable = [0] * len(urls)
+
+    async def start(self):
+        # aiohttp rather than the httpx PooledClient: this hop is on every update, and
+        # httpx's pool throughput drops sharply with many concurrent requests
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=FORWARD_CONNECTIONS),
+            timeout=aiohttp.ClientTimeout(total=10),
+        )
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def wait_ready(self, timeout=60):
+        """Wait until every worker answers, e.g. after spawning them."""
+        async def ready(url):
+            while True:
+                try:
+                    async with self.session.get(url + '/'):
+                        return
+                except aiohttp.ClientConnectionError:
+                    await asyncio.sleep(0.2)
+        await asyncio.wait_for(asyncio.gather(*(ready(url) for url in self.urls)), timeout)
+
+    async def forward(self, token, body, chat_id, update_id=None):
+        """Hand an update to its worker; returns the worker's HTTP status, or 503 if it is unreachable."""
+        # Updates without a chat have no ordering to keep, so spread them by update_id
+        index = route(chat_id if chat_id is not None else update_id, len(self.urls))
+        async with self.chat_locks.hold(chat_id):
+            try:
+                async with self.session.post(
+                    f"{self.urls[index]}/{token}", data=body, headers={'Content-Type': 'application/json'},
+                ) as response:
+                    await response.read()
+                    status = response.status
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self.unreachable[index] += 1
+                logger.error(f"Error forwarding update to worker {index}: {str(e)}")
+                return 503
+        if status == 200:
+            self.forwarded[index] += 1
+        else:
+            self.rejected[index] += 1
+        return status
+
+    async def worker_stats(self):
+        """Collect /stats from every worker."""
+        async def fetch(url):
+            try:
+                async with self.session.get(url + '/stats') as response:
+                    return await response.json()
+            except Exception as e:
+                return {'error': str(e)}
+        return await asyncio.gather(*(fetch(url) for url in self.urls))
+
+    def stats(self):
+        return [
+            {
+                'url': url,
+                'forwarded': self.forwarded[i],
+                'rejected': self.rejected[i],
+                'unreachable': self.unreachable[i],
+            }
+            for i, url in enumerate(self.urls)
+        ]
+
+def spawn_workers(count, target, base_port=WORKER_BASE_PORT):
+    """Start `count` local worker processes running target(index, port); returns them and their URLs."""
+    # Spawn rather than fork so workers do not inherit the parent's event loop and sockets
+    context = multiprocessing.get_context('spawn')
+    processes, urls = [], []
+    # A spawned process takes the environment at start, so each worker's modules see its index on import
+    os.environ['WORKER_COUNT'] = str(count)
+    for index in range(count):
+        port = base_port + index
+        os.environ['WORKER_INDEX'] = str(index)
+        process = context.Process(target=target, args=(index, port), name=f"bot-worker-{index}", daemon=True)
+        process.start()
+        processes.append(process)
+        urls.append(f"http://127.0.0.1:{port}")
+    del os.environ['WORKER_INDEX']
+    logger.info(f"Started {count} worker processes on ports {base_port}-{base_port + count - 1}")
+    return processes, urls
+
+async def stop_workers(processes, timeout=15):
+    """Ask worker processes to finish their queues and exit, killing any that hang."""
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        await asyncio.to_thread(process.join, timeout)
+        if process.is_alive():
+            logger.warning(f"{process.name} did not exit, killing it")
+            process.kill()
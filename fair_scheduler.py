@@ -0,0 +1,174 @@
+import os
+import time
+import asyncio
+import logging
+import functools
+from collections import OrderedDict, deque
+from telegram import Update
+from telegram.ext import ContextTypes
+from metrics import RATE_LIMITED, request_labels
+from rate_buckets import RateBuckets
+from send_pipeline import sender
+
+logger = logging.getLogger(__name__)
+
+# Token buckets for the LLM-backed commands: sustained requests per minute and burst size
+RATE_LIMIT_USER_PER_MINUTE = float(os.getenv('RATE_LIMIT_USER_PER_MINUTE', 6))
+RATE_LIMIT_USER_BURST = float(os.getenv('RATE_LIMIT_USER_BURST', 3))
+RATE_LIMIT_CHAT_PER_MINUTE = float(os.getenv('RATE_LIMIT_CHAT_PER_MINUTE', 20))
+RATE_LIMIT_CHAT_BURST = float(os.getenv('RATE_LIMIT_CHAT_BURST', 10))
+
+# LLM-backed handlers running at once, shared round-robin between users
+FAIR_CONCURRENCY = int(os.getenv('FAIR_CONCURRENCY', os.getenv('LLM_MAX_CONCURRENCY', 8)))
+# Comma-separated user_id:weight pairs; a user with weight 3 gets three turns per round
+FAIR_USER_WEIGHTS = {
+    int(user): int(weight)
+    for user, weight in (pair.split(':') for pair in os.getenv('FAIR_USER_WEIGHTS', '').split(',') if pair.strip())
+}
+
+class FairScheduler:
+    """Rate limits and weighted round-robin turns for the LLM-backed handlers.
+
+    Each request first needs a token from its user's and its chat's bucket;
+    without one it gets a short "try again in Ns" reply and nothing upstream
+    is called. Admitted requests then wait for one of `concurrency` turns,
+    which are handed out round-robin between the users waiting, `weight`
+    turns per user per round, so one busy user queues behind their own
+    requests rather than everyone else's. State for idle users is dropped.
+    """
+
+    def __init__(self, concurrency: int = FAIR_CONCURRENCY, weights=None,
+                 user_buckets: RateBuckets = None, chat_buckets: RateBuckets = None):
+        self.free = concurrency
+        self.concurrency = concurrency
+        self.weights = FAIR_USER_WEIGHTS if weights is None else weights
+        if user_buckets is None:
+            user_buckets = RateBuckets(RATE_LIMIT_USER_PER_MINUTE, RATE_LIMIT_USER_BURST)
+        if chat_buckets is None:
+            chat_buckets = RateBuckets(RATE_LIMIT_CHAT_PER_MINUTE, RATE_LIMIT_CHAT_BURST)
+        self.user_buckets = user_buckets
+        self.chat_buckets = chat_buckets
+        # Users with requests waiting for a turn, in round-robin order -> their waiters
+        self.waiting = OrderedDict()
+        # Turns left in the current round for the user at the front
+        self.turns_left = {}
+
+        # Counters exposed through stats()
+        self.admitted = 0
+        self.limited = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def check(self, user_id, chat_id):
+        """Take a token for the user and the chat, or return the seconds until both have one."""
+        now = time.monotonic()
+        wait = max(
+            self.user_buckets.wait_time(user_id, now),
+            self.chat_buckets.wait_time(chat_id, now) if chat_id is not None else 0.0,
+        )
+        if wait > 0:
+            return wait
+        self.user_buckets.take(user_id, now)
+        if chat_id is not None:
+            self.chat_buckets.take(chat_id, now)
+        return 0.0
+
+    async def acquire(self, user_id):
+        """Wait for this user's turn."""
+        if self.free and not self.waiting:
+            self.free -= 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiting.setdefault(user_id, deque()).append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The turn was granted as we were cancelled; pass it on
+                self.release()
+            else:
+                self._discard(user_id, waiter)
+            raise
+
+    def release(self):
+        """Hand the finished turn to the next user in the round, or free it."""
+        while self.waiting:
+            user_id, waiters = next(iter(self.waiting.items()))
+            waiter = waiters.popleft()
+            turns = self.turns_left.pop(user_id, self.weights.get(user_id, 1)) - 1
+            if not waiters:
+                del self.waiting[user_id]
+            elif turns <= 0:
+                self.waiting.move_to_end(user_id)
+            else:
+                self.turns_left[user_id] = turns
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.free += 1
+
+    def _discard(self, user_id, waiter):
+        waiters = self.waiting.get(user_id)
+        if waiters is None:
+            return
+        try:
+            waiters.remove(waiter)
+        except ValueError:
+            return
+        if not waiters:
+            del self.waiting[user_id]
+            self.turns_left.pop(user_id, None)
+
+    def wrap(self, handler):
+        """Put an LLM-backed command handler behind the rate limits and fair turns."""
+        @functools.wraps(handler)
+        async def limited(update: Update, context: ContextTypes.DEFAULT_TYPE):
+            user = update.effective_user
+            chat = update.effective_chat
+            if user is None:
+                return await handler(update, context)
+
+            wait = self.check(user.id, chat.id if chat else None)
+            if wait > 0:
+                self.limited += 1
+                RATE_LIMITED.labels(*request_labels.get()).inc()
+                # One notice per limited stretch, so spamming does not cost a message each time
+                if self.user_buckets.notify(user.id, time.monotonic(), wait):
+                    await sender.reply(
+                        update.effective_message,
+                        f"⏳ You're sending requests too quickly. Please try again in {max(1, round(wait))}s."
+                    )
+                return
+
+            started = time.monotonic()
+            await self.acquire(user.id)
+            waited = time.monotonic() - started
+            self.admitted += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+            try:
+                return await handler(update, context)
+            finally:
+                self.release()
+        return limited
+
+    def stats(self):
+        return {
+            'admitted': self.admitted,
+            'limited': self.limited,
+            'running': self.concurrency - self.free,
+            'waiting': sum(len(waiters) for waiters in self.waiting.values()),
+            'waiting_users': len(self.waiting),
+            'avg_wait_seconds': self.total_wait / self.admitted if self.admitted else 0.0,
+            'max_wait_seconds': self.max_wait,
+            'tracked_users': len(self.user_buckets),
+            'tracked_chats': len(self.chat_buckets),
+            'evicted': self.user_buckets.evicted + self.chat_buckets.evicted,
+        }
+
+# Shared by every bot, like the LLM client whose slots it divides up
+scheduler = FairScheduler()
+
+def fair(handler):
+    """Decorator form of scheduler.wrap for handler registration."""
+    return scheduler.wrap(handler)
@@ -0,0 +1,191 @@
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+# Seconds between warm-ups; kept under upstream keep-alive idle timeouts so pooled connections stay open
+WARMUP_INTERVAL = float(os.getenv('WARMUP_INTERVAL', 45))
+# Longest start-up waits to be warm before registering webhooks anyway
+WARMUP_TIMEOUT = float(os.getenv('WARMUP_TIMEOUT', 30))
+
+# /healthz reports degraded past these
+HEALTH_LOOP_LAG_MS = float(os.getenv('HEALTH_LOOP_LAG_MS', 250))
+HEALTH_QUEUE_FULL_RATIO = float(os.getenv('HEALTH_QUEUE_FULL_RATIO', 0.9))
+
+# Public URL requested now and then so a free-tier instance is not put to sleep
+SERVER_URL = os.getenv('SERVER_URL')
+KEEPALIVE_INTERVAL = float(os.getenv('KEEPALIVE_INTERVAL', 840))
+
+class LoopLag:
+    """Measure event loop lag as how late a periodic sleep wakes up."""
+
+    def __init__(self, interval=0.5, window=120):
+        self.interval = interval
+        self.samples = deque(maxlen=window)
+        self.task = None
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self._sample(), name='loop-lag')
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    async def _sample(self):
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, time.monotonic() - started - self.interval))
+
+    def stats(self):
+        """Latest and worst lag over the last minute, in milliseconds."""
+        return {
+            'last_ms': round(self.samples[-1] * 1000, 2) if self.samples else 0.0,
+            'max_ms': round(max(self.samples) * 1000, 2) if self.samples else 0.0,
+        }
+
+class WarmTarget:
+    def __init__(self, name, warm, stats=None):
+        self.name = name
+        self.warm = warm
+        self.stats = stats
+        self.ok = None
+        self.seconds = None
+        self.error = None
+        self.warmed_at = None
+        self.failures = 0
+
+class HealthMonitor:
+    """Keep upstream connections and content pools warm and report readiness.
+
+    Bot modules and main register warm-up targets: an async callable that
+    opens or exercises an upstream (the Wikipedia pool, the OpenAI client,
+    each bot's Telegram client) or fills a content pool, plus an optional
+    stats callable for /healthz. start() warms everything once, up to
+    WARMUP_TIMEOUT, and then marks the process ready, so webhooks are only
+    registered once the first request would find warm connections. After
+    that every target is warmed again each WARMUP_INTERVAL, so a request
+    after a quiet spell is as fast as one during steady traffic.
+    """
+
+    def __init__(self, interval=WARMUP_INTERVAL, timeout=WARMUP_TIMEOUT):
+        self.interval = interval
+        self.timeout = timeout
+        self.targets = {}
+        self.loop_lag = LoopLag()
+        self.ready = asyncio.Event()
+        self.task = None
+        self.keepalive_task = None
+
+        # Counters exposed through stats()
+        self.rounds = 0
+
+    def add(self, name, warm, stats=None):
+        """Register a warm-up target; re-adding a name replaces it."""
+        self.targets[name] = WarmTarget(name, warm, stats)
+
+    async def _warm(self, target):
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(target.warm(), self.timeout)
+            target.ok, target.error = True, None
+        except Exception as e:
+            target.ok, target.error = False, str(e) or type(e).__name__
+            target.failures += 1
+            logger.warning(f"Warming {target.name} failed: {target.error}")
+        target.seconds = time.monotonic() - started
+        target.warmed_at = time.time()
+
+    async def warm_all(self):
+        await asyncio.gather(*(self._warm(target) for target in list(self.targets.values())))
+        self.rounds += 1
+
+    async def start(self):
+        """Warm every target once, mark the process ready and keep warming in the background."""
+        self.loop_lag.start()
+        started = time.monotonic()
+        await self.warm_all()
+        self.ready.set()
+        warm = [name for name, target in self.targets.items() if target.ok]
+        logger.info(f"Warm after {time.monotonic() - started:.1f}s ({', '.join(warm) or 'nothing'} ready)")
+        self.task = asyncio.create_task(self._rewarm(), name='warm-up')
+        if SERVER_URL:
+            self.keepalive_task = asyncio.create_task(self._keepalive(), name='keepalive')
+
+    async def stop(self):
+        for task in (self.task, self.keepalive_task):
+            if task is not None:
+                task.cancel()
+        await asyncio.gather(*(t for t in (self.task, self.keepalive_task) if t is not None), return_exceptions=True)
+        self.task = self.keepalive_task = None
+        await self.loop_lag.stop()
+
+    async def _rewarm(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.warm_all()
+
+    async def _keepalive(self):
+        """Request SERVER_URL like an outside visitor would, replacing the old ping thread."""
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30)) as session:
+            while True:
+                await asyncio.sleep(KEEPALIVE_INTERVAL)
+                try:
+                    async with session.get(SERVER_URL) as response:
+                        logger.info(f"Ping response: {response.status}")
+                except Exception as e:
+                    logger.error(f"Error pinging server: {str(e)}")
+
+    def report(self, queues):
+        """Health of the loop, the update queues and the warmed upstreams, with an overall status."""
+        problems = []
+        lag = self.loop_lag.stats()
+        if lag['max_ms'] > HEALTH_LOOP_LAG_MS:
+            problems.append('loop_lag')
+
+        queue_report = {}
+        for queue in queues:
+            depth, maxsize = queue.depth(), queue.queue.maxsize
+            queue_report[queue.name] = {'depth': depth, 'maxsize': maxsize}
+            if maxsize and depth >= maxsize * HEALTH_QUEUE_FULL_RATIO:
+                problems.append(f"queue:{queue.name}")
+
+        upstreams = {}
+        for name, target in self.targets.items():
+            entry = {
+                'ok': target.ok,
+                'warm_seconds': round(target.seconds, 3) if target.seconds is not None else None,
+                'age_seconds': round(time.time() - target.warmed_at, 1) if target.warmed_at else None,
+                'failures': target.failures,
+            }
+            if target.error:
+                entry['error'] = target.error
+            if target.stats is not None:
+                entry.update(target.stats())
+            upstreams[name] = entry
+            if target.ok is False:
+                problems.append(name)
+
+        if not self.ready.is_set():
+            status = 'warming'
+        else:
+            status = 'degraded' if problems else 'ok'
+        return {
+            'status': status,
+            'ready': self.ready.is_set(),
+            'problems': problems,
+            'loop_lag': lag,
+            'queues': queue_report,
+            'upstreams': upstreams,
+            'warm_rounds': self.rounds,
+        }
+
+# Shared by every bot in the process
+health = HealthMonitor()
@@ -0,0 +1,104 @@
+import os
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+import httpx
+from metrics import track_stage
+import tracing
+
+logger = logging.getLogger(__name__)
+
+# Identify ourselves to upstream APIs, as the Wikimedia API etiquette asks
+USER_AGENT = os.getenv('HTTP_USER_AGENT', 'telebots/1.0 (https://github.com/NKTeo/telebots)')
+
+# Seconds an idle pooled connection is kept; httpx's default of 5 closes them between warm-ups
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv('HTTP_KEEPALIVE_EXPIRY', 120))
+
+def http2_available():
+    """HTTP/2 needs the optional h2 package."""
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+class PooledClient:
+    """Shared async HTTP client with keep-alive pooling, timeouts and a concurrency limit."""
+
+    def __init__(self, name: str, timeout: float = 10, max_connections: int = 20,
+                 max_concurrency: int = 20):
+        self.name = name
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.max_concurrency = max_concurrency
+        self.client = None
+        self.semaphore = None
+
+    async def start(self):
+        """Open the connection pool; called once when the app starts."""
+        if self.client is not None:
+            return
+        http2 = http2_available()
+        self.client = httpx.AsyncClient(
+            http2=http2,
+            timeout=httpx.Timeout(self.timeout),
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_connections,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+            ),
+            headers={'User-Agent': USER_AGENT},
+            follow_redirects=True,
+        )
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        logger.info(f"Started {self.name} HTTP client (http2={http2})")
+
+    async def close(self):
+        """Close pooled connections; called on shutdown."""
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+            self.semaphore = None
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        # Scripts and one-off callers may skip start(), so open the pool on first use
+        if self.client is None:
+            await self.start()
+        if tracing.active():
+            kwargs.setdefault('extensions', {})['trace'] = tracing.http_trace
+        async with self.semaphore:
+            with track_stage(f"{self.name}_fetch"):
+                return await self.client.request(method, url, **kwargs)
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request('GET', url, **kwargs)
+
+    @asynccontextmanager
+    async def stream(self, method: str, url: str, **kwargs):
+        """Stream a response body; the concurrency slot is held until the block exits."""
+        if self.client is None:
+            await self.start()
+        if tracing.active():
+            kwargs.setdefault('extensions', {})['trace'] = tracing.http_trace
+        async with self.semaphore:
+            async with self.client.stream(method, url, **kwargs) as response:
+                yield response
+
+    async def warm_up(self, url: str, connections: int = 1):
+        """Open up to `connections` pooled connections with concurrent HEAD requests, or keep open ones alive."""
+        if self.client is None:
+            await self.start()
+        connections = min(connections, self.max_connections)
+        await asyncio.gather(*(self.client.head(url) for _ in range(connections)))
+
+    def pool_stats(self):
+        """Open and idle connections in the pool, for /healthz."""
+        if self.client is None:
+            return {'connections': 0, 'idle': 0}
+        # httpx does not expose its pool, so read httpcore's through the default transport
+        pool = getattr(self.client._transport, '_pool', None)
+        connections = list(getattr(pool, 'connections', []))
+        return {
+            'connections': len(connections),
+            'idle': sum(1 for connection in connections if connection.is_idle()),
+        }
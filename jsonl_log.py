@@ -0,0 +1,115 @@
+import os
+import json
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Log lines kept per live record before the log is rewritten with one line each
+COMPACT_RATIO = 4
+# Lines a log may grow by beyond that before compaction, so small logs are not rewritten constantly
+COMPACT_SLACK = 1000
+
+class JsonLinesLog:
+    """Append-only JSON-lines log of changes to an in-memory store, replayed on restart.
+
+    record() buffers the latest entry per key; a background task appends the
+    buffer every flush_interval seconds, in a thread. Once the log holds
+    well over COMPACT_RATIO lines per live() record it is rewritten from
+    snapshot(), the store's current entries, one line each. An empty path
+    turns the log off.
+    """
+
+    def __init__(self, name, path, snapshot, live, flush_interval=1.0):
+        self.name = name
+        self.path = path
+        self.snapshot = snapshot
+        self.live = live
+        self.flush_interval = flush_interval
+        self.pending = {}
+        self.lines = 0
+        self.task = None
+
+        # Counters exposed through stats()
+        self.writes = 0
+        self.write_errors = 0
+
+    def record(self, key, entry):
+        """Queue an entry for the next flush, replacing any earlier one for the same key."""
+        if self.path:
+            self.pending[key] = entry
+
+    def _read(self):
+        entries = []
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    # A line cut short by a crash mid-write
+                    continue
+        return entries
+
+    def _append(self, lines):
+        with open(self.path, 'a') as f:
+            f.writelines(line + '\n' for line in lines)
+
+    def _rewrite(self, lines):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        temporary = f"{self.path}.tmp"
+        with open(temporary, 'w') as f:
+            f.writelines(line + '\n' for line in lines)
+        os.replace(temporary, self.path)
+
+    async def read(self):
+        """Every entry in the log, oldest first, or None if it could not be read.
+
+        Without a path or a log yet there is nothing to replay, so that is empty.
+        """
+        if not self.path or not os.path.exists(self.path):
+            return []
+        try:
+            return await asyncio.to_thread(self._read)
+        except OSError as e:
+            logger.error(f"Error reading {self.name} from {self.path}: {str(e)}")
+            return None
+
+    async def compact(self):
+        """Rewrite the log as the store's current entries."""
+        lines = [json.dumps(entry) for entry in self.snapshot()]
+        await asyncio.to_thread(self._rewrite, lines)
+        self.lines = len(lines)
+
+    async def flush(self):
+        """Append buffered entries, compacting instead when the log has grown well past the live records."""
+        if not self.pending:
+            return
+        lines = [json.dumps(entry) for entry in self.pending.values()]
+        self.pending = {}
+        try:
+            if self.lines + len(lines) > COMPACT_RATIO * self.live() + COMPACT_SLACK:
+                await self.compact()
+            else:
+                await asyncio.to_thread(self._append, lines)
+                self.lines += len(lines)
+            self.writes += len(lines)
+        except OSError as e:
+            self.write_errors += 1
+            logger.error(f"Error writing {self.name} to {self.path}: {str(e)}")
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self):
+        """Start appending buffered entries in the background."""
+        if self.path and self.task is None:
+            self.task = asyncio.create_task(self._flush_loop(), name=f"{self.name}-flush")
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+            await self.flush()
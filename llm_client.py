@@ -0,0 +1,264 @@
+import os
+import re
+import time
+import random
+import asyncio
+import logging
+from metrics import track_stage, record_tokens
+from shared_state import state
+from token_budget import budget
+
+logger = logging.getLogger(__name__)
+
+# Concurrency, rate and retry settings, overridable per deployment
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', 8))
+LLM_MAX_CONCURRENCY_PER_BOT = int(os.getenv('LLM_MAX_CONCURRENCY_PER_BOT', 4))
+LLM_REQUESTS_PER_MINUTE = float(os.getenv('LLM_REQUESTS_PER_MINUTE', 500))
+LLM_DEADLINE = float(os.getenv('LLM_DEADLINE', 60))
+LLM_BACKOFF_BASE = float(os.getenv('LLM_BACKOFF_BASE', 0.5))
+LLM_BACKOFF_MAX = float(os.getenv('LLM_BACKOFF_MAX', 20))
+
+# openai errors worth another attempt; anything else is a bug in the request
+RETRYABLE_ERRORS = ('RateLimitError', 'APITimeoutError', 'APIConnectionError', 'InternalServerError')
+
+def parse_reset_duration(value):
+    """Parse OpenAI reset headers such as '20ms', '1s' or '6m0s' into seconds."""
+    if not value:
+        return None
+    units = {'h': 3600, 'm': 60, 's': 1, 'ms': 0.001}
+    parts = re.findall(r'(\d+(?:\.\d+)?)(ms|h|m|s)', value)
+    if not parts:
+        return None
+    return sum(float(amount) * units[unit] for amount, unit in parts)
+
+class TokenBucket:
+    """Request rate limiter that also obeys the API's rate-limit headers."""
+
+    def __init__(self, rate_per_minute: float):
+        self.capacity = max(1.0, rate_per_minute / 60)
+        self.refill_rate = rate_per_minute / 60
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill_rate)
+        self.updated = now
+
+    async def acquire(self):
+        """Wait until a request may be sent."""
+        async with self.lock:
+            while True:
+                self._refill()
+                wait = self.blocked_until - time.monotonic()
+                if wait <= 0 and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                if wait <= 0:
+                    wait = (1 - self.tokens) / self.refill_rate
+                await asyncio.sleep(wait)
+
+    def update_from_headers(self, headers):
+        """Follow x-ratelimit-* headers so we slow down before the API starts refusing."""
+        self._refill()
+        remaining = headers.get('x-ratelimit-remaining-requests')
+        if remaining is not None and remaining.isdigit():
+            self.tokens = min(self.tokens, float(remaining))
+        for kind in ('requests', 'tokens'):
+            if headers.get(f'x-ratelimit-remaining-{kind}') == '0':
+                reset = parse_reset_duration(headers.get(f'x-ratelimit-reset-{kind}'))
+                if reset:
+                    self.blocked_until = max(self.blocked_until, time.monotonic() + reset)
+
+    def block_for(self, seconds: float):
+        """Hold back every request for a while, e.g. after a 429 with Retry-After."""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def is_blocked(self):
+        return time.monotonic() < self.blocked_until
+
+class LLMClient:
+    """Shared non-blocking chat completion client for all bots."""
+
+    def __init__(self, max_concurrency: int = LLM_MAX_CONCURRENCY,
+                 max_concurrency_per_bot: int = LLM_MAX_CONCURRENCY_PER_BOT,
+                 requests_per_minute: float = LLM_REQUESTS_PER_MINUTE,
+                 deadline: float = LLM_DEADLINE):
+        self.max_concurrency = max_concurrency
+        self.max_concurrency_per_bot = max_concurrency_per_bot
+        self.requests_per_minute = requests_per_minute
+        self.deadline = deadline
+        self.client = None
+        self.openai = None
+        self.retryable_errors = ()
+        self.semaphore = None
+        self.bot_semaphores = {}
+        self.rate_limiter = None
+
+        # Counters exposed through stats()
+        self.calls = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.failures = 0
+
+    async def start(self):
+        """Create the OpenAI client; safe to call more than once."""
+        if self.client is not None:
+            return
+        # openai is the slowest import at startup, so it is only loaded when the client starts
+        import openai
+        self.openai = openai
+        self.retryable_errors = tuple(getattr(openai, name) for name in RETRYABLE_ERRORS)
+
+        # Retries are handled here so they share one deadline and the rate limiter
+        self.client = openai.AsyncOpenAI(
+            api_key=os.getenv('OPENAI_API_KEY'),
+            base_url=os.getenv('OPENAI_BASE_URL') or None,
+            max_retries=0,
+        )
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.rate_limiter = TokenBucket(self.requests_per_minute)
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.close()
+            self.client = None
+
+    async def warm_up(self):
+        """Open a connection to the API with a cheap request, so the next completion skips connect and TLS."""
+        if self.client is None:
+            await self.start()
+        try:
+            await self.client.models.list()
+        except self.openai.APIStatusError:
+            # Any HTTP answer means the connection is up, which is all warming needs
+            pass
+
+    def _bot_semaphore(self, bot: str):
+        if bot not in self.bot_semaphores:
+            self.bot_semaphores[bot] = asyncio.Semaphore(self.max_concurrency_per_bot)
+        return self.bot_semaphores[bot]
+
+    def _backoff(self, attempt: int, error: Exception):
+        """Full-jitter exponential backoff, stretched to any Retry-After the API sent."""
+        delay = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+        response = getattr(error, 'response', None)
+        if response is not None:
+            retry_after = response.headers.get('retry-after')
+            if retry_after:
+                try:
+                    delay = max(delay, float(retry_after))
+                except ValueError:
+                    pass
+            else:
+                delay = max(delay, parse_reset_duration(response.headers.get('x-ratelimit-reset-requests')) or 0)
+        return delay
+
+    async def _create(self, bot: str, started: float, **kwargs):
+        """Send one completion request, retrying transient failures until the deadline."""
+        attempt = 0
+        while True:
+            await self.rate_limiter.acquire()
+            if state.shared:
+                # Every process has its own bucket, so also hold to the limit across all of them
+                await state.acquire_window('llm:requests', self.requests_per_minute, 60)
+            self.calls += 1
+            try:
+                remaining = self.deadline - (time.monotonic() - started)
+                raw = await self.client.chat.completions.with_raw_response.create(
+                    timeout=max(1.0, remaining),
+                    **kwargs,
+                )
+                self.rate_limiter.update_from_headers(raw.headers)
+                return raw.parse()
+            except self.retryable_errors as e:
+                delay = self._backoff(attempt, e)
+                if isinstance(e, self.openai.RateLimitError):
+                    self.rate_limited += 1
+                    self.rate_limiter.block_for(delay)
+                if time.monotonic() - started + delay >= self.deadline:
+                    self.failures += 1
+                    raise
+                attempt += 1
+                self.retries += 1
+                logger.warning(f"OpenAI call for {bot} failed ({type(e).__name__}), retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+            except Exception:
+                self.failures += 1
+                raise
+
+    async def chat(self, bot: str, messages, model: str = "gpt-3.5-turbo",
+                   max_tokens: int = 500, temperature: float = 0.7):
+        """Run a chat completion and return the message text.
+
+        Calls are bounded by a global and a per-bot semaphore and by the rate
+        limiter. Transient failures are retried with jittered exponential
+        backoff until the total deadline runs out. max_tokens is lowered when
+        the prompt leaves less room than that in the context window.
+        """
+        if self.client is None:
+            await self.start()
+
+        started = time.monotonic()
+        with track_stage('llm'):
+            async with self.semaphore, self._bot_semaphore(bot):
+                completion = await self._create(
+                    bot, started,
+                    model=model,
+                    messages=messages,
+                    max_tokens=budget.completion_tokens(messages, max_tokens),
+                    temperature=temperature,
+                )
+        if completion.usage is not None:
+            record_tokens(completion.usage.prompt_tokens, completion.usage.completion_tokens)
+        return completion.choices[0].message.content
+
+    async def stream_chat(self, bot: str, messages, model: str = "gpt-3.5-turbo",
+                          max_tokens: int = 500, temperature: float = 0.7):
+        """Run a chat completion and yield the text as it is generated.
+
+        Limits and retries are the same as chat(), but retries only happen
+        before the first token arrives. The concurrency slots are held until
+        the stream is exhausted or closed.
+        """
+        if self.client is None:
+            await self.start()
+
+        started = time.monotonic()
+        chunks = 0
+        with track_stage('llm'):
+            async with self.semaphore, self._bot_semaphore(bot):
+                stream = await self._create(
+                    bot, started,
+                    model=model,
+                    messages=messages,
+                    max_tokens=budget.completion_tokens(messages, max_tokens),
+                    temperature=temperature,
+                    stream=True,
+                )
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        chunks += 1
+                        yield chunk.choices[0].delta.content
+
+        # Streams carry no usage; each chunk is one token and the prompt is counted locally
+        record_tokens(budget.count_messages(messages), chunks)
+
+    def has_spare_capacity(self):
+        """True when background work would not compete with user requests for a slot."""
+        if self.client is None:
+            return True
+        return not self.semaphore.locked() and not self.rate_limiter.is_blocked()
+
+    def stats(self):
+        return {
+            'calls': self.calls,
+            'retries': self.retries,
+            'rate_limited': self.rate_limited,
+            'failures': self.failures,
+        }
+
+# Shared instance used by every bot module
+llm = LLMClient()
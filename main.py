@@ -1,15 +1,25 @@
 import os
+import json
+import signal
 import logging
-import threading
-import time
 import asyncio
-import requests
-from flask import Flask, request
-from telegram import Update, Bot
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, CallbackContext
+from aiohttp import web
+from telegram import Update
+from telegram.ext import Application
 from dotenv import load_dotenv
-from wiki_facts_bot import setup_handlers as setup_wiki_facts_bot
-from business_ideas_bot import setup_handlers as setup_business_ideas_bot
+from update_queue import UpdateQueue
+from llm_client import llm
+from fair_scheduler import scheduler
+from chat_state import chat_state
+from send_pipeline import sender, TELEGRAM_SENDS_PER_SECOND
+from token_budget import budget
+import metrics
+from tracing import tracer
+from shared_state import state
+from dispatcher import Dispatcher, WORKER_PROCESSES, WORKER_URLS, WORKER_COUNT, chat_id_of, spawn_workers, stop_workers
+from bot_registry import load_specs, make_bot
+from polling import INGRESS_MODE, UpdatePoller, IngressSupervisor
+from health import health
 
 # Load environment variables
 load_dotenv()
@@ -21,30 +31,29 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Initialize Flask app
-app = Flask(__name__)
+# 'worker' serves only the bots, for instances behind a front configured with WORKER_URLS
+BOT_ROLE = os.getenv('BOT_ROLE', 'all')
 
 # Store bot applications
 bot_applications = {}
 
-# Global event loop and lock
-loop = None
-loop_lock = threading.Lock()
+# Bounded update queue for each bot, keyed by token
+update_queues = {}
 
-def run_flask(port=8080):
-    app.run(host='0.0.0.0', port=port)
+# Registry entries of the bots started in this process
+started_bots = []
 
-def ping_server():
-    """Ping the server to keep it alive."""
-    while True:
-        try:
-            # Get the server URL from environment variable or use localhost for development
-            server_url = os.getenv('SERVER_URL', 'http://localhost:8080')
-            response = requests.get(server_url)
-            logger.info(f"Ping response: {response.status_code}")
-        except Exception as e:
-            logger.error(f"Error pinging server: {str(e)}")
-        time.sleep(840)  # Ping every 14 minutes
+# Poller or webhook/polling supervisor for each bot, keyed by token, unless webhooks only
+ingress = {}
+
+async def run_web_server(port=8080, host='0.0.0.0'):
+    """Start the webhook server on the running event loop."""
+    runner = web.AppRunner(create_web_app())
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    logger.info(f"Webhook server listening on port {port}")
+    return runner
 
 async def setup_webhook(application: Application, token: str, webhook_url: str):
     """Set up webhook for a bot."""
@@ -52,106 +61,322 @@ async def setup_webhook(application: Application, token: str, webhook_url: str):
     await application.bot.set_webhook(url=webhook_path)
     logger.info(f"Webhook set up for bot {token[:8]}... at {webhook_path}")
 
-def get_or_create_eventloop():
-    """Get the current event loop or create a new one."""
-    global loop
-    with loop_lock:
-        if loop is None or loop.is_closed():
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-        return loop
-
-@app.route('/<token>', methods=['POST'])
-def webhook(token):
+async def setup_webhooks(webhook_url: str):
+    """Set every started bot's webhook, once the process is warm."""
+    await asyncio.gather(*(
+        setup_webhook(application, token, webhook_url) for token, application in bot_applications.items()
+    ))
+
+def register_application(token: str, application: Application, name: str):
+    """Make an initialized application reachable through the webhook and start its workers."""
+    bot_applications[token] = application
+    update_queues[token] = UpdateQueue(application, name)
+    update_queues[token].start()
+
+async def start_ingress(mode, webhook_url=None):
+    """Start long-polling for every bot, or supervisors that fall back to it when webhooks fail."""
+    for token, application in bot_applications.items():
+        name = update_queues[token].name
+        poller = UpdatePoller(application, update_queues[token], name)
+        if mode == 'polling':
+            await poller.start()
+            ingress[token] = poller
+        elif mode == 'auto':
+            ingress[token] = IngressSupervisor(application, poller, name, f"{webhook_url}/{token}")
+            ingress[token].start()
+
+async def webhook(request: web.Request):
     """Handle incoming webhook updates."""
+    token = request.match_info['token']
     if token not in bot_applications:
-        return "Invalid token", 400
+        return web.Response(text="Invalid token", status=400)
 
     application = bot_applications[token]
-    update = Update.de_json(request.get_json(), application.bot)
-    
     try:
-        # Get or create event loop
-        current_loop = get_or_create_eventloop()
-        
-        # Run the async function in the event loop
-        current_loop.run_until_complete(application.process_update(update))
-        return "OK"
+        update = Update.de_json(await request.json(), application.bot)
     except Exception as e:
-        logger.error(f"Error processing webhook: {str(e)}")
-        return "Error processing update", 500
+        logger.error(f"Error decoding webhook update: {str(e)}")
+        return web.Response(text="Invalid update", status=400)
+
+    # Acknowledge straight away and let the workers run the handlers; when the
+    # queue is full, ask Telegram to redeliver later instead of piling up work
+    if not update_queues[token].put(update):
+        return web.Response(text="Update queue full", status=503, headers={'Retry-After': '5'})
+    return web.Response(text="OK")
+
+async def home(request: web.Request):
+    return web.Response(text="Bots are running!")
+
+async def healthz(request: web.Request):
+    """Report event loop lag, queue depth and upstream warmth; 503 until the process is warm."""
+    report = health.report(update_queues.values())
+    return web.json_response(report, status=200 if report['ready'] else 503)
+
+async def metrics_endpoint(request: web.Request):
+    """Expose Prometheus metrics."""
+    body, content_type = metrics.render()
+    return web.Response(body=body, headers={'Content-Type': content_type})
+
+async def stats(request: web.Request):
+    """Report update queue depth, wait times and drop counts for each bot, plus LLM call, rate limit, cache, content pool and tracing counts."""
+    report = {queue.name: queue.stats() for queue in update_queues.values()}
+    report['llm'] = llm.stats()
+    report['llm_tokens'] = metrics.token_stats()
+    report['token_budget'] = budget.stats()
+    report['fair_scheduler'] = scheduler.stats()
+    report['chat_state'] = chat_state.stats()
+    report['telegram_sends'] = sender.stats()
+    if ingress:
+        report['ingress'] = {update_queues[token].name: source.stats() for token, source in ingress.items()}
+    for spec in started_bots:
+        report.update(spec.stats())
+    report['tracing'] = tracer.stats()
+    return web.json_response(report)
+
+def create_web_app():
+    """Create the aiohttp app serving the webhook routes."""
+    web_app = web.Application()
+    web_app.router.add_get('/', home)
+    web_app.router.add_get('/healthz', healthz)
+    web_app.router.add_get('/metrics', metrics_endpoint)
+    web_app.router.add_get('/stats', stats)
+    web_app.router.add_post('/{token}', webhook)
+    return web_app
+
+async def start_bot(spec, webhook_url=None):
+    """Load a bot's module, initialize its application and register it, setting its webhook if webhook_url is given."""
+    module = await spec.load()
+    application = spec.build_application()
+    module.setup_handlers(application)
+    await application.initialize()
+    await spec.call_hook('on_startup')
+    started_bots.append(spec)
+    register_application(spec.token, application, spec.name)
+    health.add(f"telegram:{spec.name}", application.bot.get_me)
+    if webhook_url:
+        await setup_webhook(application, spec.token, webhook_url)
+    logger.info(f"{spec.name} bot started")
+
+async def start_bots(specs, webhook_url=None, sends_per_second=TELEGRAM_SENDS_PER_SECOND):
+    """Start every configured bot concurrently, sending at most sends_per_second per bot."""
+    sender.set_rate(sends_per_second)
+    # Every bot shares the OpenAI client, so it is warmed once
+    health.add('openai', llm.warm_up)
+    await chat_state.start()
+    await asyncio.gather(*(start_bot(spec, webhook_url) for spec in specs))
+
+async def stop_bot(token, application, remove_webhook):
+    try:
+        if remove_webhook:
+            await application.bot.delete_webhook()
+        await application.shutdown()
+        logger.info(f"Shut down bot with token: {token[:8]}...")
+    except Exception as e:
+        logger.error(f"Error during shutdown: {str(e)}")
+
+async def stop_bots(remove_webhooks=True):
+    """Drain update queues and shut the bots and shared clients down."""
+    # Let queued updates finish before shutting the applications down
+    await asyncio.gather(*(update_queue.stop() for update_queue in update_queues.values()))
+
+    # Remove webhooks and shutdown applications
+    await asyncio.gather(*(
+        stop_bot(token, application, remove_webhooks) for token, application in bot_applications.items()
+    ))
+    await asyncio.gather(*(spec.call_hook('on_shutdown') for spec in started_bots))
+
+    await health.stop()
+    await llm.close()
+    await state.close()
+    await chat_state.stop()
+    await tracer.stop()
+
+async def serve_worker(specs, port, host='0.0.0.0'):
+    """Run the bots behind a port that a front process forwards webhook updates to."""
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stopping.set)
+
+    runner = None
+    try:
+        tracer.start()
+        # The front process owns the webhooks, so workers only take updates; the
+        # front waits for the port to answer, so it is opened once the worker is warm.
+        # Every worker sends for the same bots and chats are spread evenly, so each takes a share of the rate
+        await start_bots(specs, sends_per_second=TELEGRAM_SENDS_PER_SECOND / WORKER_COUNT)
+        await health.start()
+        runner = await run_web_server(port, host)
+        await stopping.wait()
+    except Exception as e:
+        logger.error(f"Error in worker: {str(e)}")
+    finally:
+        if runner is not None:
+            await runner.cleanup()
+        await stop_bots(remove_webhooks=False)
+
+def run_worker(index, port):
+    """Entry point of a worker process spawned by the front process."""
+    # Spawned workers share the machine with the front, so only listen locally
+    asyncio.run(serve_worker(load_specs(), port, host='127.0.0.1'))
+
+async def forward_webhook(request: web.Request):
+    """Route an incoming update to the worker that owns its chat."""
+    token = request.match_info['token']
+    if token not in request.app['tokens']:
+        return web.Response(text="Invalid token", status=400)
+
+    body = await request.read()
+    try:
+        data = json.loads(body)
+    except ValueError as e:
+        logger.error(f"Error decoding webhook update: {str(e)}")
+        return web.Response(text="Invalid update", status=400)
+
+    status = await request.app['dispatcher'].forward(token, body, chat_id_of(data), data.get('update_id'))
+    if status == 200:
+        return web.Response(text="OK")
+    if status == 400:
+        return web.Response(text="Invalid update", status=400)
+    # The worker is full or unreachable; Telegram will redeliver later
+    return web.Response(text="Worker unavailable", status=503, headers={'Retry-After': '5'})
+
+async def front_stats(request: web.Request):
+    """Report forwarding counts plus each worker's own /stats."""
+    dispatcher = request.app['dispatcher']
+    return web.json_response({
+        'dispatcher': dispatcher.stats(),
+        'workers': await dispatcher.worker_stats(),
+    })
 
-@app.route('/')
-def home():
-    return "Bots are running!"
+def create_front_app(tokens, dispatcher):
+    """Create the aiohttp app that receives webhooks and forwards them to workers."""
+    web_app = web.Application()
+    web_app['tokens'] = set(tokens)
+    web_app['dispatcher'] = dispatcher
+    web_app.router.add_get('/', home)
+    web_app.router.add_get('/healthz', healthz)
+    web_app.router.add_get('/metrics', metrics_endpoint)
+    web_app.router.add_get('/stats', front_stats)
+    web_app.router.add_post('/{token}', forward_webhook)
+    return web_app
+
+async def set_bot_webhook(token, webhook_url):
+    async with make_bot(token) as bot:
+        await bot.set_webhook(url=f"{webhook_url}/{token}")
+    logger.info(f"Webhook set up for bot {token[:8]}... at {webhook_url}/{token}")
+
+async def remove_bot_webhook(token):
+    try:
+        async with make_bot(token) as bot:
+            await bot.delete_webhook()
+    except Exception as e:
+        logger.error(f"Error removing webhook: {str(e)}")
+
+async def run_front(tokens, webhook_url, port):
+    """Receive webhooks on one port and route them by chat to local worker processes or WORKER_URLS."""
+    processes = []
+    if WORKER_URLS:
+        urls = WORKER_URLS
+    else:
+        processes, urls = spawn_workers(WORKER_PROCESSES, run_worker)
+    if not state.shared:
+        logger.warning("STATE_BACKEND is memory: caches and rate limits are not shared between workers")
+
+    dispatcher = Dispatcher(urls)
+    runner = None
+    try:
+        await dispatcher.start()
+        await dispatcher.wait_ready()
+        runner = web.AppRunner(create_front_app(tokens, dispatcher))
+        await runner.setup()
+        await web.TCPSite(runner, '0.0.0.0', port).start()
+        logger.info(f"Front listening on port {port}, routing to {len(urls)} workers")
+
+        # Workers are warm once they answer, so the front only needs its keep-alive ping
+        await health.start()
+        await asyncio.gather(*(set_bot_webhook(token, webhook_url) for token in tokens))
+
+        # Keep the main thread alive
+        while True:
+            await asyncio.sleep(1)
+    finally:
+        if runner is not None:
+            await runner.cleanup()
+        await asyncio.gather(*(remove_bot_webhook(token) for token in tokens))
+        await health.stop()
+        await dispatcher.close()
+        await stop_workers(processes)
 
 async def main():
-    # Create and set the global event loop
-    global loop
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    
-    # Get bot tokens
-    wiki_facts_token = os.getenv('WIKI_FACTS_TELE_TOKEN')
-    business_ideas_token = os.getenv('BUSINESS_IDEAS_TELE_TOKEN')
-
-    if not wiki_facts_token or not business_ideas_token:
+    # Bots come from the registry in BOTS_CONFIG; those without a token are skipped
+    specs = load_specs()
+    if not specs:
         logger.error("Missing bot tokens in environment variables")
         return
 
-    # Get webhook URL from environment or use ngrok for local development
-    webhook_url = os.getenv('WEBHOOK_URL')
-    is_local = os.getenv('ENVIRONMENT', 'production') == 'development'
+    port = int(os.getenv('PORT', 8080))
 
-    if is_local:
-        try:
-            from pyngrok import ngrok, conf
-            ngrok_auth_token = os.getenv('NGROK_AUTH_TOKEN')
-            if not ngrok_auth_token:
-                logger.error("NGROK_AUTH_TOKEN not found in environment variables!")
-                return
+    # A worker instance behind a front started elsewhere with WORKER_URLS
+    if BOT_ROLE == 'worker':
+        await serve_worker(specs, port)
+        return
+
+    # Long-polling needs no public URL, so local development can skip ngrok
+    webhook_url = None
+    if INGRESS_MODE != 'polling':
+        # Get webhook URL from environment or use ngrok for local development
+        webhook_url = os.getenv('WEBHOOK_URL')
+        is_local = os.getenv('ENVIRONMENT', 'production') == 'development'
+
+        if is_local:
+            try:
+                from pyngrok import ngrok, conf
+                ngrok_auth_token = os.getenv('NGROK_AUTH_TOKEN')
+                if not ngrok_auth_token:
+                    logger.error("NGROK_AUTH_TOKEN not found in environment variables!")
+                    return
                 
-            conf.get_default().auth_token = ngrok_auth_token
-            port = 8080
-            public_url = ngrok.connect(port).public_url
-            webhook_url = public_url
-            logger.info(f"Local development: ngrok tunnel established at {public_url}")
-        except ImportError:
-            logger.error("pyngrok not installed. Please run: pip install pyngrok")
+                conf.get_default().auth_token = ngrok_auth_token
+                public_url = ngrok.connect(port).public_url
+                webhook_url = public_url
+                logger.info(f"Local development: ngrok tunnel established at {public_url}")
+            except ImportError:
+                logger.error("pyngrok not installed. Please run: pip install pyngrok")
+                return
+            except Exception as e:
+                logger.error(f"Failed to start ngrok: {str(e)}")
+                return
+        elif not webhook_url:
+            logger.error("WEBHOOK_URL not set in environment variables")
             return
-        except Exception as e:
-            logger.error(f"Failed to start ngrok: {str(e)}")
+
+    if WORKER_PROCESSES > 1 or WORKER_URLS:
+        if INGRESS_MODE != 'webhook':
+            logger.error("INGRESS_MODE polling and auto run in a single process; unset WORKER_PROCESSES and WORKER_URLS")
             return
-    elif not webhook_url:
-        logger.error("WEBHOOK_URL not set in environment variables")
+        try:
+            await run_front([spec.token for spec in specs], webhook_url, port)
+        except KeyboardInterrupt:
+            logger.info("Shutting down...")
+        except Exception as e:
+            logger.error(f"Error in main: {str(e)}")
         return
 
+    runner = None
     try:
-        # Initialize Wiki Facts Bot
-        wiki_facts_app = Application.builder().token(wiki_facts_token).build()
-        setup_wiki_facts_bot(wiki_facts_app)
-        await wiki_facts_app.initialize()
-        bot_applications[wiki_facts_token] = wiki_facts_app
-        await setup_webhook(wiki_facts_app, wiki_facts_token, webhook_url)
-        logger.info("Wiki Facts Bot webhook set up")
-
-        # Initialize Business Ideas Bot
-        business_ideas_app = Application.builder().token(business_ideas_token).build()
-        setup_business_ideas_bot(business_ideas_app)
-        await business_ideas_app.initialize()
-        bot_applications[business_ideas_token] = business_ideas_app
-        await setup_webhook(business_ideas_app, business_ideas_token, webhook_url)
-        logger.info("Business Ideas Bot webhook set up")
-
-        # Start Flask server in a separate thread
-        flask_thread = threading.Thread(target=run_flask)
-        flask_thread.daemon = True
-        flask_thread.start()
-
-        # Start ping mechanism in a separate thread
-        ping_thread = threading.Thread(target=ping_server)
-        ping_thread.daemon = True
-        ping_thread.start()
+        tracer.start()
+        await start_bots(specs)
+
+        # Serve webhooks on the same event loop as the bot applications; /healthz
+        # answers 503 until warm-up is done
+        runner = await run_web_server(port)
+
+        # Only ask Telegram for updates once upstream connections and content pools are warm
+        await health.start()
+        if webhook_url:
+            await setup_webhooks(webhook_url)
+        await start_ingress(INGRESS_MODE, webhook_url)
 
         # Keep the main thread alive
         while True:
@@ -162,14 +387,10 @@ async def main():
     except Exception as e:
         logger.error(f"Error in main: {str(e)}")
     finally:
-        # Remove webhooks and shutdown applications
-        for token, application in bot_applications.items():
-            try:
-                await application.bot.delete_webhook()
-                await application.shutdown()
-                logger.info(f"Removed webhook and shut down bot with token: {token[:8]}...")
-            except Exception as e:
-                logger.error(f"Error during shutdown: {str(e)}")
+        if runner is not None:
+            await runner.cleanup()
+        await asyncio.gather(*(source.stop() for source in ingress.values()))
+        await stop_bots()
 
 if __name__ == '__main__':
-    asyncio.run(main()) 
\ No newline at end of file
+    asyncio.run(main())
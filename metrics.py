@@ -0,0 +1,139 @@
+import time
+import contextvars
+from contextlib import contextmanager
+from prometheus_client import Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
+from telegram import Update
+from telegram.ext import Application, CommandHandler
+import tracing
+
+# Buckets sized for a pipeline whose slowest stage is a multi-second LLM call
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 60)
+
+UPDATE_DISPATCH_SECONDS = Histogram(
+    'telebots_update_dispatch_seconds',
+    'Time from webhook receipt until a worker starts processing the update',
+    ['bot'], buckets=LATENCY_BUCKETS,
+)
+UPDATE_PROCESSING_SECONDS = Histogram(
+    'telebots_update_processing_seconds',
+    'Time spent processing an update once dispatched',
+    ['bot', 'command'], buckets=LATENCY_BUCKETS,
+)
+STAGE_SECONDS = Histogram(
+    'telebots_stage_seconds',
+    'Time spent in each pipeline stage',
+    ['bot', 'command', 'stage'], buckets=LATENCY_BUCKETS,
+)
+STAGE_ERRORS = Counter(
+    'telebots_stage_errors_total',
+    'Exceptions raised by each pipeline stage',
+    ['bot', 'command', 'stage'],
+)
+LLM_TOKENS = Counter(
+    'telebots_llm_tokens_total',
+    'LLM tokens used, by kind (prompt or completion)',
+    ['bot', 'command', 'kind'],
+)
+LLM_REQUEST_TOKENS = Histogram(
+    'telebots_llm_request_tokens',
+    'LLM tokens per completion request, by kind (prompt or completion)',
+    ['bot', 'command', 'kind'], buckets=(50, 100, 200, 400, 800, 1600, 3200, 6400),
+)
+CACHE_LOOKUPS = Counter(
+    'telebots_cache_lookups_total',
+    'Cache and content pool lookups, by result',
+    ['cache', 'result'],
+)
+QUEUE_DEPTH = Gauge(
+    'telebots_update_queue_depth',
+    'Updates waiting in each bot queue',
+    ['bot'],
+)
+UPDATES_DROPPED = Counter(
+    'telebots_updates_dropped_total',
+    'Updates refused because the bot queue was full',
+    ['bot'],
+)
+UPDATES_DUPLICATE = Counter(
+    'telebots_updates_duplicate_total',
+    'Redelivered updates acknowledged without being handled again',
+    ['bot'],
+)
+RATE_LIMITED = Counter(
+    'telebots_rate_limited_total',
+    'LLM-backed commands refused by the per-user and per-chat rate limits',
+    ['bot', 'command'],
+)
+
+# Running token totals per (bot, command) for /stats: [requests, prompt, completion]
+token_totals = {}
+
+# (bot, command) of the update being processed; background work keeps the default
+request_labels = contextvars.ContextVar('request_labels', default=('background', 'none'))
+
+def known_commands(application: Application):
+    """Commands registered on an application, used to keep the command label bounded."""
+    return {
+        command
+        for handlers in application.handlers.values()
+        for handler in handlers if isinstance(handler, CommandHandler)
+        for command in handler.commands
+    }
+
+def command_of(update: Update, commands):
+    """The update's command if it is one the bot handles, else 'other'."""
+    message = update.effective_message
+    if message is None or not message.text or not message.text.startswith('/'):
+        return 'other'
+    command = message.text.split()[0][1:].split('@')[0].lower()
+    return command if command in commands else 'other'
+
+@contextmanager
+def track_stage(stage):
+    """Time a block into STAGE_SECONDS under the current bot and command labels, and trace it as a span."""
+    bot, command = request_labels.get()
+    started = time.perf_counter()
+    try:
+        with tracing.span(stage):
+            yield
+    except Exception:
+        STAGE_ERRORS.labels(bot, command, stage).inc()
+        raise
+    finally:
+        STAGE_SECONDS.labels(bot, command, stage).observe(time.perf_counter() - started)
+
+def observe_stage(stage, seconds):
+    """Record time measured outside a track_stage block, e.g. summed over many chunks."""
+    bot, command = request_labels.get()
+    STAGE_SECONDS.labels(bot, command, stage).observe(seconds)
+    tracing.record_span(stage, seconds)
+
+def record_tokens(prompt_tokens, completion_tokens):
+    """Count the tokens of one completion request under the current bot and command."""
+    bot, command = request_labels.get()
+    LLM_TOKENS.labels(bot, command, 'prompt').inc(prompt_tokens)
+    LLM_TOKENS.labels(bot, command, 'completion').inc(completion_tokens)
+    LLM_REQUEST_TOKENS.labels(bot, command, 'prompt').observe(prompt_tokens)
+    LLM_REQUEST_TOKENS.labels(bot, command, 'completion').observe(completion_tokens)
+    totals = token_totals.setdefault(f"{bot}/{command}", [0, 0, 0])
+    totals[0] += 1
+    totals[1] += prompt_tokens
+    totals[2] += completion_tokens
+
+def token_stats():
+    """Requests and average prompt and completion tokens per request, by bot and command."""
+    return {
+        key: {
+            'requests': requests,
+            'prompt_per_request': round(prompt / requests, 1),
+            'completion_per_request': round(completion / requests, 1),
+        }
+        for key, (requests, prompt, completion) in token_totals.items()
+    }
+
+def record_cache(cache, result):
+    CACHE_LOOKUPS.labels(cache, result).inc()
+
+def render():
+    """Current metrics in the Prometheus text format, with its content type."""
+    return generate_latest(), CONTENT_TYPE_LATEST
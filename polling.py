@@ -0,0 +1,170 @@
+import os
+import time
+import random
+import asyncio
+import logging
+from datetime import datetime, timezone
+from telegram.error import RetryAfter, TelegramError
+from telegram.ext import Application
+from update_queue import UpdateQueue
+
+logger = logging.getLogger(__name__)
+
+# 'webhook', 'polling', or 'auto' (webhook, switching to polling while Telegram cannot deliver)
+INGRESS_MODE = os.getenv('INGRESS_MODE', 'webhook').lower()
+
+# Long-polling settings
+POLLING_TIMEOUT = int(os.getenv('POLLING_TIMEOUT', 30))
+POLLING_LIMIT = int(os.getenv('POLLING_LIMIT', 100))
+POLLING_BACKOFF_MAX = float(os.getenv('POLLING_BACKOFF_MAX', 30))
+
+# Failover settings for INGRESS_MODE=auto
+WEBHOOK_CHECK_INTERVAL = float(os.getenv('WEBHOOK_CHECK_INTERVAL', 60))
+WEBHOOK_RETRY_INTERVAL = float(os.getenv('WEBHOOK_RETRY_INTERVAL', 900))
+
+class UpdatePoller:
+    """Fetch one bot's updates with getUpdates long-polling and feed them to its update queue.
+
+    The queue's workers run the handlers concurrently and keep each chat in
+    order, as with webhooks. The offset only moves past updates that are
+    queued, so a full queue slows fetching down instead of losing updates.
+    """
+
+    def __init__(self, application: Application, update_queue: UpdateQueue, name: str,
+                 timeout: int = POLLING_TIMEOUT, limit: int = POLLING_LIMIT):
+        self.application = application
+        self.update_queue = update_queue
+        self.name = name
+        self.timeout = timeout
+        self.limit = limit
+        self.offset = None
+        self.task = None
+
+        # Counters exposed through stats()
+        self.polls = 0
+        self.received = 0
+        self.errors = 0
+
+    @property
+    def running(self):
+        return self.task is not None
+
+    async def start(self):
+        """Remove the bot's webhook, which blocks getUpdates, and start polling."""
+        if self.task is not None:
+            return
+        await self.application.bot.delete_webhook()
+        self.task = asyncio.create_task(self._poll(), name=f"{self.name}-poller")
+        logger.info(f"Long-polling updates for {self.name}")
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    async def _poll(self):
+        backoff = 1.0
+        while True:
+            try:
+                updates = await self.application.bot.get_updates(
+                    offset=self.offset,
+                    limit=self.limit,
+                    timeout=self.timeout,
+                    read_timeout=self.timeout + 10,
+                )
+            except asyncio.CancelledError:
+                raise
+            except RetryAfter as e:
+                self.errors += 1
+                await asyncio.sleep(e.retry_after)
+                continue
+            except TelegramError as e:
+                self.errors += 1
+                delay = random.uniform(0, backoff)
+                logger.warning(f"getUpdates for {self.name} failed ({str(e)}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                backoff = min(backoff * 2, POLLING_BACKOFF_MAX)
+                continue
+            backoff = 1.0
+            self.polls += 1
+            for update in updates:
+                await self.update_queue.put_wait(update)
+                self.offset = update.update_id + 1
+                self.received += 1
+
+    def stats(self):
+        return {
+            'running': self.running,
+            'polls': self.polls,
+            'received': self.received,
+            'errors': self.errors,
+        }
+
+class IngressSupervisor:
+    """Keep one bot's updates flowing: by webhook while Telegram can deliver them, by polling while it cannot.
+
+    Every check interval it reads getWebhookInfo. When the webhook is gone
+    or Telegram has reported a delivery error since the last check while
+    updates are pending, it removes the webhook and starts polling. After
+    the retry interval it sets the webhook again and goes back to watching.
+    """
+
+    def __init__(self, application: Application, poller: UpdatePoller, name: str, webhook_url: str,
+                 check_interval: float = WEBHOOK_CHECK_INTERVAL, retry_interval: float = WEBHOOK_RETRY_INTERVAL):
+        self.application = application
+        self.poller = poller
+        self.name = name
+        self.webhook_url = webhook_url
+        self.check_interval = check_interval
+        self.retry_interval = retry_interval
+        self.last_check = datetime.now(timezone.utc)
+        self.fell_back_at = None
+        self.task = None
+
+        # Counters exposed through stats()
+        self.failovers = 0
+
+    def start(self):
+        self.task = asyncio.create_task(self._supervise(), name=f"{self.name}-ingress")
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        await self.poller.stop()
+
+    def _delivery_failing(self, info):
+        if info.url != self.webhook_url:
+            return f"webhook is set to {info.url or 'nothing'}"
+        if info.last_error_date and info.last_error_date >= self.last_check and info.pending_update_count:
+            return f"delivery error: {info.last_error_message}"
+        return None
+
+    async def _supervise(self):
+        while True:
+            await asyncio.sleep(self.check_interval)
+            try:
+                if not self.poller.running:
+                    info = await self.application.bot.get_webhook_info()
+                    reason = self._delivery_failing(info)
+                    if reason:
+                        logger.warning(f"Webhook for {self.name} is failing ({reason}), switching to long-polling")
+                        await self.poller.start()
+                        self.failovers += 1
+                        self.fell_back_at = time.monotonic()
+                elif time.monotonic() - self.fell_back_at >= self.retry_interval:
+                    logger.info(f"Trying the webhook for {self.name} again")
+                    await self.poller.stop()
+                    await self.application.bot.set_webhook(url=self.webhook_url)
+            except TelegramError as e:
+                logger.error(f"Error checking webhook for {self.name}: {str(e)}")
+            self.last_check = datetime.now(timezone.utc)
+
+    def stats(self):
+        return {
+            'mode': 'polling' if self.poller.running else 'webhook',
+            'failovers': self.failovers,
+            'poller': self.poller.stats(),
+        }
@@ -0,0 +1,72 @@
+import os
+from collections import OrderedDict
+
+# Most keys (users, chats) tracked at once by a set of buckets; the least recently seen are forgotten first
+RATE_LIMIT_MAX_KEYS = int(os.getenv('RATE_LIMIT_MAX_KEYS', 100000))
+
+class Bucket:
+    __slots__ = ('tokens', 'updated', 'notified_until')
+
+    def __init__(self, tokens, now):
+        self.tokens = tokens
+        self.updated = now
+        self.notified_until = 0.0
+
+class RateBuckets:
+    """Token bucket per key, bounded to max_keys.
+
+    Buckets are kept in least-recently-used order. One that has sat idle
+    long enough to refill completely is the same as a new bucket, so those
+    are dropped as soon as they reach the front; past max_keys the least
+    recently used goes even if it is not full yet.
+    """
+
+    def __init__(self, rate_per_minute: float, burst: float, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.rate = rate_per_minute / 60
+        self.burst = max(1.0, burst)
+        self.max_keys = max_keys
+        self.idle_after = self.burst / self.rate if self.rate > 0 else float('inf')
+        self.buckets = OrderedDict()
+
+        # Counters exposed through stats()
+        self.evicted = 0
+
+    def _bucket(self, key, now):
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = Bucket(self.burst, now)
+            self._evict(now)
+        else:
+            bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+            bucket.updated = now
+            self.buckets.move_to_end(key)
+        return bucket
+
+    def _evict(self, now):
+        while self.buckets:
+            oldest = next(iter(self.buckets.values()))
+            if len(self.buckets) <= self.max_keys and now - oldest.updated < self.idle_after:
+                return
+            self.buckets.popitem(last=False)
+            self.evicted += 1
+
+    def wait_time(self, key, now):
+        """Seconds until key has a token; 0 if it has one now."""
+        bucket = self._bucket(key, now)
+        if bucket.tokens >= 1:
+            return 0.0
+        return (1 - bucket.tokens) / self.rate if self.rate > 0 else float('inf')
+
+    def take(self, key, now):
+        self._bucket(key, now).tokens -= 1
+
+    def notify(self, key, now, wait):
+        """True the first time key is told it is limited, until that wait is over."""
+        bucket = self._bucket(key, now)
+        if now < bucket.notified_until:
+            return False
+        bucket.notified_until = now + wait
+        return True
+
+    def __len__(self):
+        return len(self.buckets)
@@ -0,0 +1,26 @@
+from collections import deque
+
+class RecentKeys:
+    """The last `window` keys seen, in a ring buffer with a set for O(1) lookups."""
+
+    def __init__(self, window):
+        self.keys = deque(maxlen=window)
+        self.key_set = set()
+
+    def __contains__(self, key):
+        return key in self.key_set
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __iter__(self):
+        return iter(self.keys)
+
+    def add(self, key):
+        """Remember key, forgetting the oldest once the window is full; a key already held keeps its place."""
+        if key in self.key_set:
+            return
+        if len(self.keys) == self.keys.maxlen:
+            self.key_set.discard(self.keys[0])
+        self.keys.append(key)
+        self.key_set.add(key)
@@ -0,0 +1,221 @@
+import os
+import re
+import time
+import hashlib
+from collections import OrderedDict, Counter
+from singleflight import SingleFlight
+from metrics import record_cache
+from shared_state import state
+
+# Cache settings, overridable per deployment
+LLM_CACHE_TTL = float(os.getenv('LLM_CACHE_TTL', 7 * 24 * 3600))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv('LLM_CACHE_MAX_ENTRIES', 1000))
+LLM_CACHE_VARIANTS = int(os.getenv('LLM_CACHE_VARIANTS', 1))
+
+# Shingle size for near-duplicate matching, in characters
+SHINGLE_SIZE = 5
+
+def normalize_text(text):
+    """Collapse case and whitespace so trivially different inputs share a key."""
+    return ' '.join(text.lower().split())
+
+def shingles(text):
+    """Character shingles of normalized text without punctuation, used to estimate similarity."""
+    text = normalize_text(re.sub(r'[^\w\s]', ' ', text))
+    if len(text) <= SHINGLE_SIZE:
+        return {text}
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+class CachedResponse:
+    """Completions stored under one key, served in rotation."""
+    __slots__ = ('variants', 'next_variant', 'stored_at', 'shingles')
+
+    def __init__(self, shingles=None):
+        self.variants = []
+        self.next_variant = 0
+        self.stored_at = time.time()
+        self.shingles = shingles
+
+class ResponseCache:
+    """LRU cache of LLM completions keyed by model, prompt and normalized input.
+
+    With max_variants > 1 each key collects that many completions before it
+    starts serving them in rotation, so repeated inputs do not always get the
+    identical answer. With a near_duplicate_threshold, a miss falls back to the
+    most similar cached input whose shingle Jaccard similarity reaches it.
+    Concurrent misses for the same key share one generation. With a shared
+    state backend, exact-key completions are also shared between processes.
+    """
+
+    def __init__(self, name, ttl=LLM_CACHE_TTL, max_entries=LLM_CACHE_MAX_ENTRIES,
+                 max_variants=LLM_CACHE_VARIANTS, near_duplicate_threshold=None):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_variants = max(1, max_variants)
+        self.near_duplicate_threshold = near_duplicate_threshold
+        self.entries = OrderedDict()
+        # Shingle -> keys containing it, for near-duplicate candidates
+        self.shingle_index = {}
+        self.flight = SingleFlight(name)
+
+        # Counters exposed through stats()
+        self.hits = 0
+        self.near_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(model, system_prompt, template_version, text):
+        """Hash everything that determines the completion into one key."""
+        material = '\x00'.join([model, system_prompt, str(template_version), normalize_text(text)])
+        return hashlib.sha256(material.encode()).hexdigest()
+
+    def _remove(self, key):
+        entry = self.entries.pop(key)
+        if entry.shingles:
+            for shingle in entry.shingles:
+                keys = self.shingle_index.get(shingle)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self.shingle_index[shingle]
+
+    def _live(self, key):
+        entry = self.entries.get(key)
+        if entry is not None and time.time() - entry.stored_at >= self.ttl:
+            self._remove(key)
+            return None
+        return entry
+
+    def _nearest(self, text):
+        """Find the cached key most similar to text, if similar enough."""
+        query = shingles(text)
+        overlaps = Counter()
+        for shingle in query:
+            overlaps.update(self.shingle_index.get(shingle, ()))
+        best_key, best_score = None, 0.0
+        for key, overlap in overlaps.items():
+            entry = self.entries[key]
+            score = overlap / (len(query) + len(entry.shingles) - overlap)
+            if score > best_score:
+                best_key, best_score = key, score
+        if best_key is not None and best_score >= self.near_duplicate_threshold:
+            return best_key
+        return None
+
+    def _serve(self, entry):
+        if len(entry.variants) < self.max_variants:
+            return None
+        response = entry.variants[entry.next_variant % len(entry.variants)]
+        entry.next_variant += 1
+        return response
+
+    def lookup(self, key, text=None):
+        """Return a cached completion for key, or for a near-duplicate of text."""
+        entry = self._live(key)
+        if entry is not None:
+            response = self._serve(entry)
+            if response is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                record_cache(self.name, 'hit')
+                return response
+
+        if entry is None and self.near_duplicate_threshold and text:
+            near_key = self._nearest(text)
+            if near_key is not None and self._live(near_key) is not None:
+                response = self._serve(self.entries[near_key])
+                if response is not None:
+                    self.entries.move_to_end(near_key)
+                    self.near_hits += 1
+                    record_cache(self.name, 'near_hit')
+                    return response
+
+        self.misses += 1
+        record_cache(self.name, 'miss')
+        return None
+
+    def store(self, key, response, text=None):
+        """Add a completion under key, evicting the least recently used keys."""
+        entry = self._live(key)
+        if entry is None:
+            entry_shingles = shingles(text) if self.near_duplicate_threshold and text else None
+            entry = CachedResponse(entry_shingles)
+            self.entries[key] = entry
+            if entry_shingles:
+                for shingle in entry_shingles:
+                    self.shingle_index.setdefault(shingle, set()).add(key)
+        if len(entry.variants) < self.max_variants:
+            entry.variants.append(response)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self._remove(next(iter(self.entries)))
+            self.evictions += 1
+
+    def _uses_shared(self):
+        # Rotating variants needs all of them locally, so only single answers are shared
+        return state.shared and self.max_variants == 1
+
+    async def _shared_lookup(self, key, text):
+        if not self._uses_shared():
+            return None
+        response = await state.get(f"llm:{self.name}:{key}")
+        if response is not None:
+            self.shared_hits += 1
+            record_cache(self.name, 'shared_hit')
+            self.store(key, response, text)
+        return response
+
+    async def _store_and_publish(self, key, response, text):
+        self.store(key, response, text)
+        if self._uses_shared():
+            await state.set(f"llm:{self.name}:{key}", response, ttl=self.ttl)
+
+    async def add(self, key, response, text=None):
+        """Cache a completion generated elsewhere, e.g. one item of a batch, and share it like any other."""
+        await self._store_and_publish(key, response, text)
+
+    async def get_or_generate(self, key, generate, text=None):
+        """Return a cached completion or await generate() and cache its result."""
+        response = self.lookup(key, text)
+        if response is None:
+            response = await self._shared_lookup(key, text)
+        if response is not None:
+            return response
+
+        async def generate_and_store():
+            response = await generate()
+            await self._store_and_publish(key, response, text)
+            return response
+
+        return await self.flight.do(key, generate_and_store)
+
+    async def stream(self, key, stream_factory, text=None):
+        """Yield a cached completion in one piece, or stream a fresh one and cache it when complete."""
+        response = self.lookup(key, text)
+        if response is None:
+            response = await self._shared_lookup(key, text)
+        if response is not None:
+            yield response
+            return
+
+        async def on_complete(response):
+            await self._store_and_publish(key, response, text)
+
+        async for delta in self.flight.stream(key, stream_factory, on_complete):
+            yield delta
+
+    def stats(self):
+        lookups = self.hits + self.near_hits + self.shared_hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'hits': self.hits,
+            'near_hits': self.near_hits,
+            'shared_hits': self.shared_hits,
+            'misses': self.misses,
+            'hit_rate': (self.hits + self.near_hits + self.shared_hits) / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'coalesced': self.flight.followers,
+        }
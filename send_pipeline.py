@@ -0,0 +1,309 @@
+import os
+import re
+import time
+import asyncio
+import logging
+from telegram.constants import MessageLimit
+from telegram.error import BadRequest, RetryAfter
+from rate_buckets import RateBuckets
+from metrics import track_stage
+
+logger = logging.getLogger(__name__)
+
+# Telegram allows about 30 messages a second per bot; the burst is on top of the rate within one second
+TELEGRAM_SENDS_PER_SECOND = float(os.getenv('TELEGRAM_SENDS_PER_SECOND', 28))
+TELEGRAM_SENDS_BURST = float(os.getenv('TELEGRAM_SENDS_BURST', 2))
+# About one message a second in a private chat, with short bursts, and 20 a minute in a group
+TELEGRAM_CHAT_SENDS_PER_MINUTE = float(os.getenv('TELEGRAM_CHAT_SENDS_PER_MINUTE', 60))
+TELEGRAM_CHAT_SENDS_BURST = float(os.getenv('TELEGRAM_CHAT_SENDS_BURST', 3))
+TELEGRAM_GROUP_SENDS_PER_MINUTE = float(os.getenv('TELEGRAM_GROUP_SENDS_PER_MINUTE', 20))
+TELEGRAM_GROUP_SENDS_BURST = float(os.getenv('TELEGRAM_GROUP_SENDS_BURST', 3))
+# Times one send is retried after a flood-control 429 before giving up
+TELEGRAM_SEND_RETRIES = int(os.getenv('TELEGRAM_SEND_RETRIES', 3))
+
+# Legacy Markdown entities, in the order Telegram matches them: pre, code, link, bold, italic
+ENTITY = re.compile(
+    r'```.*?```'
+    r'|`[^`\n]+`'
+    r'|\[[^\[\]\n]+\]\([^()\s]+\)'
+    r'|\*(?=\S)[^*\n]*?(?<=\S)\*'
+    r'|(?<![\w\\])_(?=\S)[^_\n]*?(?<=\S)_(?!\w)',
+    re.DOTALL,
+)
+# Marker characters that start an entity unless escaped
+MARKER = re.compile(r'(?<!\\)([_*`\[])')
+ESCAPED_MARKER = re.compile(r'\\([_*`\[])')
+# Link URLs may contain balanced parentheses, which would end the legacy Markdown link early
+LINK_URL = re.compile(r'\]\(((?:[^()\s]|\([^()\s]*\))+)\)')
+# Split points for long messages, best first
+SPLIT_POINTS = ('\n\n', '\n', '. ', ' ')
+
+def sanitize_markdown(text):
+    """Make LLM output safe to send with parse_mode='Markdown'.
+
+    CommonMark bold and headings become legacy bold, and parentheses in
+    link URLs are percent-encoded. Well-formed entities are kept and every
+    other marker character is escaped, so the message always parses.
+    """
+    text = re.sub(r'\*\*(?=\S)(.+?)(?<=\S)\*\*', r'*\1*', text)
+    text = re.sub(r'__(?=\S)(.+?)(?<=\S)__', r'_\1_', text)
+    text = re.sub(r'^#{1,6}\s+(.+?)\s*#*$', r'*\1*', text, flags=re.MULTILINE)
+    text = LINK_URL.sub(lambda m: '](' + m.group(1).replace('(', '%28').replace(')', '%29') + ')', text)
+
+    parts = []
+    position = 0
+    for entity in ENTITY.finditer(text):
+        parts.append(MARKER.sub(r'\\\1', text[position:entity.start()]))
+        parts.append(entity.group())
+        position = entity.end()
+    parts.append(MARKER.sub(r'\\\1', text[position:]))
+    return ''.join(parts)
+
+def unescape_markdown(text):
+    """Plain-text version of sanitized Markdown, for when Telegram still rejects it."""
+    return ESCAPED_MARKER.sub(r'\1', text)
+
+def _split_point(text, limit, markdown):
+    spans = [entity.span() for entity in ENTITY.finditer(text, 0, limit + 1)] if markdown else []
+
+    def safe(cut):
+        return all(not start < cut < end for start, end in spans)
+
+    for separator in SPLIT_POINTS:
+        cut = text.rfind(separator, 0, limit)
+        while cut > limit // 2:
+            if safe(cut + len(separator)):
+                return cut + len(separator)
+            cut = text.rfind(separator, 0, cut)
+    return limit
+
+def split_message(text, limit=MessageLimit.MAX_TEXT_LENGTH, markdown=False):
+    """Cut text into messages of at most limit characters at paragraph, line, sentence or word breaks.
+
+    With markdown, cuts avoid the inside of entities; an entity longer
+    than a message is cut anyway and re-sanitized so both halves parse.
+    """
+    chunks = []
+    while len(text) > limit:
+        cut = _split_point(text, limit, markdown)
+        inside = markdown and any(start < cut < end for start, end in (e.span() for e in ENTITY.finditer(text)))
+        chunk, text = text[:cut].rstrip(), text[cut:].lstrip()
+        if inside:
+            # Both halves of a cut entity have an unmatched marker now
+            chunk = sanitize_markdown(unescape_markdown(chunk))[:limit]
+            text = sanitize_markdown(unescape_markdown(text))
+        chunks.append(chunk)
+    if text:
+        chunks.append(text)
+    return chunks
+
+class SendPipeline:
+    """Outbound Telegram messages under Telegram's flood limits.
+
+    Every send and edit takes a token from its bot's bucket and its chat's
+    bucket (private and group chats have separate rates) and waits when
+    either is empty. A 429 RetryAfter blocks that chat for the time
+    Telegram asks and the send is retried. Markdown is sanitized before
+    sending and long messages are split, so a reply does not fail on
+    unbalanced markers or the 4096-character limit.
+    """
+
+    def __init__(self, sends_per_second=TELEGRAM_SENDS_PER_SECOND, sends_burst=TELEGRAM_SENDS_BURST,
+                 chat_buckets: RateBuckets = None, group_buckets: RateBuckets = None,
+                 retries=TELEGRAM_SEND_RETRIES):
+        self.bot_buckets = RateBuckets(sends_per_second * 60, sends_burst)
+        if chat_buckets is None:
+            chat_buckets = RateBuckets(TELEGRAM_CHAT_SENDS_PER_MINUTE, TELEGRAM_CHAT_SENDS_BURST)
+        if group_buckets is None:
+            group_buckets = RateBuckets(TELEGRAM_GROUP_SENDS_PER_MINUTE, TELEGRAM_GROUP_SENDS_BURST)
+        self.chat_buckets = chat_buckets
+        self.group_buckets = group_buckets
+        self.retries = retries
+        # (bot, chat) -> monotonic time until which Telegram asked us to hold off
+        self.blocked_until = {}
+        self.bot_locks = {}
+
+        # Counters exposed through stats()
+        self.sent = 0
+        self.edits = 0
+        self.split = 0
+        self.waited = 0
+        self.total_wait = 0.0
+        self.retry_after = 0
+        self.dropped_edits = 0
+        self.markdown_fallbacks = 0
+        self.failures = 0
+
+    def set_rate(self, sends_per_second):
+        """Change the per-bot rate, e.g. to this process's share when several processes send for the same bots."""
+        self.bot_buckets = RateBuckets(sends_per_second * 60, self.bot_buckets.burst)
+
+    def _buckets(self, chat_id):
+        # Group and channel ids are negative
+        return self.group_buckets if chat_id < 0 else self.chat_buckets
+
+    def _chat_wait(self, bot, chat_id, now):
+        key = (bot, chat_id)
+        blocked = self.blocked_until.get(key)
+        if blocked is not None and blocked <= now:
+            del self.blocked_until[key]
+            blocked = None
+        return max(
+            self._buckets(chat_id).wait_time(key, now),
+            blocked - now if blocked is not None else 0.0,
+        )
+
+    def _take(self, bot, chat_id, now):
+        self.bot_buckets.take(bot, now)
+        self._buckets(chat_id).take((bot, chat_id), now)
+
+    async def _acquire(self, bot, chat_id):
+        """Wait for a token from the chat's bucket and then, in turn with other chats, the bot's."""
+        started = time.monotonic()
+        while True:
+            wait = self._chat_wait(bot, chat_id, time.monotonic())
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            # Senders queue on the lock in order, instead of all waking for every token
+            async with self.bot_locks.setdefault(bot, asyncio.Lock()):
+                wait = self.bot_buckets.wait_time(bot, time.monotonic())
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                now = time.monotonic()
+                if self._chat_wait(bot, chat_id, now) <= 0:
+                    self._take(bot, chat_id, now)
+                    break
+        waited = time.monotonic() - started
+        if waited > 0.001:
+            self.waited += 1
+            self.total_wait += waited
+
+    def _try_acquire(self, bot, chat_id):
+        now = time.monotonic()
+        # Queued senders go first
+        lock = self.bot_locks.get(bot)
+        queued = lock is not None and lock.locked()
+        if queued or self.bot_buckets.wait_time(bot, now) > 0 or self._chat_wait(bot, chat_id, now) > 0:
+            return False
+        self._take(bot, chat_id, now)
+        return True
+
+    async def _deliver(self, bot, chat_id, call, wait=True):
+        """Run one Bot API call under the limits, retrying flood-control 429s; None if it was dropped."""
+        for attempt in range(self.retries + 1):
+            if wait:
+                await self._acquire(bot, chat_id)
+            elif not self._try_acquire(bot, chat_id):
+                return None
+            try:
+                with track_stage('telegram_send'):
+                    return await call()
+            except RetryAfter as e:
+                self.retry_after += 1
+                now = time.monotonic()
+                if len(self.blocked_until) > 1000:
+                    self.blocked_until = {key: until for key, until in self.blocked_until.items() if until > now}
+                self.blocked_until[(bot, chat_id)] = now + e.retry_after
+                if not wait:
+                    return None
+                if attempt == self.retries:
+                    self.failures += 1
+                    raise
+                logger.warning(f"Flood control in chat {chat_id}, retrying in {e.retry_after}s")
+
+    async def _send_text(self, bot, chat_id, send, text, parse_mode):
+        """Send one chunk, falling back to plain text if Telegram still rejects its Markdown."""
+        try:
+            return await self._deliver(bot, chat_id, lambda: send(text, parse_mode))
+        except BadRequest as e:
+            if parse_mode is None or 'parse' not in str(e).lower():
+                self.failures += 1
+                raise
+            self.markdown_fallbacks += 1
+            logger.warning(f"Markdown rejected, sending plain text: {str(e)}")
+            return await self._deliver(bot, chat_id, lambda: send(unescape_markdown(text), None))
+
+    def _chunks(self, text, parse_mode):
+        markdown = parse_mode == 'Markdown'
+        chunks = split_message(sanitize_markdown(text) if markdown else text, markdown=markdown)
+        if len(chunks) > 1:
+            self.split += 1
+        return chunks
+
+    async def send(self, bot, chat_id, text, parse_mode=None, **kwargs):
+        """Send text to a chat, split into as many messages as it needs; returns the last one."""
+        message = None
+        for chunk in self._chunks(text, parse_mode):
+            message = await self._send_text(
+                bot.token, chat_id,
+                lambda text, parse_mode: bot.send_message(chat_id, text, parse_mode=parse_mode, **kwargs),
+                chunk, parse_mode,
+            )
+            self.sent += 1
+        return message
+
+    async def reply(self, message, text, parse_mode=None, **kwargs):
+        """Reply to a message with text, split into as many messages as it needs; returns the last one."""
+        sent = None
+        for chunk in self._chunks(text, parse_mode):
+            sent = await self._send_text(
+                message.get_bot().token, message.chat_id,
+                lambda text, parse_mode: message.reply_text(text, parse_mode=parse_mode, **kwargs),
+                chunk, parse_mode,
+            )
+            self.sent += 1
+        return sent
+
+    async def edit(self, message, text, parse_mode=None, wait=True, **kwargs):
+        """Replace a sent message's text; the rest of a long text follows as replies.
+
+        Without wait, the edit is dropped instead of waiting for the limits
+        and False is returned; only the first message's worth is used, which
+        suits interim streaming edits.
+        """
+        chunks = self._chunks(text, parse_mode)
+        bot, chat_id = message.get_bot().token, message.chat_id
+
+        async def edit_text(text, parse_mode):
+            try:
+                return await message.edit_text(text, parse_mode=parse_mode, **kwargs)
+            except BadRequest as e:
+                if 'not modified' not in str(e).lower():
+                    raise
+                return message
+
+        if not wait:
+            if await self._deliver(bot, chat_id, lambda: edit_text(chunks[0], parse_mode), wait=False) is None:
+                self.dropped_edits += 1
+                return False
+            self.edits += 1
+            return True
+
+        await self._send_text(bot, chat_id, edit_text, chunks[0], parse_mode)
+        self.edits += 1
+        for chunk in chunks[1:]:
+            await self._send_text(
+                bot, chat_id,
+                lambda text, parse_mode: message.reply_text(text, parse_mode=parse_mode, **kwargs),
+                chunk, parse_mode,
+            )
+            self.sent += 1
+        return True
+
+    def stats(self):
+        return {
+            'sent': self.sent,
+            'edits': self.edits,
+            'split': self.split,
+            'waited': self.waited,
+            'avg_wait_seconds': self.total_wait / self.waited if self.waited else 0.0,
+            'retry_after': self.retry_after,
+            'dropped_edits': self.dropped_edits,
+            'markdown_fallbacks': self.markdown_fallbacks,
+            'failures': self.failures,
+            'blocked_chats': len(self.blocked_until),
+        }
+
+# Shared by every bot; limits are kept per bot token
+sender = SendPipeline()
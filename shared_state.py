@@ -0,0 +1,156 @@
+import os
+import json
+import time
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 'memory' keeps state in this process; 'redis' shares it between processes and instances
+STATE_BACKEND = os.getenv('STATE_BACKEND', 'memory').lower()
+REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+STATE_KEY_PREFIX = os.getenv('STATE_KEY_PREFIX', 'telebots:')
+
+class MemoryBackend:
+    """Process-local key/value store with expiry; the default for a single process."""
+    shared = False
+
+    def __init__(self):
+        self.values = {}
+        self.expires_at = {}
+
+    def _live(self, key):
+        expires_at = self.expires_at.get(key)
+        if expires_at is not None and time.monotonic() >= expires_at:
+            self.values.pop(key, None)
+            del self.expires_at[key]
+        return key in self.values
+
+    def _put(self, key, value, ttl):
+        self.values[key] = value
+        if ttl is None:
+            self.expires_at.pop(key, None)
+        else:
+            self.expires_at[key] = time.monotonic() + ttl
+
+    async def get(self, key):
+        return self.values[key] if self._live(key) else None
+
+    async def set(self, key, value, ttl=None):
+        self._put(key, value, ttl)
+
+    async def set_if_absent(self, key, value, ttl=None):
+        """Store value unless key exists; True if it was stored."""
+        if self._live(key):
+            return False
+        self._put(key, value, ttl)
+        return True
+
+    async def incr(self, key, ttl=None):
+        """Increment a counter, starting its expiry when it is created."""
+        if self._live(key):
+            self.values[key] += 1
+        else:
+            self._put(key, 1, ttl)
+        return self.values[key]
+
+    async def delete(self, key):
+        self.values.pop(key, None)
+        self.expires_at.pop(key, None)
+
+    async def close(self):
+        pass
+
+class RedisBackend:
+    """Store shared by every process and instance pointed at the same Redis-compatible server."""
+    shared = True
+
+    def __init__(self, url=REDIS_URL, prefix=STATE_KEY_PREFIX):
+        # Optional dependency, only needed when STATE_BACKEND=redis
+        import redis.asyncio as redis
+        self.redis = redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+
+    async def get(self, key):
+        return await self.redis.get(self.prefix + key)
+
+    async def set(self, key, value, ttl=None):
+        await self.redis.set(self.prefix + key, value, px=self._ms(ttl))
+
+    async def set_if_absent(self, key, value, ttl=None):
+        return bool(await self.redis.set(self.prefix + key, value, px=self._ms(ttl), nx=True))
+
+    async def incr(self, key, ttl=None):
+        key = self.prefix + key
+        count = await self.redis.incr(key)
+        if count == 1 and ttl is not None:
+            await self.redis.pexpire(key, self._ms(ttl))
+        return count
+
+    async def delete(self, key):
+        await self.redis.delete(self.prefix + key)
+
+    async def close(self):
+        await self.redis.aclose()
+
+    @staticmethod
+    def _ms(ttl):
+        return None if ttl is None else max(1, int(ttl * 1000))
+
+class SharedState:
+    """Front end for the configured backend, with JSON and rate-limit helpers."""
+
+    def __init__(self, backend=STATE_BACKEND):
+        self.backend_name = backend
+        self.backend = None
+
+    def _backend(self):
+        if self.backend is None:
+            if self.backend_name == 'redis':
+                self.backend = RedisBackend()
+                logger.info(f"Sharing cache and rate-limit state through {REDIS_URL}")
+            else:
+                self.backend = MemoryBackend()
+        return self.backend
+
+    @property
+    def shared(self):
+        return self._backend().shared
+
+    async def get(self, key):
+        return await self._backend().get(key)
+
+    async def set(self, key, value, ttl=None):
+        await self._backend().set(key, value, ttl)
+
+    async def set_if_absent(self, key, value, ttl=None):
+        return await self._backend().set_if_absent(key, value, ttl)
+
+    async def incr(self, key, ttl=None):
+        return await self._backend().incr(key, ttl)
+
+    async def delete(self, key):
+        await self._backend().delete(key)
+
+    async def get_json(self, key):
+        value = await self.get(key)
+        return None if value is None else json.loads(value)
+
+    async def set_json(self, key, value, ttl=None):
+        await self.set(key, json.dumps(value), ttl)
+
+    async def acquire_window(self, key, limit, window):
+        """Wait for a slot in a fixed-window limit of `limit` calls per `window` seconds."""
+        while True:
+            now = time.time()
+            bucket = int(now // window)
+            if await self.incr(f"{key}:{bucket}", ttl=window * 2) <= limit:
+                return
+            await asyncio.sleep((bucket + 1) * window - now)
+
+    async def close(self):
+        if self.backend is not None:
+            await self.backend.close()
+            self.backend = None
+
+state = SharedState()
@@ -0,0 +1,145 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+class SharedStream:
+    """Deltas of one in-flight stream, replayed to every follower as they arrive."""
+
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.changed = asyncio.Condition()
+
+    async def append(self, chunk):
+        async with self.changed:
+            self.chunks.append(chunk)
+            self.changed.notify_all()
+
+    async def finish(self, error=None):
+        async with self.changed:
+            self.done = True
+            self.error = error
+            self.changed.notify_all()
+
+    async def follow(self):
+        position = 0
+        while True:
+            async with self.changed:
+                await self.changed.wait_for(lambda: len(self.chunks) > position or self.done)
+                pending = self.chunks[position:]
+                finished, error = self.done, self.error
+            for chunk in pending:
+                yield chunk
+            position += len(pending)
+            if finished and position == len(self.chunks):
+                if error is not None:
+                    raise error
+                return
+
+    async def result(self):
+        return ''.join([chunk async for chunk in self.follow()])
+
+class SingleFlight:
+    """Coalesce concurrent identical work so callers sharing a key share one upstream call.
+
+    The first caller for a key starts the work in a background task; callers
+    arriving while it runs wait on the same task, and its result or exception
+    is delivered to all of them. A caller that times out or is cancelled
+    stops waiting without cancelling the work for the others.
+    """
+
+    def __init__(self, name, timeout=None):
+        self.name = name
+        self.timeout = timeout
+        self.calls = {}
+        self.streams = {}
+        self.pumps = set()
+
+        # Counters exposed through stats()
+        self.leaders = 0
+        self.followers = 0
+        self.timeouts = 0
+
+    def _forget(self, registry, key, value):
+        if registry.get(key) is value:
+            del registry[key]
+
+    async def do(self, key, func, timeout=None):
+        """Await func() once per key across concurrent callers."""
+        if key in self.streams:
+            self.followers += 1
+            return await self.streams[key].result()
+
+        task = self.calls.get(key)
+        if task is None:
+            self.leaders += 1
+            task = asyncio.ensure_future(func())
+            self.calls[key] = task
+            task.add_done_callback(lambda t: self._forget(self.calls, key, t))
+            # Nobody may be left to retrieve the exception once every waiter timed out
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        else:
+            self.followers += 1
+
+        timeout = self.timeout if timeout is None else timeout
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            logger.warning(f"Timed out waiting for {self.name} call {key}")
+            raise
+
+    async def stream(self, key, stream_factory, on_complete=None):
+        """Yield the deltas of stream_factory() once per key across concurrent callers.
+
+        on_complete(text) is awaited with the full text when the stream finishes.
+        """
+        task = self.calls.get(key)
+        if task is not None:
+            self.followers += 1
+            yield await asyncio.shield(task)
+            return
+
+        shared = self.streams.get(key)
+        if shared is None:
+            self.leaders += 1
+            shared = SharedStream()
+            self.streams[key] = shared
+            pump = asyncio.create_task(self._pump(key, shared, stream_factory, on_complete))
+            self.pumps.add(pump)
+            pump.add_done_callback(self.pumps.discard)
+        else:
+            self.followers += 1
+
+        async for chunk in shared.follow():
+            yield chunk
+
+    async def _pump(self, key, shared, stream_factory, on_complete):
+        error = None
+        try:
+            deltas = stream_factory()
+            try:
+                async for delta in deltas:
+                    await shared.append(delta)
+            finally:
+                await deltas.aclose()
+            if on_complete is not None:
+                await on_complete(''.join(shared.chunks))
+        except asyncio.CancelledError:
+            error = RuntimeError(f"{self.name} stream {key} was cancelled")
+            raise
+        except Exception as e:
+            error = e
+        finally:
+            self._forget(self.streams, key, shared)
+            await shared.finish(error)
+
+    def stats(self):
+        return {
+            'in_flight': len(self.calls) + len(self.streams),
+            'leaders': self.leaders,
+            'followers': self.followers,
+            'timeouts': self.timeouts,
+        }
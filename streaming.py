@@ -0,0 +1,85 @@
+import os
+import re
+import time
+import logging
+from contextlib import aclosing
+from telegram import Message
+from telegram.constants import MessageLimit
+from send_pipeline import sender
+
+logger = logging.getLogger(__name__)
+
+# Stream completions into an edited placeholder instead of one final reply
+STREAM_RESPONSES = os.getenv('STREAM_RESPONSES', 'true').lower() == 'true'
+
+# Telegram starts refusing edits to the same message at around one per second
+STREAM_EDIT_INTERVAL = float(os.getenv('STREAM_EDIT_INTERVAL', 1.0))
+
+def strip_markdown(text):
+    """Drop Markdown markers so partial output can be shown as plain text."""
+    return re.sub(r'[*_`]', '', text)
+
+class StreamingReply:
+    """Reply that starts as a placeholder and is edited as a completion streams in.
+
+    Edits are coalesced to at most one per STREAM_EDIT_INTERVAL. Interim
+    edits are plain text because half-written Markdown rarely parses; the
+    final edit is rendered as Markdown. With streaming disabled the
+    completion is collected and sent as a single reply, as before. Every
+    message goes through the send pipeline, which handles flood limits,
+    Markdown sanitizing and splitting.
+    """
+
+    def __init__(self, message: Message, enabled: bool = STREAM_RESPONSES,
+                 edit_interval: float = STREAM_EDIT_INTERVAL, **reply_kwargs):
+        self.message = message
+        self.enabled = enabled
+        self.edit_interval = edit_interval
+        self.reply_kwargs = reply_kwargs
+        self.placeholder = None
+        self.last_edit = 0.0
+        self.last_text = None
+
+    async def start(self, text: str):
+        """Send the placeholder message."""
+        if self.enabled:
+            self.placeholder = await sender.reply(self.message, text)
+            self.last_text = text
+
+    async def _edit(self, text: str):
+        """Show interim text, skipping the edit if it would run into Telegram's flood limits."""
+        text = text[:MessageLimit.MAX_TEXT_LENGTH]
+        if text == self.last_text:
+            return
+        if await sender.edit(self.placeholder, text, wait=False, **self.reply_kwargs):
+            self.last_text = text
+        self.last_edit = time.monotonic()
+
+    async def stream(self, deltas, header: str = '', footer: str = ''):
+        """Consume an async iterator of text deltas, render header + text + footer and return the text."""
+        text = ''
+        async with aclosing(deltas):
+            async for delta in deltas:
+                text += delta
+                if self.placeholder is not None and time.monotonic() - self.last_edit >= self.edit_interval:
+                    await self._edit(strip_markdown(header + text))
+        await self.send(header + text + footer)
+        return text
+
+    async def send(self, message: str):
+        """Render the final message as Markdown, split over several messages if it is too long."""
+        if self.placeholder is None:
+            await sender.reply(self.message, message, parse_mode='Markdown', **self.reply_kwargs)
+        else:
+            await sender.edit(self.placeholder, message, parse_mode='Markdown', **self.reply_kwargs)
+
+    async def fail(self, text: str):
+        """Replace the placeholder with an error message, or reply if none was sent."""
+        if self.placeholder is None:
+            await sender.reply(self.message, text)
+            return
+        try:
+            await sender.edit(self.placeholder, text)
+        except Exception as e:
+            logger.error(f"Error replacing placeholder: {str(e)}")
+            await sender.reply(self.message, text)
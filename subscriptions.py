@@ -0,0 +1,304 @@
+import os
+import time
+import asyncio
+import logging
+from datetime import datetime, timezone
+from telegram.error import Forbidden
+from send_pipeline import sender
+from jsonl_log import JsonLinesLog
+from shared_state import state
+from dispatcher import WORKER_INDEX
+
+logger = logging.getLogger(__name__)
+
+# Directory for each bot's subscriber log, replayed on restart; empty keeps subscribers in memory only
+SUBSCRIPTIONS_DIR = os.getenv('SUBSCRIPTIONS_DIR', '')
+# Seconds between writes of buffered subscription changes to the log
+SUBSCRIPTIONS_FLUSH_INTERVAL = float(os.getenv('SUBSCRIPTIONS_FLUSH_INTERVAL', 1.0))
+# Time of day (UTC) used by a subscribe without one
+SUBSCRIPTION_DEFAULT_TIME = os.getenv('SUBSCRIPTION_DEFAULT_TIME', '09:00')
+# Concurrent sends while fanning a slot's message out; the send pipeline sets the actual rate
+SUBSCRIPTION_FANOUT_CONCURRENCY = int(os.getenv('SUBSCRIPTION_FANOUT_CONCURRENCY', 100))
+# Attempts at producing a slot's message before the slot is skipped for the day
+SUBSCRIPTION_PRODUCE_ATTEMPTS = int(os.getenv('SUBSCRIPTION_PRODUCE_ATTEMPTS', 3))
+# Seconds other processes wait for the one producing a slot's shared message
+SUBSCRIPTION_SHARED_WAIT = float(os.getenv('SUBSCRIPTION_SHARED_WAIT', 120))
+
+MINUTES_PER_DAY = 24 * 60
+
+def parse_slot(text):
+    """Minute of the day for an 'HH:MM' or 'HH' time, or None if it is not one."""
+    hours, _, minutes = text.strip().partition(':')
+    try:
+        hours, minutes = int(hours), int(minutes or 0)
+    except ValueError:
+        return None
+    if not (0 <= hours < 24 and 0 <= minutes < 60):
+        return None
+    return hours * 60 + minutes
+
+def format_slot(slot):
+    return f"{slot // 60:02d}:{slot % 60:02d}"
+
+def current_slot(now=None):
+    """Minute of the day in UTC."""
+    now = datetime.now(timezone.utc) if now is None else now
+    return now.hour * 60 + now.minute
+
+class SubscriptionStore:
+    """Subscribed chats and the minute of the day each wants its message.
+
+    Chats are indexed both ways: chat to slot for subscribe and unsubscribe,
+    and slot to the set of its chats so a due slot is found without a scan.
+    With a log path, changes are appended to a JSON-lines log in the
+    background and replayed by load(); the log is rewritten with one line
+    per chat when it grows well past the live subscriptions.
+    """
+
+    def __init__(self, path='', flush_interval=SUBSCRIPTIONS_FLUSH_INTERVAL):
+        self.chats = {}
+        self.slots = {}
+        self.log = JsonLinesLog(
+            'subscriptions', path,
+            lambda: [{'chat': chat_id, 'slot': slot} for chat_id, slot in self.chats.items()],
+            lambda: len(self.chats),
+            flush_interval,
+        )
+
+    @property
+    def path(self):
+        return self.log.path
+
+    @path.setter
+    def path(self, path):
+        self.log.path = path
+
+    def __len__(self):
+        return len(self.chats)
+
+    def slot_of(self, chat_id):
+        return self.chats.get(chat_id)
+
+    def due(self, slot):
+        """Chats subscribed to a slot."""
+        return self.slots.get(slot, ())
+
+    def _set(self, chat_id, slot):
+        old = self.chats.pop(chat_id, None)
+        if old is not None:
+            chats = self.slots[old]
+            chats.discard(chat_id)
+            if not chats:
+                del self.slots[old]
+        if slot is not None:
+            self.chats[chat_id] = slot
+            self.slots.setdefault(slot, set()).add(chat_id)
+        return old
+
+    def subscribe(self, chat_id, slot):
+        """Subscribe a chat to a slot, moving it from any earlier one."""
+        self._set(chat_id, slot)
+        self.log.record(chat_id, {'chat': chat_id, 'slot': slot})
+
+    def unsubscribe(self, chat_id):
+        """Remove a chat; False if it was not subscribed."""
+        if self._set(chat_id, None) is None:
+            return False
+        self.log.record(chat_id, {'chat': chat_id, 'slot': None})
+        return True
+
+    async def load(self):
+        """Replay the log and rewrite it compacted; no-op without a path."""
+        if not self.path:
+            return
+        entries = await self.log.read()
+        if entries is None:
+            # Keep the unreadable log rather than compacting it to nothing
+            return
+        for entry in entries:
+            self._set(entry['chat'], entry['slot'])
+        try:
+            await self.log.compact()
+        except OSError as e:
+            logger.error(f"Error compacting subscriptions in {self.path}: {str(e)}")
+        logger.info(f"Loaded {len(self.chats)} subscriptions from {self.path}")
+
+    async def flush(self):
+        """Append buffered changes to the log, compacting it when it has grown too long."""
+        await self.log.flush()
+
+    async def start(self):
+        """Load saved subscriptions and start writing changes to the log."""
+        if self.path and self.log.task is None:
+            await self.load()
+            self.log.start()
+
+    async def stop(self):
+        await self.log.stop()
+
+    def stats(self):
+        return {
+            'subscribers': len(self.chats),
+            'slots': len(self.slots),
+            'writes': self.log.writes,
+            'write_errors': self.log.write_errors,
+        }
+
+class DailyDelivery:
+    """Sends one message a day to every subscriber at the minute they chose.
+
+    Once a minute the due slots are looked up in the store. For each, the
+    message is produced once with produce(slot) and sent to all of the
+    slot's chats by a fixed number of concurrent senders through the send
+    pipeline, which holds the fan-out to the bot's flood limits. Chats that
+    have blocked the bot are unsubscribed. With a shared state backend, one
+    process produces each day's message for a slot and the others send the
+    same one to their own subscribers.
+    """
+
+    def __init__(self, name, produce, store: SubscriptionStore = None, directory=None,
+                 concurrency=SUBSCRIPTION_FANOUT_CONCURRENCY, attempts=SUBSCRIPTION_PRODUCE_ATTEMPTS,
+                 pipeline=sender):
+        self.name = name
+        self.produce = produce
+        self.directory = directory if directory is not None else SUBSCRIPTIONS_DIR
+        self.store = store if store is not None else SubscriptionStore()
+        self.concurrency = concurrency
+        self.attempts = attempts
+        self.pipeline = pipeline
+        self.bot = None
+        self.task = None
+        self.deliveries = set()
+
+        # Counters exposed through stats()
+        self.slots_run = 0
+        self.slots_skipped = 0
+        self.shared_messages = 0
+        self.delivered = 0
+        self.failed = 0
+        self.blocked = 0
+        self.last_fanout = None
+
+    async def _produce(self, slot):
+        for attempt in range(1, self.attempts + 1):
+            try:
+                return await self.produce(slot)
+            except Exception as e:
+                logger.error(f"Error producing the {self.name} message for {format_slot(slot)} "
+                             f"(attempt {attempt}): {str(e)}")
+        return None
+
+    async def _shared_message(self, slot, day):
+        """The slot's message for the day, produced by whichever process claims it first."""
+        if not state.shared:
+            return await self._produce(slot)
+        key = f"daily:{self.name}:{day}:{slot}"
+        if await state.set_if_absent(f"{key}:producer", '1', ttl=SUBSCRIPTION_SHARED_WAIT):
+            text = await self._produce(slot)
+            if text is not None:
+                await state.set_json(key, text, ttl=MINUTES_PER_DAY * 60)
+            return text
+        deadline = time.monotonic() + SUBSCRIPTION_SHARED_WAIT
+        while time.monotonic() < deadline:
+            text = await state.get_json(key)
+            if text is not None:
+                self.shared_messages += 1
+                return text
+            await asyncio.sleep(1)
+        logger.error(f"No shared {self.name} message for {format_slot(slot)} after {SUBSCRIPTION_SHARED_WAIT}s")
+        return None
+
+    async def _send(self, chat_id, slot, text):
+        # The chat may have unsubscribed or moved since the slot started
+        if self.store.slot_of(chat_id) != slot:
+            return
+        try:
+            await self.pipeline.send(self.bot, chat_id, text, parse_mode='Markdown', disable_web_page_preview=True)
+            self.delivered += 1
+        except Forbidden:
+            self.blocked += 1
+            self.store.unsubscribe(chat_id)
+        except Exception as e:
+            self.failed += 1
+            logger.warning(f"Error sending the {self.name} message to chat {chat_id}: {str(e)}")
+
+    async def deliver(self, slot):
+        """Get the slot's message, produced once, and send it to every chat subscribed to the slot."""
+        chats = list(self.store.due(slot))
+        if not chats:
+            return
+        started = time.monotonic()
+        text = await self._shared_message(slot, datetime.now(timezone.utc).date().isoformat())
+        if text is None:
+            self.slots_skipped += 1
+            return
+        pending = iter(chats)
+
+        async def send_next():
+            # Every sender takes the next chat from the shared iterator
+            for chat_id in pending:
+                await self._send(chat_id, slot, text)
+
+        await asyncio.gather(*(send_next() for _ in range(min(self.concurrency, len(chats)))))
+        self.slots_run += 1
+        self.last_fanout = {
+            'slot': format_slot(slot),
+            'chats': len(chats),
+            'seconds': round(time.monotonic() - started, 3),
+        }
+        logger.info(f"Delivered the {self.name} message for {format_slot(slot)} to {len(chats)} chats "
+                    f"in {self.last_fanout['seconds']}s")
+
+    def _start_delivery(self, slot):
+        task = asyncio.create_task(self.deliver(slot), name=f"{self.name}-{format_slot(slot)}")
+        self.deliveries.add(task)
+        task.add_done_callback(self.deliveries.discard)
+
+    async def _run(self):
+        # Slots that passed while the process was down are not caught up
+        last = current_slot()
+        while True:
+            await asyncio.sleep(60 - time.time() % 60)
+            now = current_slot()
+            # Walk every minute since the last tick, so a late wake-up skips no slot
+            while last != now:
+                last = (last + 1) % MINUTES_PER_DAY
+                if self.store.due(last):
+                    self._start_delivery(last)
+
+    async def start(self):
+        """Load subscribers and start the once-a-minute scheduler; the bot must be set first."""
+        if self.task is not None:
+            return
+        directory = self.directory
+        if directory and WORKER_INDEX is not None:
+            # Chats always go to the same worker, so each worker keeps its own subscribers
+            directory = os.path.join(directory, f"worker-{WORKER_INDEX}")
+        if directory and not self.store.path:
+            self.store.path = os.path.join(directory, f"{self.name}.jsonl")
+        await self.store.start()
+        self.task = asyncio.create_task(self._run(), name=f"{self.name}-scheduler")
+
+    async def stop(self):
+        """Stop the scheduler, cancel deliveries in progress and flush subscription changes."""
+        tasks = list(self.deliveries)
+        if self.task is not None:
+            tasks.append(self.task)
+            self.task = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self.store.stop()
+
+    def stats(self):
+        return dict(
+            self.store.stats(),
+            slots_run=self.slots_run,
+            slots_skipped=self.slots_skipped,
+            shared_messages=self.shared_messages,
+            delivering=len(self.deliveries),
+            delivered=self.delivered,
+            failed=self.failed,
+            blocked=self.blocked,
+            last_fanout=self.last_fanout,
+        )
@@ -0,0 +1,101 @@
+"""/search against saved Wikipedia API responses, served through httpx.MockTransport."""
+import asyncio
+import json
+import os
+
+import httpx
+import pytest
+
+import wiki_facts_bot
+from article_cache import ArticleCache
+from http_client import PooledClient
+from singleflight import SingleFlight
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES, name)) as f:
+        return json.load(f)
+
+
+@pytest.fixture
+def wikipedia(monkeypatch):
+    """Route the bot's Wikipedia calls to fixtures; returns the fixture map and the requests made."""
+    responses = {}
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        params = request.url.params
+        kind = 'search' if params.get('generator') == 'search' else 'article'
+        return httpx.Response(200, json=load_fixture(responses[kind]))
+
+    client = PooledClient('wikipedia-test')
+    client.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    client.semaphore = asyncio.Semaphore(client.max_concurrency)
+    monkeypatch.setattr(wiki_facts_bot, 'wikipedia_client', client)
+    monkeypatch.setattr(wiki_facts_bot, 'article_cache', ArticleCache('wikipedia-test', path=None))
+    monkeypatch.setattr(wiki_facts_bot, 'wikipedia_flight', SingleFlight('wikipedia-test'))
+    return responses, requests
+
+
+def test_search_returns_top_article_dict(wikipedia):
+    responses, requests = wikipedia
+    responses['search'] = 'search_generator.json'
+
+    article, error = asyncio.run(wiki_facts_bot.search_wikipedia('roman aqueduct'))
+
+    assert error is None
+    assert article == {
+        'title': 'Roman aqueduct',
+        'url': 'https://en.wikipedia.org/wiki/Roman_aqueduct',
+        'content': (
+            'The Romans constructed aqueducts throughout their Republic and later Empire. '
+            'Aqueducts moved water through gravity alone. '
+            'They supplied public baths.'
+        ),
+    }
+    # Resolving the query and fetching the article take one request
+    assert len(requests) == 1
+    assert requests[0].url.params['gsrsearch'] == 'roman aqueduct'
+    assert requests[0].url.params['gsrlimit'] == '1'
+
+
+def test_search_falls_back_to_article_fetch_without_extract(wikipedia):
+    responses, requests = wikipedia
+    responses['search'] = 'search_no_extract.json'
+    responses['article'] = 'article_extract.json'
+
+    article, error = asyncio.run(wiki_facts_bot.search_wikipedia('roman aqueducts list'))
+
+    assert error is None
+    assert article == {
+        'title': 'List of Roman aqueducts',
+        'url': 'https://en.wikipedia.org/wiki/List_of_Roman_aqueducts',
+        'content': 'This is a list of aqueducts built by the Romans. It is ordered by province.',
+    }
+    assert len(requests) == 2
+    assert requests[1].url.params['titles'] == 'List of Roman aqueducts'
+
+
+def test_search_without_results(wikipedia):
+    responses, _ = wikipedia
+    responses['search'] = 'search_empty.json'
+
+    article, error = asyncio.run(wiki_facts_bot.search_wikipedia('qwxzv'))
+
+    assert article is None
+    assert error == "No relevant articles found. Please try a different search term."
+
+
+def test_article_by_title_uses_the_canonical_title(wikipedia):
+    responses, requests = wikipedia
+    responses['article'] = 'article_extract.json'
+
+    article, error = asyncio.run(wiki_facts_bot.get_wiki_article_by_title('roman aqueducts list'))
+
+    assert error is None
+    # Wikipedia followed the redirect, so the reply and chat state name the page it landed on
+    assert article['title'] == 'List of Roman aqueducts'
+    assert requests[0].url.params['titles'] == 'roman aqueducts list'
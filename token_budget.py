@@ -0,0 +1,129 @@
+import os
+import re
+import logging
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+# Context window of the model the bots use; gpt-3.5-turbo takes 16k tokens
+LLM_CONTEXT_TOKENS = int(os.getenv('LLM_CONTEXT_TOKENS', 16385))
+# Completions are never cut below this many tokens, even for very long prompts
+LLM_MIN_COMPLETION_TOKENS = int(os.getenv('LLM_MIN_COMPLETION_TOKENS', 64))
+# Most tokens of article text put into one summary prompt
+SUMMARY_INPUT_BUDGET = int(os.getenv('SUMMARY_INPUT_BUDGET', 400))
+# Most tokens of user-supplied idea text put into one analysis prompt
+ANALYSIS_INPUT_BUDGET = int(os.getenv('ANALYSIS_INPUT_BUDGET', 400))
+# tiktoken encoding used when tiktoken is installed; otherwise tokens are estimated
+TOKENIZER_ENCODING = os.getenv('TOKENIZER_ENCODING', 'cl100k_base')
+
+# Tokens the chat format adds per message and per reply, as counted by OpenAI
+TOKENS_PER_MESSAGE = 4
+TOKENS_PER_REPLY = 3
+
+SENTENCE_END = re.compile(r'(?<=[.!?])\s+(?=[A-Z0-9"\'(])')
+PIECE = re.compile(r'\w+|[^\w\s]')
+WORD = re.compile(r'[a-z]{3,}')
+STOPWORDS = frozenset(
+    'the and for are was were with that this from his her its their they which who has have had '
+    'been not but also into than then there these those such can may one two all any its over'.split()
+)
+
+class TokenBudget:
+    """Counts prompt tokens locally and fits variable prompt text into a token budget.
+
+    Text over budget is compressed by sentence: the first sentence is always
+    kept, the rest are ranked by how many of the text's frequent words they
+    carry and kept best first while they fit, in their original order. A
+    single sentence over budget is cut at a word boundary.
+    """
+
+    def __init__(self, context_tokens=LLM_CONTEXT_TOKENS, min_completion_tokens=LLM_MIN_COMPLETION_TOKENS):
+        self.context_tokens = context_tokens
+        self.min_completion_tokens = min_completion_tokens
+        self.encoder = None
+        self.encoder_loaded = False
+
+        # Counters exposed through stats()
+        self.fitted = 0
+        self.compressed = 0
+        self.tokens_removed = 0
+        self.completions_capped = 0
+
+    def _encoder(self):
+        if not self.encoder_loaded:
+            self.encoder_loaded = True
+            try:
+                # Optional dependency; the estimate below is close enough for budgeting
+                import tiktoken
+                self.encoder = tiktoken.get_encoding(TOKENIZER_ENCODING)
+            except Exception as e:
+                logger.info(f"Estimating token counts locally, tiktoken unavailable: {str(e)}")
+        return self.encoder
+
+    def count(self, text):
+        """Number of tokens in text, exact with tiktoken and estimated otherwise."""
+        encoder = self._encoder()
+        if encoder is not None:
+            return len(encoder.encode(text))
+        # Common words are one token; longer ones and numbers split about every six characters
+        return sum(1 + (len(piece) - 1) // 6 for piece in PIECE.findall(text))
+
+    def count_messages(self, messages):
+        return TOKENS_PER_REPLY + sum(TOKENS_PER_MESSAGE + self.count(m['content']) for m in messages)
+
+    def _cut(self, sentence, limit):
+        kept, used = [], 0
+        for word in sentence.split():
+            used += self.count(' ' + word)
+            if used > limit:
+                break
+            kept.append(word)
+        return ' '.join(kept)
+
+    def fit(self, text, limit):
+        """Return text unchanged if it fits in limit tokens, else an extract of its sentences that does."""
+        self.fitted += 1
+        total = self.count(text)
+        if total <= limit:
+            return text
+
+        sentences = SENTENCE_END.split(text.strip())
+        frequency = Counter(word for word in WORD.findall(text.lower()) if word not in STOPWORDS)
+
+        def score(index):
+            words = [word for word in WORD.findall(sentences[index].lower()) if word not in STOPWORDS]
+            return sum(frequency[word] for word in words) / (len(words) + 1)
+
+        lengths = [self.count(sentence) + 1 for sentence in sentences]
+        if lengths[0] > limit:
+            result = self._cut(sentences[0], limit)
+        else:
+            kept, used = [], 0
+            for index in [0] + sorted(range(1, len(sentences)), key=score, reverse=True):
+                if used + lengths[index] <= limit:
+                    kept.append(index)
+                    used += lengths[index]
+            result = ' '.join(sentences[index] for index in sorted(kept))
+        self.compressed += 1
+        self.tokens_removed += total - self.count(result)
+        return result
+
+    def completion_tokens(self, messages, max_tokens):
+        """Lower max_tokens to what the context window leaves after the prompt."""
+        available = self.context_tokens - self.count_messages(messages)
+        if available >= max_tokens:
+            return max_tokens
+        self.completions_capped += 1
+        return max(self.min_completion_tokens, available)
+
+    def stats(self):
+        return {
+            'tokenizer': 'tiktoken' if self._encoder() is not None else 'estimate',
+            'fitted': self.fitted,
+            'compressed': self.compressed,
+            'tokens_removed': self.tokens_removed,
+            'completions_capped': self.completions_capped,
+        }
+
+# Shared instance used by the prompt builders and the LLM client
+budget = TokenBudget()
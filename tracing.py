@@ -0,0 +1,300 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import threading
+import traceback
+import contextvars
+from collections import deque, Counter
+from contextlib import asynccontextmanager, contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Opt-in: per-update span trees, event-loop blocking detection and slow-update dumps
+TRACE_UPDATES = os.getenv('TRACE_UPDATES', 'false').lower() == 'true'
+TRACE_SLOW_THRESHOLD = float(os.getenv('TRACE_SLOW_THRESHOLD', 5.0))
+TRACE_PATH = os.getenv('TRACE_PATH', 'slow_updates.jsonl')
+TRACE_LOOP_BLOCK_MS = float(os.getenv('TRACE_LOOP_BLOCK_MS', 100))
+
+# Sampling profiler for slow updates; samples the event loop thread's stack
+TRACE_PROFILE = os.getenv('TRACE_PROFILE', 'false').lower() == 'true'
+TRACE_PROFILE_INTERVAL_MS = float(os.getenv('TRACE_PROFILE_INTERVAL_MS', 10))
+
+# Stack depth kept for loop blocks and profile samples
+STACK_LIMIT = 30
+
+class Span:
+    """A timed step in handling an update, with the steps it contains."""
+    __slots__ = ('name', 'start', 'end', 'error', 'attrs', 'children')
+
+    def __init__(self, name, start=None, **attrs):
+        self.name = name
+        self.start = time.monotonic() if start is None else start
+        self.end = None
+        self.error = None
+        self.attrs = attrs
+        self.children = []
+
+    def finish(self, error=None):
+        self.end = time.monotonic()
+        if error is not None:
+            self.error = f"{type(error).__name__}: {str(error)}"
+
+    @property
+    def duration(self):
+        return (self.end if self.end is not None else time.monotonic()) - self.start
+
+    def to_dict(self, origin):
+        """Serialize with times in milliseconds relative to origin."""
+        data = {
+            'name': self.name,
+            'start_ms': round((self.start - origin) * 1000, 2),
+            'duration_ms': round(self.duration * 1000, 2),
+        }
+        if self.end is None:
+            data['unfinished'] = True
+        if self.error:
+            data['error'] = self.error
+        if self.attrs:
+            data.update(self.attrs)
+        if self.children:
+            data['children'] = [child.to_dict(origin) for child in self.children]
+        return data
+
+# Innermost open span of the update being processed; None outside a traced update
+current_span = contextvars.ContextVar('current_span', default=None)
+
+def active():
+    return current_span.get() is not None
+
+@contextmanager
+def span(name, **attrs):
+    """Record a child span of the current span; a no-op outside a traced update."""
+    parent = current_span.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(name, **attrs)
+    parent.children.append(child)
+    token = current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.finish(e)
+        raise
+    else:
+        child.finish()
+    finally:
+        current_span.reset(token)
+
+def record_span(name, seconds, **attrs):
+    """Attach a span measured elsewhere, e.g. time summed over many chunks, ending now."""
+    parent = current_span.get()
+    if parent is None:
+        return
+    child = Span(name, start=time.monotonic() - seconds, **attrs)
+    child.end = child.start + seconds
+    parent.children.append(child)
+
+async def http_trace(event_name, info):
+    """httpcore trace hook: turn connection phases (TCP/DNS connect, TLS, headers) into spans."""
+    parent = current_span.get()
+    if parent is None:
+        return
+    # Event names look like "connection.connect_tcp.started" / ".complete" / ".failed"
+    phase, _, status = event_name.rpartition('.')
+    if status == 'started':
+        parent.children.append(Span(phase))
+        return
+    for child in reversed(parent.children):
+        if child.name == phase and child.end is None:
+            child.finish(info.get('exception') if status == 'failed' else None)
+            break
+
+def format_stack(frame):
+    return [
+        f"{os.path.basename(entry.filename)}:{entry.lineno} {entry.name}"
+        for entry in traceback.extract_stack(frame, limit=STACK_LIMIT)
+    ]
+
+class LoopMonitor:
+    """Watch the event loop from a helper thread.
+
+    A heartbeat task stamps the time on every loop iteration it gets; when
+    the stamp goes stale for longer than block_ms the loop is blocked by a
+    synchronous callback, and the loop thread's stack is captured to show
+    which one. With profiling on, the loop thread's stack is also sampled
+    every profile interval into a bounded ring buffer.
+    """
+
+    def __init__(self, block_ms=TRACE_LOOP_BLOCK_MS, profile=TRACE_PROFILE,
+                 profile_interval_ms=TRACE_PROFILE_INTERVAL_MS, max_blocks=200, max_samples=60000):
+        self.block_seconds = block_ms / 1000
+        self.profile = profile
+        self.interval = self.block_seconds / 4
+        if profile:
+            self.interval = min(self.interval, profile_interval_ms / 1000)
+        self.blocks = deque(maxlen=max_blocks)
+        self.samples = deque(maxlen=max_samples)
+        self.heartbeat = time.monotonic()
+        self.loop_thread_id = None
+        self.heartbeat_task = None
+        self.thread = None
+        self.stopping = threading.Event()
+
+    def start(self):
+        self.loop_thread_id = threading.get_ident()
+        self.heartbeat = time.monotonic()
+        self.heartbeat_task = asyncio.create_task(self._beat())
+        self.thread = threading.Thread(target=self._watch, name='loop-monitor', daemon=True)
+        self.thread.start()
+
+    async def stop(self):
+        self.stopping.set()
+        if self.heartbeat_task is not None:
+            self.heartbeat_task.cancel()
+            await asyncio.gather(self.heartbeat_task, return_exceptions=True)
+        if self.thread is not None:
+            await asyncio.to_thread(self.thread.join, 1)
+
+    async def _beat(self):
+        while True:
+            self.heartbeat = time.monotonic()
+            await asyncio.sleep(self.interval)
+
+    def _loop_frame(self):
+        return sys._current_frames().get(self.loop_thread_id)
+
+    def _watch(self):
+        block = None
+        while not self.stopping.wait(self.interval):
+            now = time.monotonic()
+            beat = self.heartbeat
+            if block is not None and beat != block['started_at']:
+                # The loop is running again: close the block
+                block['duration_ms'] = round((beat - block['started_at']) * 1000, 2)
+                where = block['stack'][-1] if block['stack'] else 'unknown'
+                logger.warning(f"Event loop blocked for {block['duration_ms']:.0f} ms at {where}")
+                block = None
+            # The heartbeat sleeps for one interval, so allow for it before calling the loop blocked
+            if block is None and now - beat > self.block_seconds + self.interval:
+                frame = self._loop_frame()
+                block = {
+                    'started_at': beat,
+                    'stack': format_stack(frame) if frame is not None else [],
+                }
+                self.blocks.append(block)
+            if self.profile:
+                frame = self._loop_frame()
+                if frame is not None and not self._idle(frame):
+                    self.samples.append((now, ';'.join(format_stack(frame))))
+
+    @staticmethod
+    def _idle(frame):
+        """The loop waiting in its selector is idle, not work worth profiling."""
+        return frame.f_code.co_name == 'select' and 'selectors' in frame.f_code.co_filename
+
+    def blocks_between(self, start, end):
+        return [
+            {
+                'start_ms': round((block['started_at'] - start) * 1000, 2),
+                'duration_ms': block.get('duration_ms', round((end - block['started_at']) * 1000, 2)),
+                'stack': block['stack'],
+            }
+            for block in list(self.blocks) if start <= block['started_at'] <= end
+        ]
+
+    def profile_between(self, start, end):
+        """Folded stacks (flamegraph input) sampled between start and end, with sample counts."""
+        return dict(Counter(stack for at, stack in list(self.samples) if start <= at <= end).most_common())
+
+    def stats(self):
+        return {
+            'loop_blocks': len(self.blocks),
+            'samples': len(self.samples),
+        }
+
+class Tracer:
+    """Build a span tree per update and append slow ones to a JSONL file.
+
+    Blocking and profile data are process-wide, so for overlapping updates
+    a slow trace shows everything that ran on the loop while it was in
+    flight, not only its own work.
+    """
+
+    def __init__(self, enabled=TRACE_UPDATES, slow_threshold=TRACE_SLOW_THRESHOLD, path=TRACE_PATH):
+        self.enabled = enabled
+        self.slow_threshold = slow_threshold
+        self.path = path
+        self.monitor = LoopMonitor() if enabled else None
+        self.write_lock = threading.Lock()
+
+        # Counters exposed through stats()
+        self.traced = 0
+        self.slow = 0
+
+    def start(self):
+        if self.monitor is not None:
+            self.monitor.start()
+            logger.info(f"Tracing updates, slow traces go to {self.path}")
+
+    async def stop(self):
+        if self.monitor is not None:
+            await self.monitor.stop()
+
+    @asynccontextmanager
+    async def trace_update(self, bot, command, update):
+        """Trace handling of one update; dumped to TRACE_PATH if slower than the threshold."""
+        if not self.enabled:
+            yield None
+            return
+        root = Span('update', bot=bot, command=command, update_id=update.update_id)
+        token = current_span.set(root)
+        try:
+            yield root
+        except BaseException as e:
+            root.finish(e)
+            raise
+        else:
+            root.finish()
+        finally:
+            current_span.reset(token)
+            self.traced += 1
+            if root.duration >= self.slow_threshold:
+                self.slow += 1
+                await self._dump(root)
+
+    async def _dump(self, root):
+        record = {
+            'time': time.time(),
+            'trace': root.to_dict(root.start),
+            'loop_blocks': self.monitor.blocks_between(root.start, root.end),
+        }
+        if self.monitor.profile:
+            record['profile'] = self.monitor.profile_between(root.start, root.end)
+        logger.warning(
+            f"Slow update {root.attrs['update_id']} for {root.attrs['bot']} "
+            f"/{root.attrs['command']} took {root.duration:.2f}s"
+        )
+        try:
+            await asyncio.to_thread(self._append, json.dumps(record))
+        except Exception as e:
+            logger.error(f"Error writing slow trace: {str(e)}")
+
+    def _append(self, line):
+        with self.write_lock, open(self.path, 'a') as f:
+            f.write(line + '\n')
+
+    def stats(self):
+        report = {
+            'enabled': self.enabled,
+            'traced': self.traced,
+            'slow': self.slow,
+        }
+        if self.monitor is not None:
+            report.update(self.monitor.stats())
+        return report
+
+tracer = Tracer()
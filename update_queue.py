@@ -0,0 +1,292 @@
+import os
+import json
+import time
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from telegram import Update
+from telegram.ext import Application
+from metrics import (
+    QUEUE_DEPTH, UPDATE_DISPATCH_SECONDS, UPDATE_PROCESSING_SECONDS, UPDATES_DROPPED,
+    UPDATES_DUPLICATE, command_of, known_commands, request_labels,
+)
+from tracing import tracer
+from recent_keys import RecentKeys
+from dispatcher import WORKER_INDEX
+
+logger = logging.getLogger(__name__)
+
+# Queue sizing, overridable per deployment
+UPDATE_QUEUE_SIZE = int(os.getenv('UPDATE_QUEUE_SIZE', 100))
+UPDATE_QUEUE_WORKERS = int(os.getenv('UPDATE_QUEUE_WORKERS', 4))
+# Hand queued updates to workers round-robin between users rather than in arrival order
+UPDATE_QUEUE_FAIR = os.getenv('UPDATE_QUEUE_FAIR', 'true').lower() == 'true'
+
+# Recent update_ids remembered per bot so Telegram's redeliveries are not handled twice;
+# set UPDATE_DEDUP_DIR to keep them across restarts
+UPDATE_DEDUP_WINDOW = int(os.getenv('UPDATE_DEDUP_WINDOW', 10000))
+UPDATE_DEDUP_DIR = os.getenv('UPDATE_DEDUP_DIR')
+UPDATE_DEDUP_SAVE_INTERVAL = float(os.getenv('UPDATE_DEDUP_SAVE_INTERVAL', 5))
+
+class RecentIds:
+    """The last `window` update ids seen, optionally saved to and loaded from a file."""
+
+    def __init__(self, window: int = UPDATE_DEDUP_WINDOW, path: str = None):
+        self.ids = RecentKeys(window)
+        self.path = path
+        self.dirty = False
+        if path and os.path.exists(path):
+            try:
+                with open(path) as f:
+                    for update_id in json.load(f):
+                        self.add(update_id)
+                self.dirty = False
+            except Exception as e:
+                logger.error(f"Error loading seen update ids from {path}: {str(e)}")
+
+    def __contains__(self, update_id):
+        return update_id in self.ids
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, update_id):
+        self.ids.add(update_id)
+        self.dirty = True
+
+    def snapshot(self):
+        """Copy of the window if it changed since the last snapshot, else None."""
+        if not self.path or not self.dirty:
+            return None
+        self.dirty = False
+        return list(self.ids)
+
+    def write(self, snapshot):
+        """Write a snapshot to disk atomically; safe to run in a thread."""
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_path, self.path)
+
+class UpdateQueue:
+    """Bounded queue of updates for one bot, drained by a fixed pool of workers.
+
+    Updates from the same chat are handled one at a time in arrival order;
+    different chats are handled concurrently. With fair set, each user's
+    updates wait in their own lane and workers take from the lanes
+    round-robin, so a user who floods the bot queues behind their own
+    updates rather than everyone else's. Updates parked behind a busy chat
+    still count against maxsize, so one chat cannot fill memory. An
+    update_id seen within the dedup window is acknowledged without being
+    handled again.
+    """
+
+    def __init__(self, application: Application, name: str,
+                 maxsize: int = UPDATE_QUEUE_SIZE, workers: int = UPDATE_QUEUE_WORKERS,
+                 dedup_window: int = UPDATE_DEDUP_WINDOW, dedup_dir: str = UPDATE_DEDUP_DIR,
+                 fair: bool = UPDATE_QUEUE_FAIR):
+        self.application = application
+        self.name = name
+        # One entry per waiting update; the updates themselves wait in their user's lane
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.fair = fair
+        # Users with updates waiting, in round-robin order -> their updates in arrival order
+        self.lanes = OrderedDict()
+        self.worker_count = workers
+        self.workers = []
+        dedup_path = None
+        if dedup_dir:
+            # Each worker sees only its own chats' updates, so each saves its own ids
+            suffix = f".{WORKER_INDEX}" if WORKER_INDEX is not None else ''
+            dedup_path = os.path.join(dedup_dir, f"{name}{suffix}.json")
+        self.seen = RecentIds(dedup_window, dedup_path)
+        self.saver = None
+        # Chats with an update being processed -> their updates still waiting
+        self.active_chats = {}
+        self.parked = 0
+        # Set whenever an update leaves the queue or its chat's parking, for put_wait
+        self.room = asyncio.Event()
+
+        # Counters exposed through stats()
+        self.enqueued = 0
+        self.processed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.duplicates = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def depth(self):
+        """Updates waiting to be handled: queued plus parked behind a busy chat."""
+        return self.queue.qsize() + self.parked
+
+    def full(self):
+        return self.queue.maxsize > 0 and self.depth() >= self.queue.maxsize
+
+    def put(self, update: Update) -> bool:
+        """Enqueue an update, returning False when the queue is full.
+
+        Redelivered updates are accepted and dropped, so Telegram stops retrying them.
+        """
+        if update.update_id in self.seen:
+            self.duplicates += 1
+            UPDATES_DUPLICATE.labels(self.name).inc()
+            logger.info(f"Ignoring redelivered update {update.update_id} for {self.name}")
+            return True
+        if self.full():
+            self.dropped += 1
+            UPDATES_DROPPED.labels(self.name).inc()
+            logger.warning(f"Update queue for {self.name} is full, dropping update {update.update_id}")
+            return False
+        self._enqueue(update)
+        # Only remembered once queued, so an update refused while full is handled when it comes back
+        self.seen.add(update.update_id)
+        self.enqueued += 1
+        QUEUE_DEPTH.labels(self.name).set(self.depth())
+        return True
+
+    async def put_wait(self, update: Update):
+        """Enqueue an update, waiting for room instead of dropping it; used where nothing would redeliver it."""
+        if update.update_id in self.seen:
+            self.duplicates += 1
+            UPDATES_DUPLICATE.labels(self.name).inc()
+            return
+        while self.full():
+            self.room.clear()
+            await self.room.wait()
+        self._enqueue(update)
+        self.seen.add(update.update_id)
+        self.enqueued += 1
+        QUEUE_DEPTH.labels(self.name).set(self.depth())
+
+    def _enqueue(self, update: Update):
+        if not self.fair:
+            key = None
+        elif update.effective_user is not None:
+            key = update.effective_user.id
+        else:
+            # Updates without a user, such as channel posts, get a lane per chat
+            key = update.effective_chat.id if update.effective_chat is not None else None
+        self.lanes.setdefault(key, deque()).append((time.monotonic(), update))
+        self.queue.put_nowait(None)
+
+    def _take(self):
+        """The next update from the front lane, which then goes to the back of the round."""
+        key, lane = next(iter(self.lanes.items()))
+        item = lane.popleft()
+        if lane:
+            self.lanes.move_to_end(key)
+        else:
+            del self.lanes[key]
+        return item
+
+    def start(self):
+        """Start the worker pool on the running event loop."""
+        for i in range(self.worker_count):
+            self.workers.append(asyncio.create_task(self._worker(), name=f"{self.name}-worker-{i}"))
+        if self.seen.path:
+            self.saver = asyncio.create_task(self._save_seen(), name=f"{self.name}-dedup-saver")
+
+    async def stop(self, timeout: float = 10):
+        """Give queued updates a chance to finish, then stop the workers."""
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Update queue for {self.name} still had {self.depth()} updates at shutdown")
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+        if self.saver is not None:
+            self.saver.cancel()
+            await asyncio.gather(self.saver, return_exceptions=True)
+            self.saver = None
+        snapshot = self.seen.snapshot()
+        if snapshot is not None:
+            self.seen.write(snapshot)
+
+    async def _save_seen(self):
+        while True:
+            await asyncio.sleep(UPDATE_DEDUP_SAVE_INTERVAL)
+            # Copy on the loop, where ids are added, and write in a thread
+            snapshot = self.seen.snapshot()
+            if snapshot is None:
+                continue
+            try:
+                await asyncio.to_thread(self.seen.write, snapshot)
+            except Exception as e:
+                logger.error(f"Error saving seen update ids for {self.name}: {str(e)}")
+
+    async def _worker(self):
+        commands = known_commands(self.application)
+        while True:
+            # Each entry taken from the queue stands for one update waiting in the lanes
+            await self.queue.get()
+            item = self._take()
+            chat = item[1].effective_chat
+
+            # Another worker is on this chat: leave the update for it so the chat stays in order
+            if chat is not None and chat.id in self.active_chats:
+                self.active_chats[chat.id].append(item)
+                self.parked += 1
+                continue
+            self._left_queue()
+            if chat is None:
+                await self._process(item, commands)
+                continue
+            pending = self.active_chats[chat.id] = deque()
+            try:
+                await self._process(item, commands)
+                while pending:
+                    item = pending.popleft()
+                    self.parked -= 1
+                    self._left_queue()
+                    await self._process(item, commands)
+            finally:
+                del self.active_chats[chat.id]
+
+    def _left_queue(self):
+        QUEUE_DEPTH.labels(self.name).set(self.depth())
+        self.room.set()
+
+    async def _process(self, item, commands):
+        enqueued_at, update = item
+        wait = time.monotonic() - enqueued_at
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        UPDATE_DISPATCH_SECONDS.labels(self.name).observe(wait)
+
+        # Stages timed while handling this update are labelled with its bot and command
+        command = command_of(update, commands)
+        labels = request_labels.set((self.name, command))
+        started = time.monotonic()
+        try:
+            async with tracer.trace_update(self.name, command, update):
+                await self.application.process_update(update)
+            self.processed += 1
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"Error processing update {update.update_id} for {self.name}: {str(e)}")
+        finally:
+            UPDATE_PROCESSING_SECONDS.labels(self.name, command).observe(time.monotonic() - started)
+            request_labels.reset(labels)
+            self.queue.task_done()
+
+    def stats(self):
+        """Return a snapshot of queue depth, wait times and drop counts."""
+        dequeued = self.processed + self.failed
+        return {
+            'depth': self.depth(),
+            'waiting_on_chat': self.parked,
+            'waiting_users': len(self.lanes),
+            'maxsize': self.queue.maxsize,
+            'workers': self.worker_count,
+            'enqueued': self.enqueued,
+            'processed': self.processed,
+            'failed': self.failed,
+            'dropped': self.dropped,
+            'duplicates': self.duplicates,
+            'avg_wait_seconds': self.total_wait / dequeued if dequeued else 0.0,
+            'max_wait_seconds': self.max_wait,
+        }
@@ -0,0 +1,67 @@
+from html.parser import HTMLParser
+
+# Number of non-empty lead paragraphs kept as article content
+LEAD_PARAGRAPHS = 3
+
+class LeadParagraphParser(HTMLParser):
+    """Incremental parser that collects an article's title and its first lead paragraphs.
+
+    Matches what the BeautifulSoup scrape kept (every <p> under the first
+    mw-parser-output div, in document order) but can be fed the page in
+    chunks and reports done as soon as enough non-empty paragraphs are seen,
+    so the rest of the page never has to be downloaded or parsed.
+    """
+
+    def __init__(self, paragraphs: int = LEAD_PARAGRAPHS):
+        super().__init__(convert_charrefs=True)
+        self.wanted = paragraphs
+        self.title_parts = None
+        self.title = None
+        self.content_depth = 0
+        self.content_seen = False
+        self.current = None
+        self.paragraphs = []
+        self.done = False
+
+    def handle_starttag(self, tag, attrs):
+        if self.done:
+            return
+        attrs = dict(attrs)
+        if tag == 'h1' and attrs.get('id') == 'firstHeading':
+            self.title_parts = []
+        elif tag == 'div':
+            if self.content_depth:
+                self.content_depth += 1
+            elif not self.content_seen and 'mw-parser-output' in (attrs.get('class') or '').split():
+                self.content_depth = 1
+                self.content_seen = True
+        elif tag == 'p' and self.content_depth:
+            self.current = []
+
+    def handle_endtag(self, tag):
+        if self.done:
+            return
+        if tag == 'h1' and self.title_parts is not None:
+            self.title = ''.join(self.title_parts)
+            self.title_parts = None
+        elif tag == 'div' and self.content_depth:
+            self.content_depth -= 1
+        elif tag == 'p' and self.current is not None:
+            text = ''.join(self.current)
+            self.current = None
+            if text.strip():
+                self.paragraphs.append(text)
+                self.done = len(self.paragraphs) >= self.wanted
+
+    def handle_data(self, data):
+        if self.title_parts is not None:
+            self.title_parts.append(data)
+        if self.current is not None:
+            self.current.append(data)
+
+    def content(self):
+        return ' '.join(self.paragraphs[:self.wanted])
+
+def lead_from_extract(extract: str, paragraphs: int = LEAD_PARAGRAPHS):
+    """Join the first non-empty paragraphs of a plain-text intro extract."""
+    return ' '.join([p for p in extract.split('\n') if p.strip()][:paragraphs])
@@ -1,24 +1,28 @@
 import os
+import time
+import asyncio
 import logging
-import requests
-from bs4 import BeautifulSoup
+import httpx
 from telegram import Update
 from telegram.ext import Application, CommandHandler, ContextTypes, MessageHandler, filters
 from dotenv import load_dotenv
-import openai
 import urllib.parse
-from flask import Flask
-from threading import Thread
-
-# Initialize Flask app
-app = Flask(__name__)
-
-@app.route('/')
-def home():
-    return "Bots are running!"
-
-def run_flask():
-    app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 8080)))
+from llm_client import llm
+from streaming import StreamingReply
+from send_pipeline import sender
+from http_client import PooledClient
+from article_cache import ArticleCache, normalize_keyword
+from response_cache import ResponseCache
+from content_pool import ContentPool
+from batching import LLM_BATCH_SIZE, BatchGenerator, batch_instructions
+from fair_scheduler import fair
+from chat_state import chat_state
+from subscriptions import DailyDelivery, SUBSCRIPTION_DEFAULT_TIME, format_slot, parse_slot
+from token_budget import budget, SUMMARY_INPUT_BUDGET
+from health import health
+from singleflight import SingleFlight
+from metrics import observe_stage
+from wiki_extract import LeadParagraphParser, lead_from_extract
 
 # Load environment variables
 load_dotenv()
@@ -30,12 +34,38 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Initialize OpenAI client
-openai.api_key = os.getenv('OPENAI_API_KEY')
-
 # Get bot token from environment variable
 BOT_TOKEN = os.getenv('WIKI_FACTS_TELE_TOKEN')
 
+# Wikipedia endpoint, overridable to point at a local stub
+WIKIPEDIA_BASE_URL = os.getenv('WIKIPEDIA_BASE_URL', 'https://en.wikipedia.org')
+
+# Shared connection pool for every Wikipedia call
+wikipedia_client = PooledClient(
+    'wikipedia',
+    timeout=float(os.getenv('WIKIPEDIA_TIMEOUT', 10)),
+    max_connections=int(os.getenv('WIKIPEDIA_MAX_CONNECTIONS', 20)),
+    max_concurrency=int(os.getenv('WIKIPEDIA_MAX_CONCURRENCY', 10)),
+)
+
+# Search results and parsed articles, keyed by normalized keyword and canonical title
+article_cache = ArticleCache('wikipedia')
+
+# Concurrent searches for the same keyword or article share one fetch
+wikipedia_flight = SingleFlight(
+    'wikipedia',
+    timeout=float(os.getenv('WIKIPEDIA_FLIGHT_TIMEOUT', 30))
+)
+
+MODEL = "gpt-3.5-turbo"
+SUMMARY_SYSTEM_PROMPT = "You are a knowledgeable friend who makes complex information accessible and relevant to daily life."
+
+# Bump when the summary prompt changes so cached summaries are not reused
+SUMMARY_PROMPT_VERSION = 1
+
+# Summaries of articles that come up again through /fact or /search
+summary_cache = ResponseCache('summaries')
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Send a message when the command /start is issued."""
     welcome_message = (
@@ -44,10 +74,11 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "summaries and fun facts to keep you engaged\n\n"
         "Available commands:\n"
         "📚 /fact - Get a random Wikipedia article\n"
-        "🔍 /search [keyword] - Search for a specific topic\n"
+        "🔍 /search [keyword] - Search for a specific topic, or for more like the last article\n"
+        "⏰ /subscribe [HH:MM] - Get a fact every day at a time of your choice (UTC)\n"
         "❓ /help - Show all available commands"
     )
-    await update.message.reply_text(welcome_message)
+    await sender.reply(update.message, welcome_message)
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Send a message when the command /help is issued."""
@@ -56,44 +87,61 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "/start - Start the bot\n"
         "/fact - Get a new random Wikipedia article with summary and fun facts\n"
         "/help - Show this help message\n"
-        "/search [keyword] - Search for a Wikipedia article"
+        "/search [keyword] - Search for a Wikipedia article, or for one like the last article\n"
+        f"/subscribe [HH:MM] - Get a fact every day at this time in UTC (default {SUBSCRIPTION_DEFAULT_TIME})\n"
+        "/unsubscribe - Stop the daily fact"
     )
-    await update.message.reply_text(help_text)
+    await sender.reply(update.message, help_text)
+
+async def fetch_lead_from_html(url):
+    """Stream an article page and stop reading once the lead paragraphs are parsed."""
+    parser = LeadParagraphParser()
+    parse_time = 0.0
+    started = time.perf_counter()
+    async with wikipedia_client.stream('GET', url) as response:
+        async for chunk in response.aiter_text():
+            parse_started = time.perf_counter()
+            parser.feed(chunk)
+            parse_time += time.perf_counter() - parse_started
+            if parser.done:
+                break
+        final_url = str(response.url)
+    observe_stage('html_parse', parse_time)
+    observe_stage('wikipedia_fetch', time.perf_counter() - started - parse_time)
+    return parser.title, final_url, parser.content()
 
-def get_random_wiki_article():
+async def get_random_wiki_article():
     """Fetch a random Wikipedia article from the Good articles category."""
-    url = "https://en.wikipedia.org/wiki/Special:RandomInCategory/Good_articles"
-    response = requests.get(url)
-    soup = BeautifulSoup(response.text, 'html.parser')
-    
-    # Get the title
-    title = soup.find('h1', {'id': 'firstHeading'}).text
-    
-    # Get the main content
-    content_div = soup.find('div', {'class': 'mw-parser-output'})
-    paragraphs = content_div.find_all('p')
-    
-    # Combine the first few paragraphs for context
-    content = ' '.join([p.text for p in paragraphs if p.text.strip()][:3])
-    
-    return {
+    url = f"{WIKIPEDIA_BASE_URL}/wiki/Special:RandomInCategory/Good_articles"
+
+    # Only the redirect target is needed; the lead section comes from the extracts API
+    response = await wikipedia_client.get(url, follow_redirects=False)
+    location = response.headers.get('Location')
+    if response.is_redirect and location:
+        path = urllib.parse.urlsplit(location).path
+        if path.startswith('/wiki/'):
+            title = urllib.parse.unquote(path[len('/wiki/'):]).replace('_', ' ')
+            article, error = await get_wiki_article_by_title(title)
+            if article is not None:
+                return article
+            logger.warning(f"Falling back to the article page for {title}: {error}")
+
+    title, final_url, content = await fetch_lead_from_html(url)
+    article = {
         'title': title,
-        'url': response.url,
+        'url': final_url,
         'content': content
     }
 
-def generate_summary_and_insights(article):
-    """Generate a summary and insights using OpenAI API."""
-    prompt = f"""Article Title: {article['title']}
-Content: {article['content']}
+    # A later /search for the same article can skip the fetch
+    await article_cache.set(f"article:{title}", article)
+    return article
 
-Please provide:
-1. A concise summary (under 100 words) highlighting the most interesting facts
+SUMMARY_INSTRUCTIONS = """1. A concise summary (under 100 words) highlighting the most interesting facts
 2. Three practical interesting things about this fact (under 30 words each)
-3. End off with a question that is related to the fact and a short answer to it (under 30 words)
+3. End off with a question that is related to the fact and a short answer to it (under 30 words)"""
 
-Format the response as:
-SUMMARY:
+SUMMARY_FORMAT = """SUMMARY:
 [summary here]
 
 Fun facts:
@@ -107,176 +155,443 @@ Question: [question related to the fact]
 Answer: [short answer to the question]
 """
 
-    response = openai.chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=[
-            {"role": "system", "content": "You are a knowledgeable friend who makes complex information accessible and relevant to daily life."},
-            {"role": "user", "content": prompt}
-        ],
-        max_tokens=500,
-        temperature=0.7
+def build_summary_messages(article):
+    """Build the chat messages asking for a summary and insights of an article."""
+    prompt = f"""Article Title: {article['title']}
+Content: {budget.fit(article['content'], SUMMARY_INPUT_BUDGET)}
+
+Please provide:
+{SUMMARY_INSTRUCTIONS}
+
+Format the response as:
+{SUMMARY_FORMAT}"""
+
+    return [
+        {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+
+def build_summaries_messages(articles):
+    """Build the chat messages asking for a summary and insights of each of several articles."""
+    sources = "\n\n".join(
+        f"Article {i} Title: {article['title']}\nContent: {budget.fit(article['content'], SUMMARY_INPUT_BUDGET)}"
+        for i, article in enumerate(articles, 1)
     )
-    
-    return response.choices[0].message.content
+    prompt = f"""{sources}
+
+For each article, separately, please provide:
+{SUMMARY_INSTRUCTIONS}
+
+{batch_instructions(len(articles))} Item n covers article n. Format each item as:
+{SUMMARY_FORMAT}"""
+
+    return [
+        {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+
+def summary_cache_key(article):
+    return ResponseCache.make_key(
+        MODEL, SUMMARY_SYSTEM_PROMPT, SUMMARY_PROMPT_VERSION,
+        f"{article['title']}\n{article['content']}"
+    )
+
+async def generate_summary_and_insights(article):
+    """Generate a summary and insights using OpenAI API."""
+    return await summary_cache.get_or_generate(
+        summary_cache_key(article),
+        lambda: llm.chat(
+            'wiki_facts',
+            model=MODEL,
+            messages=build_summary_messages(article),
+            max_tokens=500,
+            temperature=0.7
+        )
+    )
+
+def valid_summary(summary):
+    """True when a summary has the SUMMARY, Question and Answer parts of SUMMARY_FORMAT."""
+    return all(part in summary for part in ('SUMMARY:', 'Question:', 'Answer:'))
+
+# One completion for several pool summaries when LLM_BATCH_SIZE is above 1
+summary_batches = BatchGenerator('summaries')
+
+async def generate_summaries(articles):
+    """Summarize several articles with one completion and cache each summary.
+
+    Articles already in the summary cache are not sent again. Returns the
+    summaries in article order, with None for any that could not be made.
+    """
+    keys = [summary_cache_key(article) for article in articles]
+    summaries = [summary_cache.lookup(key) for key in keys]
+    missing = [i for i, summary in enumerate(summaries) if summary is None]
+    if not missing:
+        return summaries
+
+    generated = await summary_batches.generate(
+        len(missing),
+        lambda count: llm.chat(
+            'wiki_facts',
+            model=MODEL,
+            messages=build_summaries_messages([articles[i] for i in missing]),
+            max_tokens=450 * count,
+            temperature=0.7
+        ),
+        valid_summary,
+        lambda index: llm.chat(
+            'wiki_facts',
+            model=MODEL,
+            messages=build_summary_messages(articles[missing[index]]),
+            max_tokens=500,
+            temperature=0.7
+        )
+    )
+    for i, summary in zip(missing, generated):
+        if summary is not None:
+            await summary_cache.add(keys[i], summary)
+            summaries[i] = summary
+    return summaries
+
+def stream_summary_and_insights(article):
+    """Stream a summary and insights as it is generated."""
+    return summary_cache.stream(
+        summary_cache_key(article),
+        lambda: llm.stream_chat(
+            'wiki_facts',
+            model=MODEL,
+            messages=build_summary_messages(article),
+            max_tokens=500,
+            temperature=0.7
+        )
+    )
+
+def fact_message_parts(article):
+    """Header and footer placed around the summary in a /fact reply."""
+    header = f"📚 *{article['title']}*\n\n"
+    footer = (
+        f"\n\n🔗 [Read full article]({article['url']})\n\n"
+        "Use /fact to get another random article!"
+    )
+    return header, footer
+
+async def produce_fact():
+    """Build a complete /fact message for the pool, keyed by title to avoid repeats."""
+    article = await get_random_wiki_article()
+    summary_and_insights = await generate_summary_and_insights(article)
+    header, footer = fact_message_parts(article)
+    return article['title'], header + summary_and_insights + footer
+
+async def produce_facts():
+    """Build up to LLM_BATCH_SIZE complete /fact messages for the pool from one completion."""
+    fetched = await asyncio.gather(*(get_random_wiki_article() for _ in range(LLM_BATCH_SIZE)),
+                                   return_exceptions=True)
+    articles = {}
+    for article in fetched:
+        if isinstance(article, Exception):
+            logger.error(f"Error fetching an article for the facts batch: {str(article)}")
+        else:
+            articles.setdefault(article['title'], article)
+    if not articles:
+        raise fetched[0]
+
+    articles = list(articles.values())
+    messages = []
+    for article, summary in zip(articles, await generate_summaries(articles)):
+        if summary is not None:
+            header, footer = fact_message_parts(article)
+            messages.append((article['title'], header + summary + footer))
+    return messages
+
+# Ready-made /fact replies so most requests skip the fetch and the LLM call
+fact_pool = ContentPool('facts', produce_facts if LLM_BATCH_SIZE > 1 else produce_fact)
 
 async def fact(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Send a random Wikipedia article with summary and insights."""
+    reply = StreamingReply(update.message, disable_web_page_preview=True)
     try:
+        # Serve a pre-generated fact when one is ready; pooled facts are keyed by title
+        pooled = fact_pool.pop_with_key()
+        if pooled is not None:
+            title, message = pooled
+            await reply.send(message)
+            chat_state.update(update.effective_chat.id, last_article=title)
+            return
+
         # Send "typing" action
         await update.message.chat.send_action(action="typing")
+        await reply.start("📚 Picking a random article...")
         
         # Get random article
-        article = get_random_wiki_article()
-        
-        # Generate summary and insights
-        summary_and_insights = generate_summary_and_insights(article)
-        
-        # Format the message
-        message = (
-            f"📚 *{article['title']}*\n\n"
-            f"{summary_and_insights}\n\n"
-            f"🔗 [Read full article]({article['url']})\n\n"
-            "Use /fact to get another random article!"
-        )
+        article = await get_random_wiki_article()
         
-        await update.message.reply_text(
-            message,
-            parse_mode='Markdown',
-            disable_web_page_preview=True
-        )
+        # Generate summary and insights, showing it as it is written
+        header, footer = fact_message_parts(article)
+        await reply.stream(stream_summary_and_insights(article), header, footer)
+        chat_state.update(update.effective_chat.id, last_article=article['title'])
         
     except Exception as e:
         logger.error(f"Error in fact command: {str(e)}")
-        await update.message.reply_text(
+        await reply.fail(
             "Sorry, I encountered an error while fetching the article. "
             "Please try again with /fact"
         )
 
-def search_wikipedia(keyword):
-    """Search Wikipedia for relevant articles."""
-    # Use Wikipedia's search API
-    search_url = "https://en.wikipedia.org/w/api.php"
+def article_from_page(page):
+    """Build an article from a page returned with prop=extracts|info."""
+    return {
+        'title': page['title'],
+        'url': page.get('fullurl') or f"{WIKIPEDIA_BASE_URL}/wiki/{urllib.parse.quote(page['title'])}",
+        'content': lead_from_extract(page.get('extract', ''))
+    }
+
+async def search_top_article(keyword):
+    """Search Wikipedia and fetch the top result's intro and URL in one request; None without results."""
     params = {
         "action": "query",
         "format": "json",
-        "list": "search",
-        "srsearch": keyword,
-        "srlimit": 1,  # Get the most relevant result
-        "srprop": "snippet|title"
+        "formatversion": 2,
+        "generator": "search",
+        "gsrsearch": keyword,
+        "gsrlimit": 1,
+        "prop": "extracts|info",
+        "exintro": 1,
+        "explaintext": 1,
+        "inprop": "url",
+        "redirects": 1
     }
+    response = await wikipedia_client.get(f"{WIKIPEDIA_BASE_URL}/w/api.php", params=params)
+    pages = response.json().get("query", {}).get("pages", [])
+    if not pages:
+        return None
+
+    article = article_from_page(pages[0])
+    if article['content']:
+        await article_cache.set(f"article:{article['title']}", article)
+    return article
+
+async def search_wikipedia(keyword):
+    """Search Wikipedia for relevant articles."""
+    try:
+        return await wikipedia_flight.do(
+            f"search:{normalize_keyword(keyword)}",
+            lambda: fetch_search_result(keyword)
+        )
+    except asyncio.TimeoutError:
+        return None, "Wikipedia is taking too long to respond. Please try again."
+
+async def fetch_search_result(keyword):
+    """Find the most relevant article for a keyword, from the cache or the search API."""
+    # Popular keywords skip the search round trip entirely
+    cache_key = f"search:{normalize_keyword(keyword)}"
+    cached = await article_cache.get(cache_key)
+    if cached is not None and cached.is_fresh(article_cache.ttl):
+        return await get_wiki_article_by_title(cached.value)
     
     try:
-        response = requests.get(search_url, params=params)
-        data = response.json()
-        
-        if "query" in data and "search" in data["query"] and data["query"]["search"]:
-            # Get the most relevant result
-            result = data["query"]["search"][0]
-            title = result["title"]
-            
-            # Now get the full article content
-            return get_wiki_article_by_title(title)
-        else:
+        # Resolve the query and fetch the most relevant article in one round trip
+        result = await search_top_article(keyword)
+        if result is None:
             return None, "No relevant articles found. Please try a different search term."
+        await article_cache.set(cache_key, result['title'])
+
+        # Pages without an extract need the fallback in get_wiki_article_by_title
+        if not result['content']:
+            return await get_wiki_article_by_title(result['title'])
+        return result, None
             
     except Exception as e:
         return None, f"An error occurred while searching: {str(e)}"
 
-def get_wiki_article_by_title(title):
+async def get_wiki_article_by_title(title):
     """Fetch a Wikipedia article by its exact title."""
-    encoded_title = urllib.parse.quote(title)
-    url = f"https://en.wikipedia.org/wiki/{encoded_title}"
+    try:
+        return await wikipedia_flight.do(f"article:{title}", lambda: fetch_wiki_article(title))
+    except asyncio.TimeoutError:
+        return None, "Wikipedia is taking too long to respond. Please try again."
+
+async def fetch_wiki_article(title):
+    """Fetch an article's lead section, from the cache or the extracts API."""
+    cache_key = f"article:{title}"
+    cached = await article_cache.get(cache_key)
+    if cached is not None and cached.is_fresh(article_cache.ttl):
+        return cached.value, None
+
+    # Ask for the plain-text lead section only, instead of the whole rendered page
+    params = {
+        "action": "query",
+        "format": "json",
+        "formatversion": 2,
+        "prop": "extracts|info",
+        "exintro": 1,
+        "explaintext": 1,
+        "inprop": "url",
+        "redirects": 1,
+        "titles": title
+    }
     
     try:
-        response = requests.get(url)
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # Get the main content
-        content_div = soup.find('div', {'class': 'mw-parser-output'})
-        paragraphs = content_div.find_all('p')
-        
-        # Combine the first few paragraphs for context
-        content = ' '.join([p.text for p in paragraphs if p.text.strip()][:3])
+        # Stale entries are revalidated so an unchanged article is not fetched again
+        headers = cached.validator_headers() if cached is not None else {}
+        response = await wikipedia_client.get(f"{WIKIPEDIA_BASE_URL}/w/api.php", params=params, headers=headers)
+        if cached is not None and response.status_code == 304:
+            await article_cache.revalidated(cache_key, cached)
+            return cached.value, None
+
+        pages = response.json().get("query", {}).get("pages", [])
+        if not pages or pages[0].get("missing"):
+            return None, "Failed to fetch the article. Please try again."
+        page = pages[0]
+        url = page.get("fullurl") or f"{WIKIPEDIA_BASE_URL}/wiki/{urllib.parse.quote(title)}"
+        content = lead_from_extract(page.get("extract", ""))
+
+        # Some pages have no extract; read just the lead of the rendered page instead
+        if not content:
+            _, url, content = await fetch_lead_from_html(url)
         
-        return {
-            'title': title,
-            'url': response.url,
+        # Redirects and normalization can land on a differently titled page
+        article = {
+            'title': page['title'],
+            'url': url,
             'content': content
-        }, None
-    except requests.exceptions.RequestException:
+        }
+        await article_cache.set(
+            cache_key, article,
+            etag=response.headers.get('ETag'),
+            last_modified=response.headers.get('Last-Modified')
+        )
+        return article, None
+    except httpx.HTTPError:
         return None, "Failed to fetch the article. Please try again."
     except Exception as e:
         return None, f"An error occurred: {str(e)}"
 
 async def search(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle the /search command with a keyword."""
-    if not context.args:
-        await update.message.reply_text(
-            "Please provide a keyword to search for.\n"
-            "Example: /search artificial intelligence"
-        )
-        return
+    if context.args:
+        keyword = ' '.join(context.args)
+        label = keyword
+    else:
+        # Without a keyword, find an article like the last one sent to this chat
+        record = chat_state.get(update.effective_chat.id)
+        if record is None or record.last_article is None:
+            await sender.reply(
+                update.message,
+                "Please provide a keyword to search for.\n"
+                "Example: /search artificial intelligence\n"
+                "Or send /search on its own after a fact for more like it."
+            )
+            return
+        keyword = f"morelike:{record.last_article}"
+        label = f"more like {record.last_article}"
 
-    keyword = ' '.join(context.args)
+    reply = StreamingReply(update.message, disable_web_page_preview=True)
     await update.message.chat.send_action(action="typing")
+    await reply.start(f"🔍 Searching for: {label}...")
     
     # First search for relevant articles
-    article, error = search_wikipedia(keyword)
+    article, error = await search_wikipedia(keyword)
     
     if error:
-        await update.message.reply_text(error)
+        await reply.fail(error)
         return
     
     try:
-        # Generate summary and insights
-        summary_and_insights = generate_summary_and_insights(article)
-        
-        # Format the message
-        message = (
-            f"🔍 *Search Result for: {keyword}*\n\n"
-            f"📚 *{article['title']}*\n\n"
-            f"{summary_and_insights}\n\n"
-            f"🔗 [Read full article]({article['url']})\n\n"
-            "Use /search [keyword] to search for another topic!"
-        )
-        
-        await update.message.reply_text(
-            message,
-            parse_mode='Markdown',
-            disable_web_page_preview=True
+        # Generate summary and insights, showing it as it is written
+        await reply.stream(
+            stream_summary_and_insights(article),
+            header=(
+                f"🔍 *Search Result for: {label}*\n\n"
+                f"📚 *{article['title']}*\n\n"
+            ),
+            footer=(
+                f"\n\n🔗 [Read full article]({article['url']})\n\n"
+                "Use /search [keyword] to search for another topic!"
+            )
         )
+        chat_state.update(update.effective_chat.id, last_article=article['title'])
         
     except Exception as e:
         logger.error(f"Error in search command: {str(e)}")
-        await update.message.reply_text(
+        await reply.fail(
             "Sorry, I encountered an error while processing your search. "
             "Please try again with a different keyword."
         )
 
+async def produce_daily_fact(slot):
+    """Build the daily fact shared by every chat subscribed to a slot."""
+    article = await get_random_wiki_article()
+    summary_and_insights = await generate_summary_and_insights(article)
+    header, _ = fact_message_parts(article)
+    footer = (
+        f"\n\n🔗 [Read full article]({article['url']})\n\n"
+        f"Your daily fact for {format_slot(slot)} UTC. Use /unsubscribe to stop them."
+    )
+    return f"⏰ Daily fact\n\n{header}{summary_and_insights}{footer}"
+
+# Subscribers to the daily fact, indexed by the minute of the day they get it
+daily_facts = DailyDelivery('daily_facts', produce_daily_fact)
+
+async def subscribe(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Subscribe the chat to a daily fact at the given time, or the default one."""
+    text = ' '.join(context.args) if context.args else SUBSCRIPTION_DEFAULT_TIME
+    slot = parse_slot(text)
+    if slot is None:
+        await sender.reply(
+            update.message,
+            "Please give the time as HH:MM in UTC.\n"
+            "Example: /subscribe 08:30"
+        )
+        return
+    daily_facts.store.subscribe(update.effective_chat.id, slot)
+    await sender.reply(
+        update.message,
+        f"⏰ Subscribed! You'll get a fact every day at {format_slot(slot)} UTC.\n"
+        "Send /subscribe HH:MM to change the time or /unsubscribe to stop."
+    )
+
+async def unsubscribe(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Stop the chat's daily fact."""
+    if daily_facts.store.unsubscribe(update.effective_chat.id):
+        await sender.reply(update.message, "Unsubscribed. No more daily facts; /subscribe brings them back.")
+    else:
+        await sender.reply(update.message, "You're not subscribed. Use /subscribe [HH:MM] to get a daily fact.")
+
 def setup_handlers(application):
     """Set up the handlers for this bot"""
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("help", help_command))
-    application.add_handler(CommandHandler("fact", fact))
-    application.add_handler(CommandHandler("search", search))
-
-def main():
-    """Start all bots."""
-    # Start Flask in a separate thread
-    flask_thread = Thread(target=run_flask)
-    flask_thread.start()
-
-    # Start each bot in a separate thread
-    bot_threads = []
-    for bot_name, token in bot_tokens.items():
-        thread = Thread(target=run_bot, args=(token, bot_name))
-        thread.start()
-        bot_threads.append(thread)
-        logger.info(f"Started thread for bot: {bot_name}")
-
-    # Wait for all bot threads
-    for thread in bot_threads:
-        thread.join()
-
-if __name__ == '__main__':
-    main() 
\ No newline at end of file
+    application.add_handler(CommandHandler("fact", fair(fact)))
+    application.add_handler(CommandHandler("search", fair(search)))
+    application.add_handler(CommandHandler("subscribe", subscribe))
+    application.add_handler(CommandHandler("unsubscribe", unsubscribe))
+    daily_facts.bot = application.bot
+
+async def warm_wikipedia():
+    """Keep a few pooled connections to Wikipedia open."""
+    await wikipedia_client.warm_up(f"{WIKIPEDIA_BASE_URL}/w/api.php", connections=4)
+
+async def on_startup():
+    """Open the shared Wikipedia connection pool, start pre-generating facts and daily deliveries, and register warm-ups."""
+    await wikipedia_client.start()
+    fact_pool.start()
+    await daily_facts.start()
+    health.add('wikipedia', warm_wikipedia, wikipedia_client.pool_stats)
+    health.add('fact_pool', fact_pool.warm, lambda: {'size': len(fact_pool.items)})
+
+async def on_shutdown():
+    """Stop daily deliveries and the fact pool and close the Wikipedia connection pool and the article cache."""
+    await daily_facts.stop()
+    await fact_pool.stop()
+    await wikipedia_client.close()
+    article_cache.close()
+
+def stats():
+    """Cache, coalescing, pool and subscription counts for /stats."""
+    return {
+        'article_cache': article_cache.stats(),
+        'wikipedia_flight': wikipedia_flight.stats(),
+        'summary_cache': summary_cache.stats(),
+        'fact_pool': fact_pool.stats(),
+        'summary_batches': summary_batches.stats(),
+        'daily_facts': daily_facts.stats(),
+    }